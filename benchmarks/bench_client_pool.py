@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark : latence par appel de tool, client httpx jetable vs client partagé
+
+Compare l'ancien schéma (un httpx.Client neuf par appel, donc DNS + TCP (+ TLS)
+à chaque fois) avec le client keep-alive partagé de server.py, contre la fausse
+API locale. En local il n'y a pas de TLS : le gain réel vers api.ultravox.ai est
+plus important que celui mesuré ici.
+
+    pip install httpx fastmcp
+    python benchmarks/bench_client_pool.py --requests 500
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_api import start_fake_api  # noqa: E402
+
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} moyenne {statistics.mean(samples) * 1000:7.2f} ms   "
+          f"p50 {p50 * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--delay", type=float, default=0.0, help="latence simulée côté API (s)")
+    args = parser.parse_args()
+
+    fake, api_base = start_fake_api(delay=args.delay)
+    os.environ["ULTRAVOX_API_BASE"] = api_base
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import httpx
+    import server
+
+    if not server.USE_FASTMCP:
+        sys.exit("fastmcp et httpx sont requis pour ce benchmark")
+
+    before = []
+    for i in range(args.requests):
+        started = time.perf_counter()
+        with httpx.Client() as client:
+            client.get(f"{api_base}/calls/call-{i % 100:05d}", headers=server.HEADERS, timeout=10.0).json()
+        before.append(time.perf_counter() - started)
+
+    async def run_after():
+        after = []
+        for i in range(args.requests):
+            started = time.perf_counter()
+            (await server._send("GET", f"/calls/call-{i % 100:05d}")).json()
+            after.append(time.perf_counter() - started)
+
+        # Rafale typique d'un LLM : get_call + messages + stages pour 50 appels
+        paths = [f"/calls/call-{i:05d}{suffix}" for i in range(50) for suffix in ("", "/messages", "/stages")]
+        started = time.perf_counter()
+        await asyncio.gather(*(server._send("GET", path) for path in paths))
+        burst = time.perf_counter() - started
+        await server.http_client.aclose()
+        return after, len(paths), burst
+
+    after, burst_count, burst = asyncio.run(run_after())
+
+    print(f"{args.requests} appels get_call contre {api_base}")
+    summarize("avant (client par appel)", before)
+    summarize("après (client partagé)", after)
+    print(f"rafale de {burst_count} requêtes concurrentes : {burst * 1000:.1f} ms "
+          f"(ULTRAVOX_MAX_CONCURRENCY={server.HTTP_MAX_CONCURRENCY})")
+    fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
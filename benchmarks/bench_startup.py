@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Démarrage à froid du serveur stdio : poignée de main, premier tools/call, imports
+
+Claude Desktop et n8n lancent un server.py neuf par session. Ce script mesure,
+processus neuf par processus neuf, le délai jusqu'à la réponse à tools/list
+(initialize + notifications/initialized + tools/list) puis jusqu'au premier
+tools/call, avec et sans MCP_FAST_START, et lancé en script (server.py, recompilé
+à chaque démarrage) ou en module (python -m server, bytecode en cache).
+
+Il relance ensuite une poignée de main seule sous `-X importtime` et résume les
+imports faits avant la sortie du processus (stdin fermé juste après tools/list).
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --python .venv/bin/python   # version FastMCP
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_api import start_fake_api  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDSHAKE = [
+    {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+        "protocolVersion": "2025-03-26", "capabilities": {}, "clientInfo": {"name": "bench", "version": "0"}}},
+    {"jsonrpc": "2.0", "method": "notifications/initialized"},
+    {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+]
+FIRST_CALL = {"jsonrpc": "2.0", "id": 3, "method": "tools/call",
+              "params": {"name": "get_call", "arguments": {"call_id": "call-00001"}}}
+MODES = [
+    ("server.py", ["server.py"], "true"),
+    ("server.py sans MCP_FAST_START", ["server.py"], "false"),
+    ("python -m server", ["-m", "server"], "true"),
+]
+
+
+def spawn(python, args, env, stderr, extra=()):
+    """stderr hors pipe : un pipe plein (-X importtime, logs) bloquerait le serveur"""
+    return subprocess.Popen([python, *extra, *args], cwd=ROOT, env=env, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=stderr, text=True)
+
+
+def send(proc, message):
+    proc.stdin.write(json.dumps(message) + "\n")
+    proc.stdin.flush()
+
+
+def read_response(proc, request_id):
+    for line in proc.stdout:
+        if json.loads(line).get("id") == request_id:
+            return
+    raise RuntimeError(f"pas de réponse pour l'id {request_id}")
+
+
+def session(python, args, env):
+    """(ms jusqu'à la réponse tools/list, ms jusqu'à la réponse du premier tools/call)"""
+    started = time.perf_counter()
+    proc = spawn(python, args, env, subprocess.DEVNULL)
+    try:
+        for message in HANDSHAKE:
+            send(proc, message)
+        read_response(proc, 2)
+        handshake = time.perf_counter() - started
+        send(proc, FIRST_CALL)
+        read_response(proc, 3)
+        first_call = time.perf_counter() - started
+    finally:
+        proc.stdin.close()
+        proc.wait(timeout=30)
+    return handshake * 1000, first_call * 1000
+
+
+def import_profile(python, args, env):
+    """Lignes -X importtime d'une poignée de main seule : [(module, µs cumulées)] au premier niveau"""
+    with tempfile.TemporaryFile("w+") as stderr:
+        proc = spawn(python, args, env, stderr, extra=("-X", "importtime"))
+        for message in HANDSHAKE:
+            send(proc, message)
+        read_response(proc, 2)
+        proc.stdin.close()
+        proc.wait(timeout=60)
+        stderr.seek(0)
+        lines = stderr.read().splitlines()
+    modules, total = [], 0
+    for line in lines:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        total += int(self_us)
+        if not name.startswith("  "):  # import direct (pas une dépendance d'un autre module)
+            modules.append((name.strip(), int(cumulative)))
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--top", type=int, default=8, help="imports les plus lents à afficher")
+    args = parser.parse_args()
+
+    fake, api_base = start_fake_api()
+    print(f"{args.runs} processus par mesure, {args.python}")
+    for label, command, fast_start in MODES:
+        env = dict(os.environ, ULTRAVOX_API_BASE=api_base, MCP_TRANSPORT="stdio", MCP_FAST_START=fast_start)
+        samples = [session(args.python, command, env) for _ in range(args.runs)]
+        handshake = statistics.median(sample[0] for sample in samples)
+        first_call = statistics.median(sample[1] for sample in samples)
+        print(f"{label:<32} tools/list {handshake:7.1f} ms   premier tools/call {first_call:7.1f} ms")
+
+    for label, command, fast_start in MODES[:2]:
+        env = dict(os.environ, ULTRAVOX_API_BASE=api_base, MCP_TRANSPORT="stdio", MCP_FAST_START=fast_start)
+        total, modules = import_profile(args.python, command, env)
+        slowest = sorted(modules, key=lambda module: -module[1])[:args.top]
+        print(f"\n-X importtime, poignée de main seule ({label}) : {total / 1000:.1f} ms d'imports")
+        for name, cumulative in slowest:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Harnais stdio : envoie des centaines de tools/call à server.py et mesure le débit
+
+Lance server.py en sous-processus contre la fausse API locale, écrit toutes les
+requêtes JSON-RPC d'un coup sur son stdin, puis vérifie que chaque "id" reçoit
+exactement une réponse (lignes JSON valides, jamais entrelacées).
+
+Sans fastmcp installé, c'est la version fallback (stdlib) qui est mesurée :
+    python benchmarks/bench_stdio_fallback.py --requests 500 --delay 0.02
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_api import start_fake_api  # noqa: E402
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py")
+TOOL_CALLS = [
+    ("get_call", lambda i: {"call_id": f"call-{i % 200:05d}"}),
+    ("get_call_messages", lambda i: {"call_id": f"call-{i % 200:05d}", "limit": 20}),
+    ("get_call_stages", lambda i: {"call_id": f"call-{i % 200:05d}"}),
+    ("list_voices", lambda i: {"limit": 10}),
+]
+
+
+def run(api_base, requests, concurrency, python):
+    env = dict(os.environ, ULTRAVOX_API_BASE=api_base, ULTRAVOX_MAX_CONCURRENCY=str(concurrency))
+    proc = subprocess.Popen(
+        [python, SERVER], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL, env=env, text=True, bufsize=1,
+    )
+
+    def send(message):
+        proc.stdin.write(json.dumps(message) + "\n")
+
+    send({"jsonrpc": "2.0", "id": "init", "method": "initialize", "params": {
+        "protocolVersion": "2024-11-05", "capabilities": {},
+        "clientInfo": {"name": "bench", "version": "0"}}})
+    proc.stdin.flush()
+    json.loads(proc.stdout.readline())
+    send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+    responses = {}
+    done = threading.Event()
+
+    def reader():
+        for line in proc.stdout:
+            message = json.loads(line)  # une ligne entrelacée lèverait ici
+            if "id" not in message:
+                continue
+            if message["id"] in responses:
+                raise AssertionError(f"réponse en double pour {message['id']}")
+            responses[message["id"]] = message
+            if len(responses) == requests:
+                done.set()
+                return
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    started = time.perf_counter()
+    for i in range(requests):
+        name, arguments = TOOL_CALLS[i % len(TOOL_CALLS)]
+        send({"jsonrpc": "2.0", "id": i, "method": "tools/call",
+              "params": {"name": name, "arguments": arguments(i)}})
+    proc.stdin.flush()
+    done.wait(timeout=300)
+    elapsed = time.perf_counter() - started
+    proc.stdin.close()
+    proc.wait(timeout=30)
+
+    missing = set(range(requests)) - set(responses)
+    errors = [r for r in responses.values() if "error" in r or '"error"' in r["result"]["content"][0]["text"]]
+    return elapsed, missing, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--delay", type=float, default=0.02, help="latence simulée côté API (s)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 32])
+    parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args()
+
+    fake, api_base = start_fake_api(delay=args.delay)
+    print(f"{args.requests} tools/call, latence API simulée {args.delay * 1000:.0f} ms")
+    for concurrency in args.concurrency:
+        elapsed, missing, errors = run(api_base, args.requests, concurrency, args.python)
+        status = "OK" if not missing and not errors else f"{len(missing)} manquantes, {len(errors)} erreurs"
+        print(f"ULTRAVOX_MAX_CONCURRENCY={concurrency:<3} {elapsed:6.2f} s   "
+              f"{args.requests / elapsed:8.1f} req/s   {status}")
+    fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Fausse API Ultravox locale pour les benchmarks (stdlib uniquement)
+
+Usage autonome :
+    python benchmarks/fake_api.py --port 8765 --delay 0.01
+    ULTRAVOX_API_BASE=http://127.0.0.1:8765/api python server.py
+
+Usage depuis un script :
+    server, api_base = start_fake_api(delay=0.01)
+    ...
+    server.shutdown()
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+END_REASONS = ["hangup", "agent_hangup", "timeout", "unjoined"]
+PHRASES = [
+    "bonjour je voudrais un remboursement",
+    "pouvez-vous vérifier ma commande",
+    "je souhaite parler à un conseiller",
+    "merci pour votre aide",
+    "quel est le délai de livraison",
+    "I would like a refund please",
+]
+
+
+def build_dataset(calls=250, agents=5, messages=6, stages=2):
+    """Génère un jeu de données déterministe (les appels les plus récents d'abord)"""
+    start = 1760000000  # 2025-10-09
+    data = {
+        "agents": [
+            {"agentId": f"agent-{a:03d}", "name": f"Agent {a}", "callTemplate": {"systemPrompt": "..."}}
+            for a in range(agents)
+        ],
+        "calls": [],
+        "messages": {},
+        "stages": {},
+        "stage_messages": {},
+    }
+    for i in range(calls):
+        call_id = f"call-{i:05d}"
+        created = start - i * 3600
+        data["calls"].append({
+            "callId": call_id,
+            "agentId": f"agent-{i % agents:03d}",
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(created)),
+            "joined": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(created + 2)),
+            "ended": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(created + 60 + (i * 37) % 600)),
+            "endReason": END_REASONS[i % len(END_REASONS)],
+            "shortSummary": f"Appel {i}",
+        })
+        data["messages"][call_id] = [
+            {
+                "role": "MESSAGE_ROLE_USER" if m % 2 == 0 else "MESSAGE_ROLE_AGENT",
+                "text": PHRASES[(i + m) % len(PHRASES)],
+                "medium": "MESSAGE_MEDIUM_VOICE",
+                "callStageMessageIndex": m,
+            }
+            for m in range(messages)
+        ]
+        data["stages"][call_id] = [
+            {"callId": call_id, "callStageId": f"{call_id}-stage-{s}", "created": data["calls"][-1]["created"]}
+            for s in range(stages)
+        ]
+        for s in range(stages):
+            data["stage_messages"][f"{call_id}-stage-{s}"] = data["messages"][call_id][s::stages]
+    return data
+
+
+class FakeUltravoxHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    # ----- helpers -----
+    def _send_json(self, status, payload, headers=None):
+        body = b"" if status == 204 else json.dumps(payload).encode("utf-8")
+        if status == 200 and self.command == "GET":
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            headers = dict(headers or {}, ETag=etag)
+            if self.headers.get("If-None-Match") == etag:
+                self.server.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _page(self, items, path, query):
+        limit = int((query.get("limit") or query.get("pageSize") or ["20"])[0])
+        offset = int((query.get("cursor") or ["0"])[0])
+        chunk = items[offset:offset + limit]
+        next_url = None
+        if offset + limit < len(items):
+            host = self.headers.get("Host")
+            next_url = f"http://{host}{path}?" + urlencode({"cursor": offset + limit, "limit": limit})
+        return {"next": next_url, "previous": None, "results": chunk, "total": len(items)}
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"null") if length else None
+
+    # ----- routing -----
+    def _route(self):
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        with server.lock:
+            server.request_count += 1
+            failing = server.error_rate and server.random.random() < server.error_rate
+        if failing:
+            # Erreur transitoire simulée (surcharge côté Ultravox)
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+            return self._send_json(503, {"detail": "Service unavailable"}, headers)
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        data = server.data
+
+        if parts[:1] == ["media"]:
+            return self._send_media(parts[1])
+        if parts[:1] != ["api"]:
+            return self._send_json(404, {"detail": "Not found"})
+        parts = parts[1:]
+        method = self.command
+
+        if parts == ["accounts", "me"]:
+            return self._send_json(200, {"name": "Fake account", "billingUrl": None})
+        if parts == ["accounts", "me", "call_usage"]:
+            return self._send_json(200, {"totalCount": len(data["calls"]), "duration": "12345s"})
+        if parts == ["openapi.json"]:
+            return self._send_json(200, server.openapi)
+        if parts == ["models"]:
+            return self._send_json(200, {"results": [{"name": "fixie-ai/ultravox"}]})
+
+        if parts[:1] == ["calls"]:
+            calls = {c["callId"]: c for c in data["calls"]}
+            if len(parts) == 1:
+                return self._send_json(200, self._page(data["calls"], url.path, query))
+            call = calls.get(parts[1])
+            if call is None:
+                return self._send_json(404, {"detail": "Not found"})
+            if len(parts) == 2:
+                if method == "DELETE":
+                    data["calls"].remove(call)
+                    return self._send_json(204, None)
+                return self._send_json(200, call)
+            if parts[2] == "messages":
+                return self._send_json(200, self._page(data["messages"][call["callId"]], url.path, query))
+            if parts[2] == "tools":
+                return self._send_json(200, [{"name": "hangUp", "count": 1}])
+            if parts[2] == "recording":
+                host = self.headers.get("Host")
+                self.send_response(302)
+                self.send_header("Location", f"http://{host}/media/{call['callId']}.wav")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            if parts[2] == "stages":
+                stages = data["stages"][call["callId"]]
+                if len(parts) == 3:
+                    return self._send_json(200, self._page(stages, url.path, query))
+                stage = next((s for s in stages if s["callStageId"] == parts[3]), None)
+                if stage is None:
+                    return self._send_json(404, {"detail": "Not found"})
+                if len(parts) == 4:
+                    return self._send_json(200, stage)
+                return self._send_json(200, self._page(data["stage_messages"][parts[3]], url.path, query))
+
+        if parts[:1] == ["agents"]:
+            agents = {a["agentId"]: a for a in data["agents"]}
+            if len(parts) == 1:
+                return self._send_json(200, self._page(data["agents"], url.path, query))
+            agent = agents.get(parts[1])
+            if agent is None:
+                return self._send_json(404, {"detail": "Not found"})
+            if len(parts) == 3 and parts[2] == "calls":
+                calls = [c for c in data["calls"] if c["agentId"] == agent["agentId"]]
+                return self._send_json(200, self._page(calls, url.path, query))
+            if method == "PATCH":
+                agent["callTemplate"]["systemPrompt"] = (self._read_body() or {}).get("systemPrompt")
+                return self._send_json(200, agent)
+            if method == "DELETE":
+                data["agents"].remove(agent)
+                return self._send_json(204, None)
+            return self._send_json(200, agent)
+
+        if parts[:1] == ["voices"]:
+            voices = [{"voiceId": f"voice-{v}", "name": f"Voice {v}"} for v in range(30)]
+            if len(parts) == 1:
+                return self._send_json(200, self._page(voices, url.path, query))
+            return self._send_json(200, {"voiceId": parts[1], "name": parts[1]})
+
+        if parts[:1] == ["webhooks"]:
+            if len(parts) == 1 and method == "POST":
+                webhook = dict(self._read_body() or {}, webhookId=f"webhook-{len(data.setdefault('webhooks', []))}")
+                data["webhooks"].append(webhook)
+                return self._send_json(201, webhook)
+            if len(parts) == 1:
+                return self._send_json(200, self._page(data.get("webhooks", []), url.path, query))
+            if method == "DELETE":
+                return self._send_json(204, None)
+            return self._send_json(200, {"webhookId": parts[1], "url": "https://example.com/hook"})
+
+        if parts[:1] == ["deleted_calls"]:
+            deleted = [{"callId": f"deleted-{i:05d}", "deleted": c["created"]} for i, c in enumerate(data["calls"])]
+            if len(parts) == 1:
+                return self._send_json(200, self._page(deleted, url.path, query))
+            return self._send_json(200, {"callId": parts[1]})
+
+        if parts[:1] == ["tools"]:
+            tools = [{"toolId": f"tool-{t}", "name": f"tool{t}"} for t in range(12)]
+            if len(parts) == 1:
+                return self._send_json(200, self._page(tools, url.path, query))
+            return self._send_json(200, {"toolId": parts[1]})
+
+        return self._send_json(404, {"detail": "Not found"})
+
+    def _send_media(self, name):
+        total = size = self.server.recording_bytes
+        if self.command == "HEAD" and self.server.reject_head:
+            # Comme une URL signée S3/GCS valable uniquement pour GET
+            return self._send_json(403, {"detail": "Forbidden"})
+        if self.headers.get("Range") == "bytes=0-0":
+            size = 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes 0-0/{total}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        chunk = b"\0" * 65536
+        remaining = size
+        while remaining > 0:
+            self.wfile.write(chunk[:min(remaining, len(chunk))])
+            remaining -= len(chunk)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = do_HEAD = lambda self: self._route()
+
+
+class FakeUltravoxServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # rafales de connexions neuves sans SYN perdu (5 par défaut)
+
+    def __init__(self, address, delay=0.0, calls=250, recording_bytes=1 << 20, reject_head=False,
+                 error_rate=0.0, retry_after=None, seed=0):
+        super().__init__(address, FakeUltravoxHandler)
+        self.delay = delay
+        self.error_rate = error_rate  # part des requêtes répondues en 503
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.recording_bytes = recording_bytes
+        self.reject_head = reject_head
+        self.data = build_dataset(calls=calls)
+        self.openapi = {"openapi": "3.0.0", "paths": {f"/api/path{i}": {} for i in range(400)}}
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.not_modified = 0
+
+
+def start_fake_api(host="127.0.0.1", port=0, **kwargs):
+    """Démarre la fausse API dans un thread et renvoie (serveur, API_BASE)"""
+    server = FakeUltravoxServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fausse API Ultravox locale")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="latence ajoutée par requête (s)")
+    parser.add_argument("--calls", type=int, default=250)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part des requêtes en 503 (0-1)")
+    args = parser.parse_args()
+    server = FakeUltravoxServer((args.host, args.port), delay=args.delay, calls=args.calls,
+                                error_rate=args.error_rate)
+    print(f"Fausse API Ultravox sur http://{args.host}:{args.port}/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test de charge du transport HTTP : débit et latence selon le nombre de workers
+
+Lance la fausse API dans son propre processus, puis server.py en mode HTTP avec
+MCP_WORKERS = 1, 2, 4... et le bombarde de tools/call (POST /mcp, une session
+MCP par client) depuis plusieurs processus clients en keep-alive. Le mélange de
+tools inclut des listes de 100 appels, pour que l'encodage JSON pèse côté serveur.
+
+    python benchmarks/load_test.py --workers 1 2 4 --clients 8 --duration 10
+    python benchmarks/load_test.py --cache-backend sqlite   # cache partagé entre workers
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER = os.path.join(os.path.dirname(HERE), "server.py")
+TOOL_CALLS = [
+    ("list_calls", lambda i: {"limit": 100}),
+    ("get_call", lambda i: {"call_id": f"call-{i % 200:05d}"}),
+    ("list_voices", lambda i: {"limit": 10}),
+    ("get_call_messages", lambda i: {"call_id": f"call-{i % 200:05d}"}),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_http(port, path, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1.0)
+            conn.request("GET", path)
+            if conn.getresponse().status < 500:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"rien n'écoute sur le port {port}")
+
+
+def client(port, deadline, offset, queue):
+    """Un client : boucle de tools/call sur une connexion keep-alive jusqu'à deadline"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30.0)
+    headers = {"Content-Type": "application/json", "Accept": "application/json, text/event-stream"}
+    conn.request("POST", "/mcp", json.dumps({"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {
+        "protocolVersion": "2025-03-26", "capabilities": {}, "clientInfo": {"name": "load_test", "version": "0"}}}),
+        headers)
+    response = conn.getresponse()
+    response.read()
+    if response.getheader("Mcp-Session-Id"):  # sans session quand il y a plusieurs workers
+        headers["Mcp-Session-Id"] = response.getheader("Mcp-Session-Id")
+    conn.request("POST", "/mcp", json.dumps({"jsonrpc": "2.0", "method": "notifications/initialized"}), headers)
+    conn.getresponse().read()
+    latencies, errors, i = [], 0, offset
+    while time.monotonic() < deadline:
+        name, arguments = TOOL_CALLS[i % len(TOOL_CALLS)]
+        body = json.dumps({"jsonrpc": "2.0", "id": i, "method": "tools/call",
+                           "params": {"name": name, "arguments": arguments(i)}})
+        started = time.perf_counter()
+        try:
+            conn.request("POST", "/mcp", body, headers)
+            response = conn.getresponse()
+            data = response.read()
+            if response.status != 200 or b'"error' in data[:200]:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30.0)
+        latencies.append(time.perf_counter() - started)
+        i += 1
+    queue.put((latencies, errors))
+
+
+def run(api_base, workers, args):
+    port = free_port()
+    env = dict(os.environ, ULTRAVOX_API_BASE=api_base, MCP_TRANSPORT="http", MCP_PORT=str(port),
+               MCP_WORKERS=str(workers), ULTRAVOX_CACHE_BACKEND=args.cache_backend,
+               ULTRAVOX_CACHE_PATH=os.path.join(args.tmpdir, f"cache-{port}.sqlite3"))
+    server = subprocess.Popen([args.python, SERVER], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_http(port, "/health")
+        queue = multiprocessing.Queue()
+        deadline = time.monotonic() + args.duration
+        clients = [multiprocessing.Process(target=client, args=(port, deadline, k * 1000, queue))
+                   for k in range(args.clients)]
+        for process in clients:
+            process.start()
+        results = [queue.get() for _ in clients]
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = sorted(sample for samples, _ in results for sample in samples)
+    errors = sum(count for _, count in results)
+    return (len(latencies) / args.duration, latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.95) - 1], errors)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="processus clients simultanés")
+    parser.add_argument("--duration", type=float, default=10.0, help="durée de chaque mesure (s)")
+    parser.add_argument("--delay", type=float, default=0.0, help="latence simulée côté API (s)")
+    parser.add_argument("--cache-backend", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--tmpdir", default=os.environ.get("TMPDIR", "/tmp"))
+    args = parser.parse_args()
+
+    api_port = free_port()
+    fake = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_api.py"), "--port", str(api_port),
+                             "--delay", str(args.delay)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_http(api_port, "/api/accounts/me")
+        api_base = f"http://127.0.0.1:{api_port}/api"
+        print(f"{args.clients} clients, {args.duration:.0f} s par mesure, latence API simulée "
+              f"{args.delay * 1000:.0f} ms, cache {args.cache_backend}, {os.cpu_count()} CPU")
+        for workers in args.workers:
+            rate, p50, p95, errors = run(api_base, workers, args)
+            print(f"MCP_WORKERS={workers:<3} {rate:8.1f} req/s   p50 {p50 * 1000:7.2f} ms   "
+                  f"p95 {p95 * 1000:7.2f} ms   {errors} erreurs")
+    finally:
+        fake.terminate()
+        fake.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,672 +4,3681 @@ Serveur MCP Ultravox - VERSION COMPLÈTE AVEC 30 TOOLS
 Fonctionne avec OU SANS FastMCP + httpx
 """
 
+import itertools
 import json
 import sys
 import os
+import random
+import re
+import signal
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
 
 # Configuration
 API_KEY = os.getenv("ULTRAVOX_API_KEY", "VJtcPzQd.t3wzaodHSgEtGHVUasa09LaaasHQCfjh")
-API_BASE = "https://api.ultravox.ai/api"
+API_BASE = os.getenv("ULTRAVOX_API_BASE", "https://api.ultravox.ai/api")
+
+# Client HTTP partagé (keep-alive) : délais, taille du pool, concurrence
+HTTP_TIMEOUT = float(os.getenv("ULTRAVOX_HTTP_TIMEOUT", "10.0"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("ULTRAVOX_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("ULTRAVOX_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("ULTRAVOX_HTTP_KEEPALIVE_EXPIRY", "30.0"))
+HTTP2 = os.getenv("ULTRAVOX_HTTP2", "true").lower() in ("1", "true", "yes")
+HTTP_MAX_CONCURRENCY = int(os.getenv("ULTRAVOX_MAX_CONCURRENCY", "10"))  # requêtes simultanées par hôte
+
+# Reprises automatiques (429 / 5xx / connexion coupée) des méthodes idempotentes
+RETRY_MAX = int(os.getenv("ULTRAVOX_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("ULTRAVOX_RETRY_BACKOFF", "0.5"))        # base du backoff exponentiel (s)
+RETRY_MAX_DELAY = float(os.getenv("ULTRAVOX_RETRY_MAX_DELAY", "8.0"))    # attente max entre deux essais (s)
+RETRY_MAX_TIME = float(os.getenv("ULTRAVOX_RETRY_MAX_TIME", "30.0"))     # budget total par requête (s)
+RETRY_METHODS = os.getenv("ULTRAVOX_RETRY_METHODS", "GET,HEAD,OPTIONS,PUT,DELETE")
+
+# Limite de débit côté client (requêtes/s vers l'API, 0 = désactivée) : globale
+# et par famille d'endpoints ; les requêtes font la queue au lieu d'échouer
+RATE_LIMIT = float(os.getenv("ULTRAVOX_RATE_LIMIT", "0"))
+RATE_LIMIT_BURST = float(os.getenv("ULTRAVOX_RATE_LIMIT_BURST", "0"))  # 0 = une seconde de débit
+RATE_LIMIT_FAMILIES = {
+    family: float(os.getenv(f"ULTRAVOX_RATE_LIMIT_{family.upper()}", "0"))
+    for family in ("calls", "agents", "webhooks")
+}
+
+# Disjoncteur par famille d'endpoints : ouvert après N échecs consécutifs (5xx,
+# timeout, connexion), il répond immédiatement pendant COOLDOWN s puis laisse
+# passer une requête d'essai
+BREAKER_THRESHOLD = int(os.getenv("ULTRAVOX_BREAKER_THRESHOLD", "5"))  # 0 = désactivé
+BREAKER_COOLDOWN = float(os.getenv("ULTRAVOX_BREAKER_COOLDOWN", "30.0"))
+
+# Transport MCP : stdio (un processus par client) ou HTTP (plusieurs sessions
+# simultanées dans un même processus, avec /health, /ready et /metrics)
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio").lower()  # stdio, http, streamable-http, sse
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8000"))
+MCP_PATH = os.getenv("MCP_PATH", "/mcp")
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "1"))  # processus pré-forkés en HTTP (POSIX)
+# Processus qui serviront réellement (voir run_workers) : chacun a ses propres seaux,
+# les débits configurés sont donc répartis entre eux pour que leur somme reste la limite
+WORKER_PROCESSES = max(1, MCP_WORKERS) if MCP_TRANSPORT in ("http", "streamable-http") and hasattr(os, "fork") else 1
+WORKER_INDEX = 0  # rang du worker courant, fixé par run_workers après le fork
+# Origines admises en HTTP (en plus de localhost) : contre le DNS rebinding, une
+# requête MCP avec un en-tête Origin qui n'est ni local ni listé est refusée (403)
+MCP_ALLOWED_ORIGINS = [origin.strip().rstrip("/") for origin in os.getenv("MCP_ALLOWED_ORIGINS", "").split(",")
+                       if origin.strip()]
+MCP_FAST_START = os.getenv("MCP_FAST_START", "true").lower() in ("1", "true", "yes")  # stdio : voir stdio_handshake
+
+# Téléchargement des enregistrements (écrits par blocs, jamais chargés en mémoire)
+RECORDINGS_DIR = os.getenv("ULTRAVOX_RECORDINGS_DIR", os.path.join("data", "recordings"))
+
+# Suppressions en masse : débit maximal vers l'API (suppressions/s, 0 = illimité)
+BULK_DELETE_RATE = float(os.getenv("ULTRAVOX_BULK_DELETE_RATE", "10"))
+
+# Cache des réponses (voix, modèles, agents, outils, schéma OpenAPI)
+CACHE_ENABLED = os.getenv("ULTRAVOX_CACHE", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("ULTRAVOX_CACHE_MAX_ENTRIES", "256"))
+CACHE_BACKEND = os.getenv("ULTRAVOX_CACHE_BACKEND", "memory").lower()  # memory, sqlite (partagé entre workers)
+CACHE_PATH = os.getenv("ULTRAVOX_CACHE_PATH", os.path.join("data", "cache.sqlite3"))
+
+# Archive locale des appels (SQLite WAL), synchronisée par sync_call_archive
+ARCHIVE_PATH = os.getenv("ULTRAVOX_ARCHIVE_PATH", os.path.join("data", "archive.sqlite3"))
+ARCHIVE_MAX_CALLS = int(os.getenv("ULTRAVOX_ARCHIVE_MAX_CALLS", "1000"))  # historique rattrapé par synchro
+
+# Sérialisation JSON : orjson s'il est installé (auto) ou stdlib ; pass-through =
+# corps de l'API recopié tel quel dans le résultat quand le tool ne le transforme pas
+JSON_BACKEND = os.getenv("ULTRAVOX_JSON", "auto").lower()  # auto, stdlib
+JSON_PASSTHROUGH = os.getenv("ULTRAVOX_JSON_PASSTHROUGH", "true").lower() in ("1", "true", "yes")
+
+# ==== JSON (commun aux deux versions) ====
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _stdlib_dumps(value):
+    # Même sortie compacte qu'orjson : _Fit mesure les tailles avec ce même encodeur
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+if orjson is not None and JSON_BACKEND != "stdlib":
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(value):
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+else:
+    json_loads = json.loads
+    json_dumps = _stdlib_dumps
+
+
+class RawJSON:
+    """Corps JSON de l'API transmis sans décodage (voir JSON_PASSTHROUGH)"""
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def text(self):
+        return self.raw.decode("utf-8")
+
+
+# ==== REGISTRE DES TOOLS (commun aux deux versions) ====
+# Une seule table déclarative : endpoint, méthode HTTP, schéma des arguments
+# et mise en forme du résultat. Le dispatch (recherche par nom) et le
+# manifeste tools/list en sont dérivés une fois pour toutes au démarrage.
+REQUIRED = object()
+
+# Arguments acceptés par tous les tools (voir shape_result)
+SHAPE_PROPERTIES = {
+    "fields": {"type": "string", "description": "Comma-separated paths to keep, e.g. results.callId,results.created,"
+                                                "next (dots, [n], [*]); omit for the full result"},
+    "max_bytes": {"type": "integer", "description": "Approximate cap on the JSON result size; longer lists and "
+                                                    "strings are cut, with markers saying what was left out"},
+}
+
+
+def _tool(method, path, description, args=(), query=(), body=None, ok=(200,), transform=None,
+          ttl=0, revalidate=False, invalidates=(), paginated=False):
+    """Déclare un tool ; args = [(nom, type JSON Schema, défaut ou REQUIRED)]
+
+    ttl : durée de cache (s) de la réponse, 0 = jamais servie sans vérification
+    revalidate : garder ETag/Last-Modified et revalider par GET conditionnel (304)
+    invalidates : préfixes de chemins à purger du cache quand le tool réussit
+    paginated : liste à curseur, accepte all_pages / max_items
+    """
+    if paginated:
+        args = list(args) + [("all_pages", "boolean", False), ("max_items", "integer", None)]
+    properties = {}
+    required = []
+    for arg_name, arg_type, default in args:
+        properties[arg_name] = {"type": arg_type}
+        if arg_type == "array":
+            properties[arg_name]["items"] = {"type": "string"}
+        if default is REQUIRED:
+            required.append(arg_name)
+        elif default is not None:  # argument optionnel sans valeur : pas de "default": null dans le schéma
+            properties[arg_name]["default"] = default
+    properties.update(SHAPE_PROPERTIES)
+    input_schema = {"type": "object", "properties": properties}
+    if required:
+        input_schema["required"] = required
+    return {
+        "method": method,
+        "path": path,
+        "description": description,
+        "defaults": {arg_name: default for arg_name, _, default in args if default is not REQUIRED},
+        "required": required,
+        "query": query,
+        "body": body,
+        "ok": ok,
+        "transform": transform,
+        "ttl": ttl,
+        "revalidate": revalidate,
+        "invalidates": invalidates,
+        "paginated": paginated,
+        "input_schema": input_schema,
+    }
+
+
+def _deleted(message):
+    return lambda arguments, data: {"success": True, "message": message}
+
+
+def _openapi_summary(arguments, schema):
+    return {"success": True, "paths_count": len(schema.get("paths", {}))}
+
+
+def _call_tools(arguments, tools_list):
+    return {
+        "call_id": arguments["call_id"],
+        "tools": tools_list if isinstance(tools_list, list) else [tools_list],
+        "count": len(tools_list) if isinstance(tools_list, list) else 1
+    }
+
+
+LIMIT = ("limit", "integer", 20)
+CALL_ID = ("call_id", "string", REQUIRED)
+STAGE_ID = ("stage_id", "string", REQUIRED)
+AGENT_ID = ("agent_id", "string", REQUIRED)
+
+TOOLS = {
+    # ACCOUNT & SYSTEM
+    "get_account_info": _tool("GET", "/accounts/me", "Get account info"),
+    "get_open_api_schema": _tool("GET", "/openapi.json", "Get OpenAPI schema", transform=_openapi_summary,
+                                 ttl=3600, revalidate=True),
+
+    # CALLS
+    "list_calls": _tool("GET", "/calls", "List calls", args=[LIMIT], query=["limit"], paginated=True),
+    "get_call": _tool("GET", "/calls/{call_id}", "Get call details", args=[CALL_ID], revalidate=True),
+    "get_call_messages": _tool("GET", "/calls/{call_id}/messages", "Get call messages", args=[CALL_ID, LIMIT],
+                               query=["limit"], paginated=True),
+    "get_call_recording": _tool("GET", "/calls/{call_id}/recording",
+                                "Get the signed recording URL without downloading the audio "
+                                "(probe=true adds size and content type)",
+                                args=[CALL_ID, ("probe", "boolean", False)]),
+    "download_call_recording": _tool("GET", "/calls/{call_id}/recording",
+                                     "Stream a call recording to disk in chunks and report bytes/second",
+                                     args=[CALL_ID, ("filename", "string", None), ("chunk_size", "integer", 65536)]),
+    "get_call_tools": _tool("GET", "/calls/{call_id}/tools", "Get call tools", args=[CALL_ID], transform=_call_tools),
+    "get_call_stages": _tool("GET", "/calls/{call_id}/stages", "Get call stages", args=[CALL_ID]),
+    "get_call_stage": _tool("GET", "/calls/{call_id}/stages/{stage_id}", "Get call stage details", args=[CALL_ID, STAGE_ID]),
+    "get_stage_messages": _tool("GET", "/calls/{call_id}/stages/{stage_id}/messages", "Get stage messages",
+                                args=[CALL_ID, STAGE_ID, LIMIT], query=["limit"], paginated=True),
+    "get_call_bundle": _tool(None, None, "Fetch call, messages, stages with their messages and tools for several "
+                             "calls concurrently; one merged document per call",
+                             args=[("call_ids", "array", REQUIRED)]),
+    "delete_call": _tool("DELETE", "/calls/{call_id}", "Delete a call", args=[CALL_ID], ok=(200, 204),
+                         transform=_deleted("Appel supprimé"), invalidates=("/calls/{call_id}",)),
+    "bulk_delete_calls": _tool(None, None, "Delete many calls, by id list or by a filter over list_calls "
+                               "(agent_id, end_reason, created_before/after); rate limited, dry_run by default",
+                               args=[("call_ids", "array", None), ("agent_id", "string", None),
+                                     ("end_reason", "string", None), ("created_before", "string", None),
+                                     ("created_after", "string", None), ("max_items", "integer", None),
+                                     ("dry_run", "boolean", True)]),
+
+    # AGENTS
+    "list_agents": _tool("GET", "/agents", "List agents", args=[LIMIT], query=["limit"], ttl=60, paginated=True),
+    "get_agent": _tool("GET", "/agents/{agent_id}", "Get agent details", args=[AGENT_ID], ttl=60, revalidate=True),
+    "list_agent_calls": _tool("GET", "/agents/{agent_id}/calls", "List agent calls", args=[AGENT_ID, LIMIT],
+                              query=["limit"], paginated=True),
+    "update_agent_prompt": _tool("PATCH", "/agents/{agent_id}", "Update agent prompt",
+                                 args=[AGENT_ID, ("prompt", "string", REQUIRED)],
+                                 body=lambda a: {"systemPrompt": a["prompt"]}, invalidates=("/agents",)),
+    "delete_agent": _tool("DELETE", "/agents/{agent_id}", "Delete an agent", args=[AGENT_ID], ok=(200, 204),
+                          transform=_deleted("Agent supprimé"), invalidates=("/agents",)),
+    "bulk_delete_agents": _tool(None, None, "Delete many agents; rate limited, dry_run by default",
+                                args=[("agent_ids", "array", REQUIRED), ("dry_run", "boolean", True)]),
+
+    # VOICES
+    "list_voices": _tool("GET", "/voices", "List voices", args=[LIMIT], query=["limit"], ttl=3600, paginated=True),
+    "get_voice": _tool("GET", "/voices/{voice_id}", "Get voice details", args=[("voice_id", "string", REQUIRED)],
+                       ttl=3600, revalidate=True),
+
+    # MODELS
+    "list_models": _tool("GET", "/models", "List models", ttl=3600),
+
+    # WEBHOOKS
+    "list_webhooks": _tool("GET", "/webhooks", "List webhooks"),
+    "get_webhook": _tool("GET", "/webhooks/{webhook_id}", "Get webhook details", args=[("webhook_id", "string", REQUIRED)],
+                         revalidate=True),
+    "create_webhook": _tool("POST", "/webhooks", "Create a webhook",
+                            args=[AGENT_ID, ("url", "string", REQUIRED), ("events", "array", [])],
+                            body=lambda a: {"agentId": a["agent_id"], "url": a["url"], "events": a["events"]},
+                            ok=(200, 201), invalidates=("/webhooks", "/agents/{agent_id}")),
+    "delete_webhook": _tool("DELETE", "/webhooks/{webhook_id}", "Delete a webhook",
+                            args=[("webhook_id", "string", REQUIRED)], ok=(200, 204),
+                            transform=_deleted("Webhook supprimé"), invalidates=("/webhooks", "/agents")),
+    "bulk_delete_webhooks": _tool(None, None, "Delete many webhooks; rate limited, dry_run by default",
+                                  args=[("webhook_ids", "array", REQUIRED), ("dry_run", "boolean", True)]),
+
+    # DELETED CALLS
+    "get_deleted_calls": _tool("GET", "/deleted_calls", "Get deleted calls", args=[LIMIT], query=["limit"], paginated=True),
+    "get_deleted_call": _tool("GET", "/deleted_calls/{call_id}", "Get deleted call details", args=[CALL_ID]),
+    "list_deleted_calls_stream": _tool("GET", "/deleted_calls",
+                                       "Page through deleted calls, emitting each page as a progress notification "
+                                       "(log notification without progressToken); returns counts only",
+                                       args=[LIMIT, ("max_items", "integer", None)], query=["limit"]),
+
+    # RESOURCES
+    "get_tools_list": _tool("GET", "/tools", "Get tools list", args=[LIMIT], query=["limit"], ttl=300, paginated=True),
+    "get_tool": _tool("GET", "/tools/{tool_id}", "Get tool details", args=[("tool_id", "string", REQUIRED)], ttl=300),
+    "get_call_usage": _tool("GET", "/accounts/me/call_usage", "Get call usage"),
+
+    # SERVEUR (local, sans appel à l'API)
+    "get_cache_stats": _tool(None, None, "Get response cache statistics (hits, misses, entries)"),
+    "get_server_metrics": _tool(None, None,
+                                "Get server metrics (per-tool and per-endpoint latency, errors by status, retries, "
+                                "rate limiting, circuit breakers, coalesced GETs, cache, connection pools)"),
+
+    # ARCHIVE LOCALE (SQLite)
+    "sync_call_archive": _tool(None, None, "Incrementally sync calls, messages and stages into the local SQLite "
+                               "archive (new calls since the last sync, then up to max_calls of history)",
+                               args=[("max_calls", "integer", ARCHIVE_MAX_CALLS), ("details", "boolean", True)]),
+    "query_call_archive": _tool(None, None, "Query archived calls by agent, end reason and creation time "
+                                "(newest first, no API call)",
+                                args=[("agent_id", "string", None), ("end_reason", "string", None),
+                                      ("created_after", "string", None), ("created_before", "string", None),
+                                      ("limit", "integer", 50), ("offset", "integer", 0)]),
+    "get_archived_call": _tool(None, None, "Get an archived call with its messages and stages (no API call)",
+                               args=[CALL_ID]),
+    "call_stats": _tool(None, None, "Aggregated call statistics computed server-side: calls, average and total "
+                        "duration per group (group_by: agent, day, end_reason), end-reason distribution and, with "
+                        "tools=true, tool usage from get_call_tools; reads the local archive when present "
+                        "(source=auto), otherwise streams list_calls (at most max_calls)",
+                        args=[("group_by", "string", "agent,day"), ("agent_id", "string", None),
+                              ("since", "string", None), ("until", "string", None), ("source", "string", "auto"),
+                              ("tools", "boolean", False), ("max_calls", "integer", 1000)]),
+    "search_transcripts": _tool(None, None, "Full-text search over archived call transcripts (all words required, "
+                                "\"exact phrase\", prefix*); returns ranked call ids with snippets (no API call)",
+                                args=[("query", "string", REQUIRED), ("agent_id", "string", None),
+                                      ("since", "string", None), ("limit", "integer", 20)]),
+}
+
+# Manifeste tools/list, construit une seule fois
+TOOLS_MANIFEST = [
+    {"name": name, "description": spec["description"], "inputSchema": spec["input_schema"]}
+    for name, spec in TOOLS.items()
+]
+
+
+class InvalidArguments(ValueError):
+    """Argument absent ou d'un type incompatible avec l'input_schema du tool : rien n'est envoyé à l'API"""
+
+    status_code = 400
+
+
+# Chaînes acceptées pour un booléen (mêmes que la validation pydantic de la baseline)
+TRUE_STRINGS = ("1", "true", "t", "yes", "y", "on")
+FALSE_STRINGS = ("0", "false", "f", "no", "n", "off")
+
+
+def coerce_argument(arg_name, schema, value):
+    """Valeur convertie au type JSON Schema déclaré ("3" -> 3, "false" -> False, "a,b" -> ["a", "b"])
+
+    None reste None (argument absent) ; InvalidArguments si la conversion est impossible.
+    """
+    kind = schema.get("type")
+    if value is None or kind is None:
+        return value
+    if kind == "boolean":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in TRUE_STRINGS + FALSE_STRINGS:
+            return value.strip().lower() in TRUE_STRINGS
+    elif kind == "integer":
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and re.fullmatch(r"\s*[-+]?\d+\s*", value):
+            return int(value)
+    elif kind == "string":
+        if isinstance(value, str):
+            return value
+    elif kind == "array":
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(",") if item.strip()]
+        if isinstance(value, (list, tuple)) and all(isinstance(item, str) for item in value):
+            return list(value)
+    else:
+        return value
+    raise InvalidArguments(f"Argument invalide : {arg_name} doit être de type {kind} (reçu {value!r})")
+
+
+def tool_values(name, arguments):
+    """Arguments convertis aux types de l'input_schema et complétés par les défauts du registre
+
+    InvalidArguments s'il en manque un ou si l'un d'eux n'a pas le type déclaré.
+    """
+    spec = TOOLS[name]
+    properties = spec["input_schema"]["properties"]
+    values = dict(spec["defaults"])
+    values.update({k: coerce_argument(k, properties.get(k, {}), v)
+                   for k, v in (arguments or {}).items() if v is not None})
+    missing = [arg_name for arg_name in spec["required"] if values.get(arg_name) in (None, "", [])]
+    if missing:
+        raise InvalidArguments(f"Argument(s) manquant(s) : {', '.join(missing)}")
+    return values
+
+
+def build_request(name, arguments):
+    """Résout un appel de tool en (spec, arguments complétés, chemin, query, corps JSON)"""
+    spec = TOOLS[name]
+    values = tool_values(name, arguments)
+    path = spec["path"].format(**{k: quote(str(v), safe="") for k, v in values.items()})
+    params = {arg_name: values[arg_name] for arg_name in spec["query"] if arg_name in values}
+    body = spec["body"](values) if spec["body"] else None
+    return spec, values, path, params, body
+
+
+def tool_result(spec, values, status, raw, data=None, passthrough=False):
+    """Met en forme la réponse de l'API pour un tool (commun aux deux versions)
+
+    data : corps déjà décodé (entrée de cache), pour éviter de re-parser raw
+    passthrough : renvoyer RawJSON(raw) si le tool ne transforme pas la réponse
+    """
+    if status not in spec["ok"]:
+        return {"error": f"Erreur ({status})", "status_code": status}
+    if passthrough and raw and not spec["transform"]:
+        return RawJSON(raw)
+    if data is None:
+        data = json_loads(raw) if raw else None
+    if spec["transform"]:
+        return spec["transform"](values, data)
+    return data
+
+
+def is_error(result):
+    return isinstance(result, dict) and "error" in result
+
+
+def id_list(ids, arg_name):
+    """Identifiants dédoublonnés, dans l'ordre (accepte aussi "id1,id2")"""
+    if isinstance(ids, str):
+        ids = ids.split(",")
+    ids = [item for item in dict.fromkeys(str(item).strip() for item in ids or ()) if item]
+    if not ids:
+        raise ValueError(f"Argument(s) manquant(s) : {arg_name}")
+    return ids
+
+
+# ==== PROJECTION ET TAILLE DES RÉSULTATS (commun aux deux versions) ====
+SHAPE_MIN_BYTES = 256
+SHAPE_MARKER_BYTES = 32  # place réservée à un marqueur de coupe ("… 95 more items")
+SHAPE_SUMMARY_BYTES = 80  # place réservée au marqueur "_truncated" final
+
+
+def parse_fields(fields):
+    """ "results.callId, results[0].agentId, next" -> arbre {clé: sous-arbre ou None (tout garder)}
+
+    [*] (ou []) porte sur tous les éléments d'une liste, [n] sur l'élément n ;
+    une clé appliquée à une liste porte sur chacun de ses éléments.
+    """
+    tree = {}
+    for path in (fields.split(",") if isinstance(fields, str) else fields or ()):
+        segments = [int(index) if index.isdigit() else (key or "*")
+                    for key, index in re.findall(r"([^.\[\]]+)|\[(\*?|\d+)\]", path.strip().lstrip("$"))]
+        node = tree
+        for position, segment in enumerate(segments):
+            if position == len(segments) - 1:
+                node[segment] = None
+            elif node.get(segment, {}) is not None:
+                node = node.setdefault(segment, {})
+            else:
+                break  # un chemin plus court garde déjà tout ce sous-arbre
+    return tree
+
+
+def project(value, tree):
+    """Ne garde de value que les chemins de tree (les chemins absents sont ignorés)"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        if "*" in tree:
+            return [project(item, tree["*"]) for item in value]
+        indexes = [key for key in tree if isinstance(key, int)]
+        if indexes:
+            return [project(value[index], tree[index]) for index in sorted(indexes) if index < len(value)]
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        if "*" in tree:
+            return {key: project(item, tree["*"]) for key, item in value.items()}
+        return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+class _Fit:
+    """Réduction d'une valeur JSON à un budget d'octets, en un seul parcours
+
+    Chaque valeur scalaire est encodée une fois pour être mesurée ; dès que le
+    budget est épuisé, le reste d'une liste n'est plus parcouru (ni encodé) et
+    un marqueur indique combien d'éléments ont été omis. Dans un objet, les
+    valeurs scalaires (curseur next, total...) passent avant les listes. Une
+    liste garde ses premiers éléments entiers plutôt que des chaînes vidées.
+    """
+
+    def __init__(self):
+        self.omitted = 0
+        self.cut_strings = 0
+        self.emptied = 0  # chaînes dont il ne reste que le marqueur
+
+    @staticmethod
+    def _size(value):
+        return len(json_dumps(value).encode("utf-8"))
+
+    def fit(self, value, budget):
+        """(valeur réduite, taille encodée approximative)"""
+        if isinstance(value, dict):
+            return self._object(value, budget)
+        if isinstance(value, list):
+            return self._array(value, budget)
+        size = self._size(value)
+        if isinstance(value, str) and size > budget:
+            self.cut_strings += 1
+            room = max(budget - SHAPE_MARKER_BYTES, 0)
+            keep = room
+            while keep and self._size(value[:keep]) > room:
+                keep = min(keep - 1, keep * room // self._size(value[:keep]))
+            self.emptied += not keep
+            value = f"{value[:keep]}… [{len(value) - keep} more chars]"
+            size = self._size(value)
+        return value, size
+
+    def _array(self, items, budget):
+        """Éléments entiers tant qu'ils tiennent
+
+        Seul le premier peut être réduit, et seulement si sa version réduite
+        tient dans le budget sans vider de chaîne ; sinon il est omis lui aussi.
+        """
+        out, size = [], 2
+        for position, item in enumerate(items):
+            remaining = budget - size - 1 - SHAPE_MARKER_BYTES
+            counters = (self.omitted, self.cut_strings, self.emptied)
+            if remaining > 0:
+                fitted, item_size = self.fit(item, remaining)
+                whole = counters == (self.omitted, self.cut_strings, self.emptied)
+                if whole or (not position and item_size <= remaining and self.emptied == counters[2]):
+                    out.append(fitted)
+                    size += item_size + (1 if position else 0)
+                    continue
+                self.omitted, self.cut_strings, self.emptied = counters
+            self.omitted += len(items) - position
+            out.append(f"… {len(items) - position} more items")
+            return out, size + SHAPE_MARKER_BYTES
+        return out, size
+
+    def _object(self, value, budget):
+        sizes = {key: self._size(key) + 2 for key in value}  # clé, ":" et ","
+        nested = [key for key, item in value.items() if isinstance(item, (dict, list))]
+        fitted, size = {}, 2
+        for key, item in value.items():
+            if key not in nested:
+                fitted[key], item_size = self.fit(item, max(budget - size - sizes[key], 0))
+                size += sizes[key] + item_size
+        for key in nested:
+            remaining = budget - size - sizes[key]
+            if remaining <= SHAPE_MARKER_BYTES:
+                self.omitted += 1
+                fitted[key] = "… omitted"
+                size += sizes[key] + 12
+                continue
+            fitted[key], item_size = self.fit(value[key], remaining)
+            size += sizes[key] + item_size
+        return {key: fitted[key] for key in value}, size
+
+
+def shape_arguments(arguments):
+    """Retire fields et max_bytes des arguments d'un tool et les valide : (fields, max_bytes)"""
+    return tuple(coerce_argument(arg_name, SHAPE_PROPERTIES[arg_name], arguments.pop(arg_name, None))
+                 for arg_name in ("fields", "max_bytes"))
+
+
+def shape_result(result, fields=None, max_bytes=None):
+    """Applique fields (projection) et max_bytes (plafond) au résultat d'un tool
+
+    Un RawJSON qui tient déjà dans le plafond, sans projection, est renvoyé tel
+    quel : le corps de l'API n'est alors ni décodé ni ré-encodé. Sinon seule la
+    partie gardée est ré-encodée. Les erreurs ne sont jamais réduites.
+    """
+    if not fields and not max_bytes:
+        return result
+    if max_bytes:
+        max_bytes = max(int(max_bytes), SHAPE_MIN_BYTES)
+    if isinstance(result, RawJSON):
+        if not fields and len(result.raw) <= max_bytes:
+            return result
+        result = json_loads(result.raw)
+    if is_error(result):
+        return result
+    if fields:
+        result = project(result, parse_fields(fields))
+    if max_bytes:
+        fitter = _Fit()
+        fitted, _ = fitter.fit(result, max_bytes - (SHAPE_SUMMARY_BYTES if isinstance(result, dict) else 0))
+        if fitter.omitted or fitter.cut_strings:
+            marker = {"max_bytes": max_bytes, "omitted_items": fitter.omitted, "cut_strings": fitter.cut_strings}
+            result = {**fitted, "_truncated": marker} if isinstance(fitted, dict) else fitted
+    return result
+
+
+# ==== PAGINATION (commun aux deux versions) ====
+# Les listes Ultravox renvoient {"results": [...], "next": <url du curseur suivant>}.
+class UpstreamError(Exception):
+    """Réponse d'erreur de l'API pendant un parcours de pages"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Erreur ({status_code})")
+        self.status_code = status_code
+
+
+def wants_all_pages(spec, values):
+    return spec["paginated"] and (values.get("all_pages") or values.get("max_items"))
+
+
+def first_page_params(params, values):
+    """Taille de la première page : jamais plus que max_items"""
+    max_items = values.get("max_items")
+    if max_items and params.get("limit", max_items) > max_items:
+        return dict(params, limit=max_items)
+    return params
+
+
+def with_page_limit(url, limit):
+    """URL de curseur dont la page ne dépasse pas limit (le curseur ne dépend pas de la taille de page)"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    current = next((int(value) for key, value in query if key == "limit" and value.isdigit()), None)
+    if current is not None and current <= limit:
+        return url
+    query = [(key, value) for key, value in query if key != "limit"] + [("limit", str(limit))]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def page_items(data):
+    if isinstance(data, dict):
+        return data.get("results") or []
+    return data if isinstance(data, list) else []
+
+
+def page_next(data):
+    return data.get("next") if isinstance(data, dict) else None
+
+
+class PageCollector:
+    """Agrège les pages au fil de l'eau et s'arrête dès que max_items est atteint
+
+    Avec keep=False seuls les compteurs sont conservés (streaming) : la page
+    courante reste disponible dans self.page le temps de l'émettre. Avec
+    resize=True la page suivante est demandée à la taille restante (limit du
+    curseur) au lieu d'être tronquée, et self.next reste un curseur valable.
+    """
+
+    def __init__(self, max_items=None, keep=True, resize=False):
+        self.max_items = max_items
+        self.resize = resize
+        self.results = [] if keep else None
+        self.page = []
+        self.count = 0
+        self.pages = 0
+        self.total = None
+        self.next = None
+
+    def wants_more(self):
+        return self.max_items is None or self.count < self.max_items
+
+    def add(self, data):
+        """Ajoute une page ; renvoie l'URL de la page suivante s'il en faut encore une"""
+        self.pages += 1
+        if self.total is None and isinstance(data, dict):
+            self.total = data.get("total")
+        items = page_items(data)
+        self.next = page_next(data)
+        if self.max_items is not None and len(items) > self.max_items - self.count:
+            # Page tronquée : son curseur "next" sauterait les éléments écartés
+            items = items[:self.max_items - self.count]
+            self.next = None
+        self.page = items
+        self.count += len(items)
+        if self.results is not None:
+            self.results.extend(items)
+        if not self.wants_more():
+            return None
+        if self.resize and self.next and self.max_items is not None:
+            self.next = with_page_limit(self.next, self.max_items - self.count)
+        return self.next
+
+    def result(self, error=None):
+        result = {"count": self.count, "pages": self.pages, "total": self.total, "next": self.next}
+        if self.results is not None:
+            result = dict(results=self.results, **result)
+        if error is not None:
+            # Erreur en cours de parcours : on renvoie ce qui a déjà été récupéré
+            result["error"] = str(error)
+            if getattr(error, "status_code", None) is not None:
+                result["status_code"] = error.status_code
+        return result
+
+
+# ==== DOSSIER D'APPEL (commun aux deux versions) ====
+# get_call_bundle assemble les tools unitaires (cache, pagination et erreurs
+# compris) ; les messages de chaque étape sont demandés dès que la liste des
+# étapes est connue.
+BUNDLE_PARTS = {
+    "call": ("get_call", {}),
+    "messages": ("get_call_messages", {"all_pages": True}),
+    "stages": ("get_call_stages", {}),
+    "tools": ("get_call_tools", {}),
+}
+
+
+def bundle_stage_ids(stages):
+    return [stage["callStageId"] for stage in page_items(stages)
+            if isinstance(stage, dict) and stage.get("callStageId")]
+
+
+def merge_bundle(call_id, parts, stage_messages):
+    """Document d'un appel ; les parties en échec sont reportées sous la clé errors"""
+    errors = {key: result for key, result in parts.items() if is_error(result)}
+    parts = {key: None if key in errors else result for key, result in parts.items()}
+    stages = None
+    if parts["stages"] is not None:
+        stages = []
+        for stage in page_items(parts["stages"]):
+            messages = stage_messages.get(stage.get("callStageId"))
+            if is_error(messages):
+                errors[f"stages.{stage['callStageId']}.messages"] = messages
+                messages = None
+            stages.append(dict(stage, messages=messages["results"] if messages else None))
+    bundle = {
+        "call_id": call_id,
+        "call": parts["call"],
+        "messages": parts["messages"]["results"] if parts["messages"] else None,
+        "stages": stages,
+        "tools": parts["tools"]["tools"] if parts["tools"] else None,
+    }
+    if errors:
+        bundle["errors"] = errors
+    return bundle
+
+
+def bundle_result(bundles):
+    return {"results": bundles, "count": len(bundles), "failed": sum(1 for bundle in bundles if "errors" in bundle)}
+
+
+# ==== MÉTRIQUES ET REPRISES (commun aux deux versions) ====
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Noms des étiquettes Prometheus ; une clé est une valeur ou un tuple de valeurs
+METRIC_LABELS = {
+    "tool_duration_seconds": ("tool",),
+    "tool_errors": ("tool", "status"),
+    "upstream_duration_seconds": ("method", "endpoint"),
+    "upstream_responses": ("endpoint", "status"),
+    "upstream_in_flight": ("host",),
+    "retries": ("reason",),
+    "retries_exhausted": ("reason",),
+    "rate_limited": ("family",),
+    "rate_limit_wait_seconds": ("family",),
+    "circuit_opened": ("family",),
+    "circuit_closed": ("family",),
+    "circuit_rejected": ("family",),
+    "circuit_state": ("family",),
+}
+
+
+def _prometheus_labels(name, key, extra=()):
+    values = key if isinstance(key, tuple) else (key,)
+    pairs = [] if key == "total" else list(zip(METRIC_LABELS.get(name, ("key",)), values))
+    pairs += list(extra)
+    if not pairs:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{label}="{escape(value)}"' for label, value in pairs) + "}"
+
+
+class Metrics:
+    """Compteurs, jauges et histogrammes de latence du serveur (thread-safe)
+
+    Chaque métrique est indexée par une clé : "total", une valeur d'étiquette
+    ou un tuple de valeurs (voir METRIC_LABELS).
+    """
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.started = time.time()
+        self.buckets = buckets
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self.collectors = {}  # nom -> fonction renvoyant un dict de jauges (pools HTTP...)
+        self._lock = threading.Lock()
+
+    def incr(self, name, key="total", amount=1):
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + amount
+
+    def gauge_add(self, name, key="total", amount=1):
+        with self._lock:
+            gauge = self._gauges.setdefault(name, {})
+            gauge[key] = gauge.get(key, 0) + amount
+
+    def gauge(self, name, key="total"):
+        with self._lock:
+            return self._gauges.get(name, {}).get(key, 0)
+
+    def track(self, name, key="total"):
+        """Jauge incrémentée le temps d'un bloc with (requêtes en vol)"""
+        metrics = self
+
+        class _Tracker:
+            def __enter__(self):
+                metrics.gauge_add(name, key, 1)
+
+            def __exit__(self, *exc_info):
+                metrics.gauge_add(name, key, -1)
+
+        return _Tracker()
+
+    def observe(self, name, key, seconds):
+        with self._lock:
+            histogram = self._histograms.setdefault(name, {}).get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = {
+                    "counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0, "max": 0.0}
+            histogram["counts"][bisect_left(self.buckets, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            histogram["max"] = max(histogram["max"], seconds)
+
+    def _quantile(self, histogram, q):
+        """Quantile q estimé par interpolation dans son bucket (comme histogram_quantile)"""
+        rank = q * histogram["count"]
+        seen, lower = 0, 0.0
+        for bound, count in zip(self.buckets, histogram["counts"]):
+            if count and seen + count >= rank:
+                return min(lower + (bound - lower) * (rank - seen) / count, histogram["max"])
+            seen, lower = seen + count, bound
+        return histogram["max"]
+
+    def _summary(self, histogram):
+        def ms(seconds):
+            return round(seconds * 1000, 2)
+
+        return {"count": histogram["count"], "avg_ms": ms(histogram["sum"] / histogram["count"]),
+                "p50_ms": ms(self._quantile(histogram, 0.5)), "p95_ms": ms(self._quantile(histogram, 0.95)),
+                "p99_ms": ms(self._quantile(histogram, 0.99)), "max_ms": ms(histogram["max"])}
+
+    def snapshot(self):
+        """Vue JSON : compteurs et jauges imbriqués par étiquette, latences résumées (ms)"""
+        def nest(values):
+            result = {}
+            for key, value in values.items():
+                if not isinstance(key, tuple):
+                    result[key] = value
+                    continue
+                node = result
+                for part in key[:-1]:
+                    node = node.setdefault(part, {})
+                node[key[-1]] = value
+            return result
+
+        with self._lock:
+            snapshot = {name: nest(counter) for name, counter in self._counters.items()}
+            snapshot["in_flight"] = {name: nest(gauge) for name, gauge in self._gauges.items()}
+            snapshot["latency"] = {
+                name: {" ".join(key) if isinstance(key, tuple) else key: self._summary(histogram)
+                       for key, histogram in histograms.items()}
+                for name, histograms in self._histograms.items()
+            }
+        return snapshot
+
+    def prometheus(self, prefix="ultravox_mcp", labels=()):
+        """Format texte d'exposition Prometheus (compteurs, jauges, histogrammes cumulés)
+
+        labels : étiquettes ajoutées à chaque série (worker et pid, voir worker_labels)
+        """
+        labels = list(labels)
+        lines = []
+        with self._lock:
+            for name, counter in sorted(self._counters.items()):
+                metric = f"{prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines += [f"{metric}{_prometheus_labels(name, key, labels)} {value}" for key, value in counter.items()]
+            for name, gauge in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines += [f"{prefix}_{name}{_prometheus_labels(name, key, labels)} {value}" for key, value in gauge.items()]
+            for name, histograms in sorted(self._histograms.items()):
+                metric = f"{prefix}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for key, histogram in histograms.items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ("+Inf",), histogram["counts"]):
+                        cumulative += count
+                        bucket_labels = _prometheus_labels(name, key, labels + [("le", bound)])
+                        lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{metric}_sum{_prometheus_labels(name, key, labels)} {histogram['sum']:.6f}")
+                    lines.append(f"{metric}_count{_prometheus_labels(name, key, labels)} {histogram['count']}")
+        return lines
+
+
+server_metrics = Metrics()
+
+
+def retry_after_seconds(headers):
+    """En-tête Retry-After (secondes ou date HTTP), None s'il est absent ou illisible"""
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Quand et combien de temps attendre avant de réessayer une requête
+
+    Seules les méthodes idempotentes sont rejouées. Attente : Retry-After s'il
+    est fourni, sinon backoff exponentiel avec jitter complet ; on abandonne
+    quand le budget total (max_time) serait dépassé.
+    """
+
+    STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, retries=RETRY_MAX, backoff=RETRY_BACKOFF, max_delay=RETRY_MAX_DELAY,
+                 max_time=RETRY_MAX_TIME, methods=RETRY_METHODS):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.max_time = max_time
+        self.methods = {method.strip().upper() for method in methods.split(",") if method.strip()}
+
+    def next_delay(self, method, attempt, started, status=None, headers=None, error=None):
+        """Attente avant l'essai suivant, ou None s'il faut garder ce résultat / cette erreur"""
+        if error is None and status not in self.STATUSES:
+            return None
+        reason = type(error).__name__ if error is not None else str(status)
+        if method.upper() not in self.methods:
+            return None
+        delay = retry_after_seconds(headers)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.backoff * 2 ** attempt))
+        if attempt >= self.retries or time.monotonic() - started + delay > self.max_time:
+            server_metrics.incr("retries_exhausted", reason)
+            return None
+        server_metrics.incr("retries", reason)
+        return delay
+
+    def describe(self):
+        return {"retries": self.retries, "backoff_s": self.backoff, "max_delay_s": self.max_delay,
+                "max_time_s": self.max_time, "methods": sorted(self.methods), "statuses": list(self.STATUSES)}
+
+
+retry_policy = RetryPolicy()
+
+
+def record_tool(name, seconds, result):
+    """Latence d'un tools/call, et son statut quand le résultat est une erreur"""
+    server_metrics.observe("tool_duration_seconds", name, seconds)
+    if is_error(result):
+        server_metrics.incr("tool_errors", (name, str(result.get("status_code", "error"))))
+
+
+def record_upstream(method, host, path, started, outcome):
+    """Latence d'une tentative vers l'amont ; outcome = statut HTTP ou nom de l'exception"""
+    endpoint = endpoint_template(host, path)
+    server_metrics.observe("upstream_duration_seconds", (method, endpoint), time.perf_counter() - started)
+    server_metrics.incr("upstream_responses", (endpoint, str(outcome)))
+
+
+def worker_report():
+    """Processus qui répond : chaque worker a ses propres métriques, seaux et disjoncteurs"""
+    return {"index": WORKER_INDEX, "pid": os.getpid(), "workers": WORKER_PROCESSES}
+
+
+def worker_labels():
+    """Étiquettes Prometheus worker / pid, seulement avec plusieurs workers (sinon aucune)"""
+    if WORKER_PROCESSES <= 1:
+        return []
+    return [("worker", WORKER_INDEX), ("pid", os.getpid())]
+
+
+def server_metrics_report():
+    """Résultat de get_server_metrics"""
+    return dict(server_metrics.snapshot(), uptime_s=round(time.time() - server_metrics.started, 1),
+                worker=worker_report(),
+                retry_policy=retry_policy.describe(), rate_limits=rate_limiter.describe(),
+                circuits=circuit_breakers.states(), cache=response_cache.stats(),
+                **{name: collect() for name, collect in server_metrics.collectors.items()})
+
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def prometheus_text():
+    """Corps de /metrics (text/plain; version=0.0.4)
+
+    Un scrape tombe sur un seul worker : avec plusieurs workers, chaque série porte
+    ses étiquettes worker et pid pour que Prometheus les distingue.
+    """
+    labels = worker_labels()
+    process = _prometheus_labels(None, "total", labels)
+    lines = ["# TYPE ultravox_mcp_uptime_seconds gauge",
+             f"ultravox_mcp_uptime_seconds{process} {time.time() - server_metrics.started:.1f}"]
+    lines += server_metrics.prometheus(labels=labels)
+    cache = response_cache.stats()
+    for name in ("hits", "misses", "revalidated", "evictions", "invalidations"):
+        lines += [f"# TYPE ultravox_mcp_cache_{name}_total counter",
+                  f"ultravox_mcp_cache_{name}_total{process} {cache[name]}"]
+    lines += ["# TYPE ultravox_mcp_cache_entries gauge", f"ultravox_mcp_cache_entries{process} {cache['entries']}"]
+    lines.append("# TYPE ultravox_mcp_circuit_state gauge")
+    lines += [f'ultravox_mcp_circuit_state{_prometheus_labels("circuit_state", family, labels)} {CIRCUIT_STATES[state]}'
+              for family, state in circuit_breakers.states().items()]
+    for name, collect in server_metrics.collectors.items():
+        for gauge, values in collect().items():
+            lines.append(f"# TYPE ultravox_mcp_{name}_{gauge} gauge")
+            lines += [f'ultravox_mcp_{name}_{gauge}{_prometheus_labels(None, "total", [("host", host)] + labels)} {value}'
+                      for host, value in values.items()]
+    return "\n".join(lines) + "\n"
+
+
+def health_report():
+    """Corps de /health : le processus répond (aucun appel réseau)"""
+    return {"status": "ok", "uptime_s": round(time.time() - server_metrics.started, 1), "transport": MCP_TRANSPORT,
+            "pid": os.getpid(), "worker": WORKER_INDEX}
+
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def origin_allowed(origin):
+    """En-tête Origin d'une requête MCP : absent (client hors navigateur), local ou listé dans MCP_ALLOWED_ORIGINS"""
+    if not origin:
+        return True
+    if origin.rstrip("/") in MCP_ALLOWED_ORIGINS:
+        return True
+    try:
+        return urlsplit(origin).hostname in LOCAL_HOSTS
+    except ValueError:
+        return False
+
+
+def readiness_report():
+    """(prêt ?, corps de /ready) : pas prêt tant qu'un disjoncteur de l'API est ouvert"""
+    circuits = circuit_breakers.states()
+    open_circuits = sorted(family for family, state in circuits.items() if state == "open")
+    body = {"status": "unavailable" if open_circuits else "ready", "circuits": circuits,
+            **{name: collect() for name, collect in server_metrics.collectors.items()}}
+    return not open_circuits, body
+
+
+# ==== LIMITATION DE DÉBIT (commun aux deux versions) ====
+class TokenBucket:
+    """Seau à jetons thread-safe : rate jetons/s, jusqu'à burst jetons d'avance
+
+    reserve() prend un jeton et renvoie le temps à attendre avant de s'en servir
+    (time.sleep ou asyncio.sleep selon la version) : les demandes font la queue
+    au lieu d'échouer. rate <= 0 désactive la limite.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+# Familles d'endpoints (premier segment du chemin sous API_BASE)
+ENDPOINT_FAMILIES = {"calls": "calls", "deleted_calls": "calls", "agents": "agents", "webhooks": "webhooks"}
+API_HOST = urlsplit(API_BASE).hostname
+API_PATH = urlsplit(API_BASE).path.rstrip("/")
+
+
+def endpoint_family(path):
+    path = urlsplit(path).path
+    if path.startswith(API_PATH):
+        path = path[len(API_PATH):]
+    return ENDPOINT_FAMILIES.get(path.strip("/").split("/")[0])
+
+
+# Gabarits de chemins des tools ("/calls/{call_id}/messages") : étiquette bornée pour les métriques
+ENDPOINT_TEMPLATES = sorted({spec["path"] for spec in TOOLS.values() if spec.get("path")})
+_ENDPOINT_PATTERNS = [
+    (re.compile("^" + re.sub(r"\\\{[^}]+\\\}", "[^/]+", re.escape(template)) + "$"), template)
+    for template in ENDPOINT_TEMPLATES
+]
+
+
+def endpoint_template(host, path):
+    """Gabarit du chemin appelé ; "storage" hors de l'API (enregistrements), "other" si inconnu"""
+    if host != API_HOST:
+        return "storage"
+    path = urlsplit(path).path
+    if path.startswith(API_PATH):
+        path = path[len(API_PATH):]
+    path = "/" + path.strip("/")
+    for pattern, template in _ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return template
+    return "other"
+
+
+class RateLimiter:
+    """Seau global + un seau par famille ; seules les requêtes vers l'API comptent
+
+    Les seaux sont propres au processus : avec plusieurs workers, chacun reçoit
+    1/workers des débits et de la rafale configurés.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, families=RATE_LIMIT_FAMILIES, burst=RATE_LIMIT_BURST, workers=WORKER_PROCESSES):
+        burst = burst / workers or None
+        self.bucket = TokenBucket(rate / workers, burst)
+        self.families = {family: TokenBucket(family_rate / workers, burst) for family, family_rate in families.items()}
+
+    def reserve(self, host, path):
+        """Attente (s) avant d'envoyer la requête ; 0 si aucune limite ne s'applique"""
+        if host != API_HOST:
+            return 0.0
+        family = endpoint_family(path)
+        delay = self.bucket.reserve()
+        if family in self.families:
+            delay = max(delay, self.families[family].reserve())
+        if delay > 0:
+            server_metrics.incr("rate_limited", family or "other")
+            server_metrics.incr("rate_limit_wait_seconds", family or "other", delay)
+        return delay
+
+    def describe(self):
+        return dict({"global": self.bucket.rate}, **{family: bucket.rate for family, bucket in self.families.items()})
+
+
+rate_limiter = RateLimiter()
+
+
+# ==== DISJONCTEURS (commun aux deux versions) ====
+class CircuitOpenError(Exception):
+    """Requête refusée sans appel réseau : le disjoncteur de la famille est ouvert"""
+
+    status_code = 503
+
+    def __init__(self, family, retry_in):
+        super().__init__(f"API Ultravox indisponible ({family}) : circuit ouvert, "
+                         f"nouvel essai dans {retry_in:.0f} s")
+        self.family = family
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """fermé -> ouvert après threshold échecs consécutifs -> semi-ouvert après cooldown
+
+    En semi-ouvert une seule requête d'essai passe : succès = fermé, échec = rouvert.
+    """
+
+    def __init__(self, family, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.family = family
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def before(self):
+        """Lève CircuitOpenError si la requête ne doit pas partir"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            retry_in = self.opened_at + self.cooldown - time.monotonic()
+            if retry_in > 0 or self.probing:
+                server_metrics.incr("circuit_rejected", self.family)
+                raise CircuitOpenError(self.family, max(retry_in, 0.0))
+            self.probing = True
+
+    def record(self, ok):
+        """Issue d'une requête : True, False, ou None si elle a été abandonnée (annulation)"""
+        with self._lock:
+            self.probing = False
+            if ok is None:
+                return
+            if ok:
+                if self.opened_at is not None:
+                    server_metrics.incr("circuit_closed", self.family)
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    server_metrics.incr("circuit_opened", self.family)
+                self.opened_at = time.monotonic()
+
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.probing or time.monotonic() - self.opened_at >= self.cooldown:
+                return "half_open"
+            return "open"
+
+
+class CircuitBreakers:
+    """Un disjoncteur par famille d'endpoints de l'API ("other" pour le reste)"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        families = sorted(set(ENDPOINT_FAMILIES.values())) + ["other"]
+        self.breakers = {family: CircuitBreaker(family, threshold, cooldown) for family in families}
+        self.enabled = threshold > 0
+
+    def get(self, host, path):
+        """Disjoncteur de la requête, None hors API (stockage des enregistrements) ou si désactivé"""
+        if not self.enabled or host != API_HOST:
+            return None
+        return self.breakers[endpoint_family(path) or "other"]
+
+    def states(self):
+        return {family: breaker.state() for family, breaker in self.breakers.items()}
+
+
+circuit_breakers = CircuitBreakers()
+
+
+def circuit_open_result(error, spec, values, path, params):
+    """Erreur immédiate quand le circuit est ouvert, avec la dernière réponse en cache si elle existe
+
+    L'entrée est servie même expirée, y compris pour les endpoints à ttl seul.
+    """
+    result = {"error": str(error), "status_code": error.status_code, "circuit": error.family,
+              "retry_in_s": round(error.retry_in, 1)}
+    stale = cache_stale(spec, path, params)
+    if stale is not None:
+        result["cached"] = tool_result(spec, values, 200, stale["raw"], stale["data"])
+    return result
+
+
+# ==== COALESCENCE DES GET (commun aux deux versions) ====
+# Des GET identiques lancés en même temps partagent une seule requête réseau ;
+# la clé inclut les en-têtes conditionnels pour qu'un 304 ne soit jamais servi
+# à un appelant qui n'avait pas d'entrée en cache.
+def flight_key(url, headers, follow_redirects):
+    headers = headers or {}
+    return (str(url), headers.get("If-None-Match"), headers.get("If-Modified-Since"), follow_redirects)
+
+
+class SingleFlight:
+    """Version threads : le premier appelant exécute fn(), les suivants attendent son résultat"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        from concurrent.futures import Future  # pas importé au chargement (démarrage rapide stdio)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            server_metrics.incr("coalesced")
+            return call.result()
+        try:
+            result = fn()
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """Version asyncio : une tâche par clé, partagée (et protégée des annulations) entre appelants"""
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, fn):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            server_metrics.incr("coalesced")
+        return await asyncio.shield(task)
+
+
+# ==== SUPPRESSIONS EN MASSE (commun aux deux versions) ====
+# Chaque suppression passe par le tool unitaire (invalidation du cache comprise) ;
+# le seau est partagé par toutes les suppressions en masse en cours du processus,
+# et le débit réparti entre les workers.
+BULK_DELETES = {
+    "bulk_delete_calls": ("delete_call", "call_id", "call_ids"),
+    "bulk_delete_agents": ("delete_agent", "agent_id", "agent_ids"),
+    "bulk_delete_webhooks": ("delete_webhook", "webhook_id", "webhook_ids"),
+}
+CALL_FILTERS = ("agent_id", "end_reason", "created_before", "created_after")
+BULK_SCAN_PAGE_SIZE = 100
+
+bulk_delete_bucket = TokenBucket(BULK_DELETE_RATE / WORKER_PROCESSES)
+
+
+def bulk_request(name, arguments):
+    """(tool unitaire, argument d'id, ids ou None s'il faut filtrer list_calls, critères, valeurs)"""
+    tool, id_arg, ids_arg = BULK_DELETES[name]
+    values = dict(TOOLS[name]["defaults"])
+    values.update({k: v for k, v in (arguments or {}).items() if v is not None})
+    criteria = {k: values[k] for k in CALL_FILTERS if values.get(k)} if name == "bulk_delete_calls" else {}
+    if values.get(ids_arg) and criteria:
+        raise ValueError(f"{ids_arg} et filtre sont exclusifs")
+    if not criteria:
+        return tool, id_arg, id_list(values.get(ids_arg), ids_arg), criteria, values
+    return tool, id_arg, None, criteria, values
+
+
+def call_matches(call, criteria):
+    """Filtre de bulk_delete_calls (dates ISO 8601 comparées comme chaînes)"""
+    created = call.get("created") or ""
+    return (criteria.get("agent_id") in (None, call.get("agentId"))
+            and criteria.get("end_reason") in (None, call.get("endReason"))
+            and created < criteria.get("created_before", "~")
+            and created >= criteria.get("created_after", ""))
+
+
+def bulk_report(ids, results, dry_run, elapsed=0.0):
+    if dry_run:
+        return {"dry_run": True, "count": len(ids), "ids": ids,
+                "message": f"{len(ids)} suppression(s) simulée(s) ; relancer avec dry_run=false"}
+    failed = sum(1 for result in results.values() if is_error(result))
+    return {"dry_run": False, "requested": len(ids), "deleted": len(ids) - failed, "failed": failed,
+            "results": results, "elapsed_s": round(elapsed, 3)}
+
+
+# ==== ENREGISTREMENTS (commun aux deux versions) ====
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+def api_headers_for(url, headers):
+    """La clé API n'est envoyée qu'à l'API Ultravox, jamais à l'URL signée du stockage"""
+    if urlsplit(url).netloc == urlsplit(API_BASE).netloc:
+        return headers
+    return {k: v for k, v in headers.items() if k.lower() != "x-api-key"}
+
+
+def recording_info(status, headers):
+    """Taille et type d'un enregistrement d'après les en-têtes (HEAD ou GET Range)"""
+    size = None
+    content_range = headers.get("content-range") or ""
+    if status == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        size = int(total) if total.isdigit() else None
+    elif headers.get("content-length", "").isdigit():
+        size = int(headers.get("content-length"))
+    return {"content_type": headers.get("content-type"), "size": size}
+
+
+def recording_path(call_id, filename, content_type):
+    """Chemin de destination dans RECORDINGS_DIR (jamais en dehors)"""
+    if not filename:
+        extension = {"audio/wav": ".wav", "audio/x-wav": ".wav", "audio/mpeg": ".mp3",
+                     "audio/ogg": ".ogg"}.get((content_type or "").split(";")[0], ".wav")
+        filename = f"{call_id}{extension}"
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    return os.path.join(RECORDINGS_DIR, os.path.basename(filename))
+
+
+def download_report(call_id, path, written, elapsed):
+    return {
+        "success": True,
+        "call_id": call_id,
+        "path": path,
+        "bytes": written,
+        "seconds": round(elapsed, 3),
+        "bytes_per_second": int(written / elapsed) if elapsed > 0 else None,
+    }
+
+
+DOWNLOAD_CHUNK_SIZE = TOOLS["download_call_recording"]["defaults"]["chunk_size"]
+DOWNLOAD_CHUNK_RANGE = (4096, 4 * 1024 * 1024)  # bornes de chunk_size (octets)
+
+
+def download_chunk_size(value):
+    """chunk_size ramené dans DOWNLOAD_CHUNK_RANGE ; absent, nul ou négatif = taille par défaut"""
+    if not value or value <= 0:
+        return DOWNLOAD_CHUNK_SIZE
+    low, high = DOWNLOAD_CHUNK_RANGE
+    return min(max(value, low), high)
+
+
+def remove_partial(part_path):
+    """Supprime le .part d'un téléchargement interrompu (erreur réseau, disque, annulation)"""
+    try:
+        os.remove(part_path)
+    except FileNotFoundError:
+        pass
+
+
+# ==== CACHE DES RÉPONSES (commun aux deux versions) ====
+class TTLCache:
+    """Cache LRU borné, avec une durée de vie par entrée (thread-safe)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # clé -> (expiration, valeur)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.revalidated = 0  # réponses 304 servies depuis le cache
+
+    def get(self, key):
+        """Valeur encore fraîche, ou None (une entrée expirée reste revalidable)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, key):
+        """Valeur même expirée (pour un GET conditionnel), ou None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, prefix):
+        """Supprime l'entrée prefix et toutes celles des chemins en dessous"""
+        with self._lock:
+            stale = [key for key in self._entries
+                     if key == prefix or key.startswith(prefix + "/") or key.startswith(prefix + "?")]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def revalidate(self, key, value, ttl):
+        """Réponse 304 : la valeur en cache repart pour un ttl complet"""
+        self.set(key, value, ttl)
+        with self._lock:
+            self.revalidated += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": CACHE_ENABLED,
+                "backend": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+                "revalidated": self.revalidated,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class SQLiteCache(TTLCache):
+    """Même interface que TTLCache, stockée dans SQLite (WAL) : partagée par les workers
+
+    Seul le corps brut est stocké ; chaque lecture le re-décode. Les expirations
+    sont en temps mural (comparables entre processus), l'éviction se fait sur la
+    date d'écriture. Les compteurs hits / misses restent propres au processus.
+    """
+
+    def __init__(self, max_entries, path=CACHE_PATH):
+        super().__init__(max_entries)
+        self.path = path
+        self._db = None
+        self._pid = None
+
+    def _conn(self):
+        # Une connexion par processus, ouverte après le fork (appelé sous self._lock)
+        if self._pid != os.getpid():
+            import sqlite3
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, written REAL,"
+                             " raw BLOB, etag TEXT, last_modified TEXT)")
+            self._pid = os.getpid()
+        return self._db
+
+    def _read(self, key, fresh_only):
+        with self._lock:
+            row = self._conn().execute("SELECT expires, raw, etag, last_modified FROM cache WHERE key = ?",
+                                       (key,)).fetchone()
+        if row is None or (fresh_only and row[0] <= time.time()):
+            return None
+        return {"raw": row[1], "data": json_loads(row[1]), "etag": row[2], "last_modified": row[3]}
+
+    def get(self, key):
+        entry = self._read(key, fresh_only=True)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def get_stale(self, key):
+        return self._read(key, fresh_only=False)
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                       (key, now + ttl, now, bytes(value["raw"]), value["etag"], value["last_modified"]))
+            evicted = db.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY written DESC"
+                                 " LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+            self.evictions += max(evicted, 0)
+
+    def invalidate(self, prefix):
+        with self._lock:
+            self.invalidations += self._conn().execute(
+                "DELETE FROM cache WHERE key = ? OR substr(key, 1, ?) IN (?, ?)",
+                (prefix, len(prefix) + 1, prefix + "/", prefix + "?")).rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn().execute("DELETE FROM cache")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn().execute("SELECT count(*) FROM cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "enabled": CACHE_ENABLED,
+                "backend": "sqlite",
+                "path": self.path,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+                "revalidated": self.revalidated,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+response_cache = SQLiteCache(CACHE_MAX_ENTRIES) if CACHE_BACKEND == "sqlite" else TTLCache(CACHE_MAX_ENTRIES)
+
+
+def cache_key(path, params):
+    return path + ("?" + urlencode(sorted(params.items())) if params else "")
+
+
+def cache_lookup(spec, path, params):
+    """(entrée fraîche, entrée expirée à revalider) en cache pour cette requête
+
+    Une entrée est un dict {"raw", "data", "etag", "last_modified"} : le corps
+    décodé est conservé pour ne pas re-parser la réponse à chaque hit ou 304.
+    """
+    if not (CACHE_ENABLED and (spec["ttl"] or spec["revalidate"])):
+        return None, None
+    key = cache_key(path, params)
+    fresh = response_cache.get(key)
+    if fresh is not None or not spec["revalidate"]:
+        return fresh, None
+    return None, response_cache.get_stale(key)
+
+
+def cache_stale(spec, path, params):
+    """Dernière réponse en cache pour cette requête, même expirée, ou None"""
+    if not (CACHE_ENABLED and (spec["ttl"] or spec["revalidate"])):
+        return None
+    return response_cache.get_stale(cache_key(path, params))
+
+
+def conditional_headers(entry):
+    """En-têtes If-None-Match / If-Modified-Since pour revalider une entrée"""
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def cache_revalidated(spec, path, params, entry):
+    """Réponse 304 : l'entrée en cache repart pour un ttl complet"""
+    response_cache.revalidate(cache_key(path, params), entry, spec["ttl"])
+    return entry
+
+
+def cache_store(spec, values, path, params, status, raw, headers):
+    """Met en cache une réponse réussie et purge ce que le tool a modifié
+
+    Renvoie l'entrée créée (corps décodé inclus), ou None si rien n'est mis en cache.
+    """
+    if status not in spec["ok"]:
+        if status == 404:
+            response_cache.invalidate(cache_key(path, params))
+        return None
+    for prefix in spec["invalidates"]:
+        response_cache.invalidate(prefix.format(**{k: quote(str(v), safe="") for k, v in values.items()}))
+    if not (CACHE_ENABLED and status == 200 and raw):
+        return None
+    etag = headers.get("etag") if spec["revalidate"] else None
+    last_modified = headers.get("last-modified") if spec["revalidate"] else None
+    if not (spec["ttl"] or etag or last_modified):
+        return None
+    entry = {"raw": raw, "data": json_loads(raw), "etag": etag, "last_modified": last_modified}
+    response_cache.set(cache_key(path, params), entry, spec["ttl"])
+    return entry
+
+
+# ==== ARCHIVE DES APPELS (commun aux deux versions) ====
+ARCHIVE_PAGE_SIZE = 100
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    call_id TEXT PRIMARY KEY, agent_id TEXT, created TEXT, ended TEXT, end_reason TEXT,
+    duration_s REAL, data TEXT NOT NULL, details_synced INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS calls_agent_created ON calls (agent_id, created);
+CREATE INDEX IF NOT EXISTS calls_created ON calls (created);
+CREATE INDEX IF NOT EXISTS calls_end_reason ON calls (end_reason, created);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY, call_id TEXT NOT NULL, idx INTEGER NOT NULL, stage_id TEXT, role TEXT, text TEXT,
+    data TEXT NOT NULL, UNIQUE (call_id, idx));
+CREATE VIRTUAL TABLE IF NOT EXISTS transcripts USING fts5 (
+    text, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO transcripts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO transcripts (transcripts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TABLE IF NOT EXISTS stages (
+    call_id TEXT NOT NULL, stage_id TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (call_id, stage_id));
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _timestamp(value):
+    """Horodatage ISO 8601 de l'API -> secondes epoch (None si absent ou illisible)"""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def _call_duration(call):
+    """Durée d'un appel terminé en secondes (depuis joined, sinon created), ou None"""
+    started = _timestamp(call.get("joined")) or _timestamp(call.get("created"))
+    ended = _timestamp(call.get("ended"))
+    return round(ended - started, 3) if started is not None and ended is not None else None
+
+
+def _message_stages(messages, stages, stage_messages):
+    """Étape de chaque message de /calls/{id}/messages
+
+    Un appel à une seule étape n'a pas besoin de ses messages d'étape. Sinon les
+    messages de /calls/{id}/stages/{id}/messages sont rapprochés, dans l'ordre,
+    des messages de l'appel par (role, text).
+    """
+    if len(stages) == 1:
+        return [stages[0].get("callStageId")] * len(messages)
+    queues = {}
+    for stage_id, items in stage_messages.items():
+        for message in items:
+            queues.setdefault((message.get("role"), message.get("text")), []).append(stage_id)
+    for queue in queues.values():
+        queue.reverse()
+    return [(queues.get((message.get("role"), message.get("text"))) or [None]).pop() for message in messages]
+
+
+def transcript_query(text):
+    """Recherche utilisateur -> requête FTS5 : mots tous requis, "phrase exacte", préfixe*
+
+    Chaque terme est mis entre guillemets : la ponctuation (apostrophes, tirets)
+    ne peut pas produire une erreur de syntaxe FTS5.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        term = phrase or word.rstrip("*")
+        if term.strip():
+            terms.append('"' + term + '"' + ("*" if word.endswith("*") else ""))
+    return " ".join(terms)
+
+
+class CallArchive:
+    """Appels, messages et étapes archivés dans SQLite (WAL), interrogeables sans réseau
+
+    Le filigrane "newest" (created le plus récent archivé) borne les synchros
+    suivantes ; "backfill" garde le curseur de l'historique restant à rattraper.
+    Une connexion par processus (workers), partagée par ses threads sous verrou.
+    """
+
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _conn(self):
+        if self._pid != os.getpid():
+            import sqlite3
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(ARCHIVE_SCHEMA)
+            self._pid = os.getpid()
+        return self._db
+
+    def state(self):
+        with self._lock:
+            rows = self._conn().execute("SELECT key, value FROM sync_state").fetchall()
+        return {key: json_loads(value) for key, value in rows}
+
+    def save_state(self, **values):
+        with self._lock, self._conn() as db:
+            db.executemany("INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+                           [(key, json_dumps(value)) for key, value in values.items()])
+
+    def store_calls(self, calls):
+        """Insère / met à jour des appels ; renvoie le nombre d'appels nouveaux"""
+        rows = [(call["callId"], call.get("agentId"), call.get("created"), call.get("ended"), call.get("endReason"),
+                 _call_duration(call), json_dumps(call)) for call in calls]
+        with self._lock, self._conn() as db:
+            known = {row[0] for row in db.execute(
+                f"SELECT call_id FROM calls WHERE call_id IN ({','.join('?' * len(rows))})",
+                [row[0] for row in rows])} if rows else set()
+            # Détails à (re)prendre quand l'appel se termine après avoir été archivé en cours
+            db.executemany(
+                "INSERT INTO calls (call_id, agent_id, created, ended, end_reason, duration_s, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (call_id) DO UPDATE SET agent_id = excluded.agent_id,"
+                " created = excluded.created, end_reason = excluded.end_reason, duration_s = excluded.duration_s,"
+                " data = excluded.data, details_synced = CASE WHEN calls.ended IS excluded.ended"
+                " THEN calls.details_synced ELSE 0 END, ended = excluded.ended", rows)
+        return len({row[0] for row in rows} - known)
+
+    def store_details(self, call_id, messages, stages, stage_messages=None):
+        """Remplace messages et étapes d'un appel ; l'index plein texte suit (triggers)"""
+        stage_ids = _message_stages(messages, stages, stage_messages or {})
+        with self._lock, self._conn() as db:
+            db.execute("DELETE FROM messages WHERE call_id = ?", (call_id,))
+            db.execute("DELETE FROM stages WHERE call_id = ?", (call_id,))
+            db.executemany("INSERT INTO messages (call_id, idx, stage_id, role, text, data) VALUES (?, ?, ?, ?, ?, ?)",
+                           [(call_id, index, stage_id, message.get("role"), message.get("text"), json_dumps(message))
+                            for index, (message, stage_id) in enumerate(zip(messages, stage_ids))])
+            db.executemany("INSERT INTO stages VALUES (?, ?, ?)",
+                           [(call_id, stage.get("callStageId"), json_dumps(stage)) for stage in stages])
+            db.execute("UPDATE calls SET details_synced = 1 WHERE call_id = ?", (call_id,))
+
+    def ids_needing_details(self, limit):
+        with self._lock:
+            return [row[0] for row in self._conn().execute(
+                "SELECT call_id FROM calls WHERE ended IS NOT NULL AND details_synced = 0"
+                " ORDER BY created DESC LIMIT ?", (limit,))]
+
+    def pending_ids(self, limit=100):
+        """Appels archivés avant leur fin, à relire"""
+        with self._lock:
+            return [row[0] for row in self._conn().execute(
+                "SELECT call_id FROM calls WHERE ended IS NULL ORDER BY created DESC LIMIT ?", (limit,))]
+
+    @staticmethod
+    def _where(agent_id=None, end_reason=None, created_after=None, created_before=None):
+        clauses, params = [], []
+        for column, operator, value in (("agent_id", "=", agent_id), ("end_reason", "=", end_reason),
+                                        ("created", ">=", created_after), ("created", "<", created_before)):
+            if value:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def query(self, agent_id=None, end_reason=None, created_after=None, created_before=None, limit=50, offset=0):
+        where, params = self._where(agent_id, end_reason, created_after, created_before)
+        with self._lock:
+            db = self._conn()
+            total = db.execute(f"SELECT count(*) FROM calls{where}", params).fetchone()[0]
+            rows = db.execute(f"SELECT data FROM calls{where} ORDER BY created DESC LIMIT ? OFFSET ?",
+                              params + [limit, offset]).fetchall()
+        results = [json_loads(row[0]) for row in rows]
+        return {"results": results, "count": len(results), "total": total,
+                "next_offset": offset + len(results) if offset + len(results) < total else None}
+
+    def get(self, call_id):
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT data FROM calls WHERE call_id = ?", (call_id,)).fetchone()
+            if row is None:
+                return None
+            messages = db.execute("SELECT data FROM messages WHERE call_id = ? ORDER BY idx", (call_id,)).fetchall()
+            stages = db.execute("SELECT data FROM stages WHERE call_id = ?", (call_id,)).fetchall()
+        return {"call": json_loads(row[0]), "messages": [json_loads(m[0]) for m in messages],
+                "stages": [json_loads(stage[0]) for stage in stages]}
+
+    def search(self, query, agent_id=None, since=None, limit=20):
+        """Appels dont la transcription correspond, du plus pertinent au moins pertinent (bm25)
+
+        Le score d'un appel est celui de son meilleur message ; l'extrait vient
+        de ce message. Les extraits ne sont calculés que pour les appels renvoyés.
+        """
+        clauses, params = [], [query]
+        for column, operator, value in (("agent_id", "=", agent_id), ("created", ">=", since)):
+            if value:
+                clauses.append(f"c.{column} {operator} ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            db = self._conn()
+            ranked = db.execute(
+                "SELECT m.call_id, c.agent_id, c.created, min(t.rank) AS score, count(*)"
+                " FROM (SELECT rowid, rank FROM transcripts WHERE transcripts MATCH ?) AS t"
+                " JOIN messages AS m ON m.id = t.rowid JOIN calls AS c ON c.call_id = m.call_id"
+                f"{where} GROUP BY m.call_id ORDER BY score LIMIT ?", params + [limit]).fetchall()
+            snippets = {}
+            if ranked:
+                for call_id, stage_id, role, snippet in db.execute(
+                        "SELECT m.call_id, m.stage_id, m.role, snippet(transcripts, 0, '[', ']', '…', 12)"
+                        " FROM transcripts JOIN messages AS m ON m.id = transcripts.rowid"
+                        f" WHERE transcripts MATCH ? AND m.call_id IN ({','.join('?' * len(ranked))})"
+                        " ORDER BY rank", [query] + [row[0] for row in ranked]):
+                    snippets.setdefault(call_id, {"snippet": snippet, "role": role, "stage_id": stage_id})
+        return [{"call_id": call_id, "agent_id": agent, "created": created, "score": round(-score, 4),
+                 "matches": matches, **snippets.get(call_id, {})}
+                for call_id, agent, created, score, matches in ranked]
+
+    def aggregate(self, columns, agent_id=None, since=None, until=None):
+        """(clé de groupe, appels, appels avec durée, somme des durées), calculés par SQLite"""
+        where, params = self._where(agent_id, created_after=since, created_before=until)
+        group = f" GROUP BY {', '.join(columns)}" if columns else ""
+        with self._lock:
+            rows = self._conn().execute(
+                f"SELECT {''.join(column + ', ' for column in columns)}count(*), count(duration_s), total(duration_s)"
+                f" FROM calls{where}{group}", params).fetchall()
+        return [(tuple(row[:len(columns)]), *row[len(columns):]) for row in rows if row[-3]]
+
+    def call_ids(self, agent_id=None, since=None, until=None, limit=1000):
+        where, params = self._where(agent_id, created_after=since, created_before=until)
+        with self._lock:
+            return [row[0] for row in self._conn().execute(
+                f"SELECT call_id FROM calls{where} ORDER BY created DESC LIMIT ?", params + [limit])]
+
+    def counts(self):
+        with self._lock:
+            db = self._conn()
+            return {table: db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                    for table in ("calls", "messages", "stages")}
+
+
+call_archive = CallArchive()
+
+
+class ArchiveSync:
+    """Déroulé d'une synchro : pages de /calls (récentes d'abord) -> archive
+
+    Phase "head" : les appels créés depuis le filigrane, jusqu'au premier plus
+    ancien (sans limite : c'est le trafic depuis la dernière synchro). À la
+    première synchro, la phase head est aussi le rattrapage de l'historique.
+    Phase "backfill" : reprend au curseur sauvegardé, jusqu'à max_calls appels
+    par synchro ; le curseur suivant est gardé pour la fois d'après.
+    """
+
+    def __init__(self, archive, max_calls):
+        self.archive = archive
+        self.started = time.monotonic()
+        state = archive.state()
+        self.watermark = state.get("newest")
+        self.newest = self.watermark
+        self.backfill = state.get("backfill")
+        self.first_run = self.watermark is None
+        self.max_calls = max_calls
+        self.scanned = 0
+        self.new_calls = 0
+        self.updated = 0
+        self.detailed = 0
+        self.errors = []
+
+    def _store(self, calls):
+        if calls:
+            new = self.archive.store_calls(calls)
+            self.new_calls += new
+            self.updated += len(calls) - new
+            self.newest = max([self.newest or ""] + [call.get("created") or "" for call in calls]) or None
+
+    def _budget_left(self, items, next_url):
+        self.scanned += len(items)
+        self.backfill = next_url
+        return self.scanned < self.max_calls
+
+    def head_pages(self):
+        """(paramètres de la première page, max_items) : à la première synchro, jamais plus de max_calls appels"""
+        if self.first_run:
+            return {"limit": max(1, min(ARCHIVE_PAGE_SIZE, self.max_calls))}, self.max_calls
+        return {"limit": ARCHIVE_PAGE_SIZE}, None
+
+    def head_page(self, items, next_url):
+        """Range une page de la phase head ; False pour arrêter de paginer"""
+        if self.first_run:
+            self._store(items)
+            return self._budget_left(items, next_url)
+        fresh = [call for call in items if (call.get("created") or "") >= self.watermark]
+        self._store(fresh)
+        return len(fresh) == len(items)
+
+    def backfill_url(self):
+        """Curseur où reprendre l'historique, ou None (déjà fait ou budget épuisé)"""
+        if self.first_run or self.scanned >= self.max_calls or not self.backfill:
+            return None
+        return with_page_limit(self.backfill, self.max_calls - self.scanned)
+
+    def backfill_page(self, items, next_url):
+        self._store(items)
+        return self._budget_left(items, next_url)
+
+    def refresh(self, calls):
+        """Appels en cours relus par get_call (les erreurs sont ignorées : ils seront relus)"""
+        self._store([call for call in calls if isinstance(call, dict) and not is_error(call)])
+
+    @staticmethod
+    def stage_ids(stages):
+        """Étapes dont lire les messages (seulement pour les appels à plusieurs étapes)"""
+        items = [] if is_error(stages) else stages.get("results") or []
+        return [stage.get("callStageId") for stage in items] if len(items) > 1 else []
+
+    def add_details(self, call_id, messages, stages, stage_messages=None):
+        """messages / stages / stage_messages : résultats de tools (dict avec results, ou erreur)"""
+        stage_messages = stage_messages or {}
+        failed = next((part for part in (messages, stages, *stage_messages.values()) if is_error(part)), None)
+        if failed is not None:
+            self.errors.append({"call_id": call_id, **failed})
+            return
+        self.archive.store_details(call_id, messages.get("results") or [], stages.get("results") or [],
+                                   {stage_id: part.get("results") or [] for stage_id, part in stage_messages.items()})
+        self.detailed += 1
+
+    def result(self, error=None):
+        self.archive.save_state(newest=self.newest, backfill=self.backfill, synced_at=time.time())
+        result = {"new_calls": self.new_calls, "updated_calls": self.updated, "detailed_calls": self.detailed,
+                  "newest": self.newest, "history_pending": self.backfill is not None,
+                  "archive": self.archive.counts(), "path": self.archive.path,
+                  "elapsed_s": round(time.monotonic() - self.started, 3)}
+        if self.errors:
+            result["errors"] = self.errors[:20]
+        if error is not None:
+            result["error"] = str(error)
+            result["status_code"] = getattr(error, "status_code", None)
+        return result
+
+
+def archive_missing():
+    return {"error": f"Archive absente ({call_archive.path}) : lancer sync_call_archive", "status_code": 404}
+
+
+def archive_query_result(arguments):
+    """Résultat de query_call_archive (commun aux deux versions)"""
+    if not call_archive.exists():
+        return archive_missing()
+    values = tool_values("query_call_archive", arguments)
+    return call_archive.query(values.get("agent_id"), values.get("end_reason"), values.get("created_after"),
+                              values.get("created_before"), min(max(values["limit"], 1), 500), values["offset"])
+
+
+def archived_call_result(arguments):
+    """Résultat de get_archived_call (commun aux deux versions)"""
+    try:
+        values = tool_values("get_archived_call", arguments)
+    except ValueError as e:
+        return {"error": str(e)}
+    if not call_archive.exists():
+        return archive_missing()
+    return call_archive.get(values["call_id"]) or {"error": "Appel absent de l'archive", "status_code": 404}
+
+
+def transcript_search_result(arguments):
+    """Résultat de search_transcripts (commun aux deux versions)"""
+    try:
+        values = tool_values("search_transcripts", arguments)
+    except ValueError as e:
+        return {"error": str(e)}
+    if not call_archive.exists():
+        return archive_missing()
+    query = transcript_query(values["query"])
+    if not query:
+        return {"error": "Recherche vide"}
+    started = time.perf_counter()
+    import sqlite3
+    try:
+        results = call_archive.search(query, values.get("agent_id"), values.get("since"),
+                                      min(max(values["limit"], 1), 200))
+    except sqlite3.OperationalError as e:
+        return {"error": f"Recherche invalide : {e}"}
+    return {"results": results, "count": len(results), "query": query,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+# ==== STATISTIQUES D'APPELS (commun aux deux versions) ====
+STATS_GROUPS = {  # critère de group_by -> (colonne de l'archive, valeur lue sur un appel de l'API)
+    "agent": ("agent_id", lambda call: call.get("agentId")),
+    "day": ("substr(created, 1, 10)", lambda call: (call.get("created") or "")[:10] or None),
+    "end_reason": ("end_reason", lambda call: call.get("endReason")),
+}
+
+
+class CallStats:
+    """Agrégats de call_stats : par groupe (appels, durée moyenne et totale), raisons de fin, tools
+
+    Source "archive" : les agrégats sont calculés par SQLite (GROUP BY). Source
+    "api" : list_calls est parcouru page par page (récents d'abord, arrêt au
+    premier appel antérieur à since) et chaque page est agrégée d'un bloc, sans
+    garder les appels. Les tools (get_call_tools) sont comptés sur au plus
+    max_calls appels.
+    """
+
+    def __init__(self, arguments):
+        values = tool_values("call_stats", arguments)
+        self.group_by = [key.strip() for key in (values["group_by"] or "").split(",") if key.strip()]
+        unknown = [key for key in self.group_by if key not in STATS_GROUPS]
+        if unknown:
+            raise ValueError(f"group_by inconnu : {', '.join(unknown)} (possibles : {', '.join(STATS_GROUPS)})")
+        if values["source"] not in ("auto", "archive", "api"):
+            raise ValueError("source : auto, archive ou api")
+        self.source = values["source"]
+        if self.source == "auto":
+            self.source = "archive" if call_archive.exists() else "api"
+        self.agent_id, self.since, self.until = values.get("agent_id"), values.get("since"), values.get("until")
+        self.with_tools, self.max_calls = values["tools"], values["max_calls"]
+        self.started = time.monotonic()
+        self.groups = {}       # clé -> [appels, appels avec durée, somme des durées]
+        self.end_reasons = {}
+        self.tools = {}
+        self.call_ids = []
+        self.tool_errors = 0
+        self.counted = 0
+        self.truncated = False
+
+    def load_archive(self, archive):
+        for key, calls, timed, total in archive.aggregate([STATS_GROUPS[key][0] for key in self.group_by],
+                                                          self.agent_id, self.since, self.until):
+            self.groups[key] = [calls, timed, total]
+        for (reason,), calls, _, _ in archive.aggregate(["end_reason"], self.agent_id, self.since, self.until):
+            self.end_reasons[reason] = calls
+        if self.with_tools:
+            self.call_ids = archive.call_ids(self.agent_id, self.since, self.until, self.max_calls)
+
+    def api_pages(self):
+        """(paramètres de la première page de /calls, max_items) : sans filtre agent_id / until,
+        chaque appel lu est compté et il n'en faut pas plus de max_calls"""
+        if self.agent_id or self.until:
+            return {"limit": ARCHIVE_PAGE_SIZE}, None
+        return {"limit": max(1, min(ARCHIVE_PAGE_SIZE, self.max_calls))}, self.max_calls
+
+    def add_page(self, items, next_url=None):
+        """Agrège une page de list_calls ; False pour arrêter de paginer"""
+        before_since = self.since and any((call.get("created") or "") < self.since for call in items)
+        calls = [call for call in items
+                 if (not self.since or (call.get("created") or "") >= self.since)
+                 and (not self.until or (call.get("created") or "") < self.until)
+                 and self.agent_id in (None, call.get("agentId"))]
+        self.truncated = len(calls) > self.max_calls - self.counted or (
+            self.counted + len(calls) == self.max_calls and next_url is not None and not before_since)
+        calls = calls[:self.max_calls - self.counted]
+        self.counted += len(calls)
+        readers = [STATS_GROUPS[key][1] for key in self.group_by]
+        for call in calls:
+            key = tuple(read(call) for read in readers)
+            duration = _call_duration(call)
+            group = self.groups.setdefault(key, [0, 0, 0.0])
+            group[0] += 1
+            if duration is not None:
+                group[1] += 1
+                group[2] += duration
+            self.end_reasons[call.get("endReason")] = self.end_reasons.get(call.get("endReason"), 0) + 1
+        self.call_ids.extend(call["callId"] for call in calls)
+        return not before_since and self.counted < self.max_calls
+
+    def add_tools(self, results):
+        """Résultats de get_call_tools : nombre d'appels où chaque tool apparaît"""
+        for result in results:
+            if is_error(result):
+                self.tool_errors += 1
+                continue
+            for name in {tool.get("name") or tool.get("toolId") for tool in result.get("tools") or []
+                         if isinstance(tool, dict)}:
+                self.tools[name] = self.tools.get(name, 0) + 1
+
+    def result(self):
+        total = sum(group[0] for group in self.groups.values())
+        rows = [[*key, calls, round(duration / timed, 1) if timed else None, round(duration, 1)]
+                for key, (calls, timed, duration) in sorted(self.groups.items(),
+                                                            key=lambda item: [str(v or "") for v in item[0]])]
+        result = {
+            "source": self.source,
+            "calls": total,
+            "groups": {"columns": [*self.group_by, "calls", "avg_duration_s", "total_duration_s"], "rows": rows},
+            "end_reasons": {"columns": ["end_reason", "calls", "share"],
+                            "rows": [[reason, calls, round(calls / total, 3)] for reason, calls in
+                                     sorted(self.end_reasons.items(), key=lambda item: (-item[1], str(item[0] or "")))]},
+        }
+        if self.with_tools:
+            checked = len(self.call_ids) - self.tool_errors
+            result["tools"] = {"columns": ["tool", "calls", "share"], "calls_checked": checked,
+                               "rows": [[name, calls, round(calls / checked, 3) if checked else None]
+                                        for name, calls in sorted(self.tools.items(),
+                                                                  key=lambda item: (-item[1], str(item[0])))]}
+            if self.tool_errors:
+                result["tools"]["errors"] = self.tool_errors
+        if self.truncated:
+            result["truncated"] = True
+        result["elapsed_s"] = round(time.monotonic() - self.started, 3)
+        return result
+
+
+# ==== WORKERS HTTP (commun aux deux versions) ====
+def listen_socket():
+    """Socket d'écoute HTTP, ouvert une seule fois par le processus parent
+
+    TCP_NODELAY est hérité par les connexions acceptées (Linux) : les réponses
+    envoyées en plusieurs écritures (en-têtes puis corps, flux SSE) ne restent
+    pas bloquées par Nagle face à l'ACK retardé du client.
+    """
+    sock = socket.create_server((MCP_HOST, MCP_PORT), backlog=1024)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def run_workers(serve, workers=MCP_WORKERS):
+    """Pré-fork : serve(sock) tourne dans workers processus qui acceptent sur le même socket
+
+    Le noyau répartit les connexions entre les workers ; chacun a ses propres
+    pools de connexions, boucle d'événements, métriques, disjoncteurs, seaux de
+    débit (1/workers de la limite, voir WORKER_PROCESSES) et cache mémoire (voir
+    ULTRAVOX_CACHE_BACKEND=sqlite pour un cache commun). Un worker qui meurt est
+    remplacé ; SIGTERM / SIGINT arrêtent tous les workers. Sans os.fork
+    (Windows) ou avec un seul worker, serve tourne dans le processus courant.
+    """
+    sock = listen_socket()
+    if workers <= 1 or not hasattr(os, "fork"):
+        serve(sock)
+        return
+
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        global WORKER_INDEX
+        pid = os.fork()
+        if pid == 0:
+            WORKER_INDEX = index
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            status = 0
+            try:
+                serve(sock)
+            except KeyboardInterrupt:
+                pass
+            except Exception:
+                status = 1
+            finally:
+                os._exit(status)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            time.sleep(1.0)  # pas de boucle de fork si le worker meurt au démarrage
+            spawn(index)
+    sock.close()
+
+
+# ==== DÉMARRAGE RAPIDE STDIO (commun aux deux versions) ====
+# Claude Desktop et n8n lancent un processus par session : initialize et
+# tools/list sont servis depuis le registre avant d'importer fastmcp, httpx ou
+# la pile réseau de la version stdlib, qui ne sont chargés qu'au premier autre
+# message (en général le premier tools/call).
+PROTOCOL_VERSIONS = ("2024-11-05", "2025-03-26", "2025-06-18", "2025-11-25")  # acceptées par FastMCP et le fallback
+FASTMCP_MODULES = ("fastmcp", "fastmcp.server.dependencies", "fastmcp.server.middleware", "fastmcp.tools", "mcp.types",
+                   "starlette.middleware", "starlette.responses", "httpx")
+REPLAY_ID = "ultravox-fast-start"
+SERVER_VERSION = "30.0.0"  # serverInfo des deux versions (FastMCP annoncerait sinon sa propre version)
+# Capacités communes à toutes les versions de FastMCP acceptées (3.4 n'annonce pas
+# listChanged pour prompts et resources) : l'initialize rapide ne promet rien de plus
+FASTMCP_CAPABILITIES = {"logging": {}, "prompts": {"listChanged": False},
+                        "resources": {"subscribe": False, "listChanged": False}, "tools": {"listChanged": True}}
+
+# Manifeste tools/list déjà sérialisé : seul l'id change d'une réponse à l'autre
+TOOLS_LIST_RESPONSE = '{"jsonrpc": "2.0", "id": %s, "result": ' + json_dumps({"tools": TOOLS_MANIFEST}) + '}'
+
+
+def fastmcp_available():
+    """fastmcp et httpx installés (sans les importer)"""
+    from importlib.util import find_spec
+    return all(find_spec(name) is not None for name in ("fastmcp", "httpx"))
+
+
+def handshake_response(request, fastmcp=False):
+    """Réponse (ligne JSON) à initialize, ping ou tools/list ; None pour les autres messages
+
+    initialize négocie la version de protocole comme FastMCP (celle du client
+    si elle est dans PROTOCOL_VERSIONS, sinon la plus récente). Avec fastmcp, il
+    annonce aussi le même serverInfo ; tools/list sert le manifeste que FastMCP
+    sert lui-même ensuite (voir _RegistryTool).
+    """
+    method = request.get("method")
+    if method == "tools/list":
+        return TOOLS_LIST_RESPONSE % json_dumps(request.get("id"))
+    if method == "ping":
+        result = {}
+    elif method == "initialize":
+        requested = (request.get("params") or {}).get("protocolVersion")
+        result = {
+            "protocolVersion": requested if requested in PROTOCOL_VERSIONS else PROTOCOL_VERSIONS[-1],
+            "capabilities": FASTMCP_CAPABILITIES if fastmcp else {},
+            "serverInfo": {"name": "ultravox" if fastmcp else "ultravox-mcp", "version": SERVER_VERSION},
+        }
+    else:
+        return None
+    return json_dumps({"jsonrpc": "2.0", "id": request.get("id"), "result": result})
+
+
+def _preload(modules):
+    """Importe les modules lourds en arrière-plan pendant la poignée de main"""
+    from importlib import import_module
+    for name in modules:
+        try:
+            import_module(name)
+        except Exception:
+            return
+
+
+def stdio_handshake(stdin, stdout, fastmcp):
+    """Sert initialize / ping / tools/list sur stdio jusqu'au premier autre message
+
+    Renvoie (ligne initialize, lignes à rejouer : notifications et premier
+    message non traité), ou None si stdin se ferme avant. Avec fastmcp, ses
+    modules sont importés en arrière-plan entre-temps.
+    """
+    if fastmcp:
+        threading.Thread(target=_preload, args=(FASTMCP_MODULES,), daemon=True).start()
+    initialize, replay = None, []
+    for line in iter(stdin.readline, b""):
+        if not line.strip():
+            continue
+        try:
+            request = json_loads(line)
+            response = handshake_response(request, fastmcp) if isinstance(request, dict) else None
+        except ValueError:
+            request = response = None
+        if response is not None:
+            if request.get("method") == "initialize":
+                initialize = line
+            stdout.write(response.encode("utf-8") + b"\n")
+            stdout.flush()
+            continue
+        replay.append(line)
+        if not (isinstance(request, dict) and "id" not in request and "method" in request):
+            return initialize, replay  # pas une notification : le vrai serveur prend le relais
+    return None
+
+
+STDIO_HANDSHAKE = None
+if __name__ == "__main__" and MCP_TRANSPORT == "stdio" and MCP_FAST_START:
+    STDIO_HANDSHAKE = stdio_handshake(sys.stdin.buffer, sys.stdout.buffer, fastmcp_available())
+    if STDIO_HANDSHAKE is None:
+        sys.exit(0)
 
 # Essayer d'importer les modules
 try:
     from fastmcp import FastMCP
+    from fastmcp.server.dependencies import get_context
+    from fastmcp.server.middleware import Middleware
+    from fastmcp.tools import Tool, ToolResult
+    from mcp.types import TextContent, Tool as MCPTool
+    from starlette.middleware import Middleware as ASGIMiddleware
+    from starlette.responses import JSONResponse, PlainTextResponse
+    import asyncio
     import httpx
     USE_FASTMCP = True
-except ImportError:
-    import urllib.request
-    import urllib.error
+except ImportError as e:
+    print(f"Version fallback (stdlib) : {e}. La version FastMCP demande fastmcp>=3.4.0 et httpx "
+          "(requirements.txt).", file=sys.stderr)
+    import http.client
+    import ssl
+    from concurrent.futures import ThreadPoolExecutor
+    import uuid
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urljoin
     USE_FASTMCP = False
 
 # ==== VERSION FASTMCP ====
 if USE_FASTMCP:
     try:
-        mcp = FastMCP("ultravox")
-        
+        mcp = FastMCP("ultravox", version=SERVER_VERSION)
+
         HEADERS = {
             "X-API-Key": API_KEY,
             "Content-Type": "application/json",
         }
 
-        # ===== ACCOUNT & SYSTEM (2) =====
-        @mcp.tool()
-        def get_account_info() -> dict:
-            """Récupère les infos du compte Ultravox"""
+        def _http2_available():
+            """HTTP/2 nécessite le paquet optionnel h2 (pip install httpx[http2])"""
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/accounts/me", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+                import h2  # noqa: F401
+                return True
+            except ImportError:
+                return False
 
-        @mcp.tool()
-        def get_open_api_schema() -> dict:
-            """Récupère le schéma OpenAPI de l'API Ultravox"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/openapi.json", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return {"success": True, "paths_count": len(response.json().get("paths", {}))}
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        # Un seul client async pour tout le processus : DNS, TCP et TLS sont
+        # réutilisés d'un appel de tool à l'autre, et les tools peuvent
+        # s'exécuter en parallèle sur la boucle d'événements de FastMCP.
+        http_client = httpx.AsyncClient(
+            base_url=API_BASE,
+            headers=HEADERS,
+            timeout=httpx.Timeout(HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=HTTP2 and _http2_available(),
+        )
 
-        # ===== CALLS (9) =====
-        @mcp.tool()
-        def list_calls(limit: int = 20) -> dict:
-            """Liste les appels"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/calls", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        # Sémaphores par hôte amont, créés à la demande dans la boucle active
+        _host_limits = {}
+        _flights = AsyncSingleFlight()
 
-        @mcp.tool()
-        def get_call(call_id: str) -> dict:
-            """Récupère les détails d'un appel"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/calls/{call_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        def _pool_stats():
+            """Places de concurrence par hôte et part occupée (requêtes en vol / places)"""
+            in_flight = {host: server_metrics.gauge("upstream_in_flight", host) for host in _host_limits}
+            return {
+                "max_concurrency": {host: HTTP_MAX_CONCURRENCY for host in _host_limits},
+                "utilization": {host: round(count / HTTP_MAX_CONCURRENCY, 3) for host, count in in_flight.items()},
+            }
 
-        @mcp.tool()
-        def get_call_messages(call_id: str, limit: int = 20) -> dict:
-            """Récupère les messages d'un appel"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/calls/{call_id}/messages", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        server_metrics.collectors["pool"] = _pool_stats
 
-        @mcp.tool()
-        def get_call_recording(call_id: str) -> dict:
-            """Récupère l'enregistrement d'un appel"""
-            try:
-                with httpx.Client(follow_redirects=True) as client:
-                    response = client.get(f"{API_BASE}/calls/{call_id}/recording", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        # Retourner l'URL de redirection ou le contenu
-                        return {
-                            "success": True,
-                            "call_id": call_id,
-                            "url": str(response.url),
-                            "content_type": response.headers.get("content-type"),
-                            "size": len(response.content)
-                        }
-                    elif response.status_code == 302:
-                        # Récupérer le header Location du redirect
-                        location = response.headers.get("location")
-                        return {
-                            "success": True,
-                            "call_id": call_id,
-                            "recording_url": location,
-                            "message": "Enregistrement trouvé"
-                        }
-                    return {"error": f"Erreur ({response.status_code})", "status_code": response.status_code}
-            except Exception as e:
-                return {"error": str(e)}
+        async def _send(method, path, follow_redirects=False, stream=False, **kwargs):
+            """Envoie une requête avec le client partagé, en limitant la concurrence par hôte
 
-        @mcp.tool()
-        def get_call_tools(call_id: str) -> dict:
-            """Récupère les outils utilisés dans un appel"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/calls/{call_id}/tools", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        tools_list = response.json()
-                        return {
-                            "call_id": call_id,
-                            "tools": tools_list if isinstance(tools_list, list) else [tools_list],
-                            "count": len(tools_list) if isinstance(tools_list, list) else 1
-                        }
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+            stream=True : le corps n'est pas lu, l'appelant doit fermer la réponse (aclose).
+            Les GET identiques simultanés partagent une seule requête (et la même réponse).
+            Chaque essai attend son tour dans rate_limiter ; les 429 / 5xx et erreurs de
+            transport sont réessayés selon retry_policy. Lève CircuitOpenError sans
+            appel réseau quand le disjoncteur de la famille est ouvert.
+            """
+            request = http_client.build_request(method, path, **kwargs)
+            if request.url.host != http_client.base_url.host:
+                request.headers.pop("X-API-Key", None)
+            if method == "GET" and not stream:
+                key = flight_key(request.url, request.headers, follow_redirects)
+                return await _flights.do(key, lambda: _send_guarded(request, follow_redirects, stream))
+            return await _send_guarded(request, follow_redirects, stream)
 
-        @mcp.tool()
-        def get_call_stages(call_id: str) -> dict:
-            """Récupère les étapes d'un appel"""
+        async def _send_guarded(request, follow_redirects, stream):
+            breaker = circuit_breakers.get(request.url.host, request.url.path)
+            if breaker is None:
+                return await _send_attempts(request, follow_redirects, stream)
+            breaker.before()
+            ok = None
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/calls/{call_id}/stages", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+                response = await _send_attempts(request, follow_redirects, stream)
+                ok = response.status_code < 500
+                return response
+            except Exception:
+                ok = False
+                raise
+            finally:
+                breaker.record(ok)
 
-        @mcp.tool()
-        def get_call_stage(call_id: str, stage_id: str) -> dict:
-            """Récupère les détails d'une étape d'appel"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/calls/{call_id}/stages/{stage_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        async def _send_attempts(request, follow_redirects, stream):
+            method = request.method
+            host = request.url.host
+            if host not in _host_limits:
+                _host_limits[host] = asyncio.Semaphore(HTTP_MAX_CONCURRENCY)
+            started = time.monotonic()
+            attempt = 0
+            while True:
+                delay = rate_limiter.reserve(host, request.url.path)
+                if delay:
+                    await asyncio.sleep(delay)
+                try:
+                    async with _host_limits[host]:
+                        sent = time.perf_counter()
+                        with server_metrics.track("upstream_in_flight", host):
+                            response = await http_client.send(request, follow_redirects=follow_redirects,
+                                                              stream=stream)
+                except httpx.TransportError as e:
+                    record_upstream(method, host, request.url.path, sent, type(e).__name__)
+                    delay = retry_policy.next_delay(method, attempt, started, error=e)
+                    if delay is None:
+                        raise
+                else:
+                    record_upstream(method, host, request.url.path, sent, response.status_code)
+                    delay = retry_policy.next_delay(method, attempt, started, status=response.status_code,
+                                                    headers=response.headers)
+                    if delay is None:
+                        return response
+                    await response.aclose()
+                attempt += 1
+                await asyncio.sleep(delay)
 
-        @mcp.tool()
-        def get_stage_messages(call_id: str, stage_id: str, limit: int = 20) -> dict:
-            """Récupère les messages d'une étape d'appel"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/calls/{call_id}/stages/{stage_id}/messages", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        async def _fetch_page(url, params=None):
+            response = await _send("GET", url, params=params)
+            if response.status_code != 200:
+                raise UpstreamError(response.status_code)
+            return json_loads(response.content)
 
-        @mcp.tool()
-        def delete_call(call_id: str) -> dict:
-            """Supprime un appel (DESTRUCTIF)"""
-            try:
-                with httpx.Client() as client:
-                    response = client.delete(f"{API_BASE}/calls/{call_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code in [200, 204]:
-                        return {"success": True, "message": "Appel supprimé"}
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        async def _iter_pages(path, params, collector):
+            """Suit les curseurs "next" paresseusement, en préchargeant la page suivante
 
-        # ===== AGENTS (5) =====
-        @mcp.tool()
-        def list_agents(limit: int = 20) -> dict:
-            """Liste les agents"""
+            La page suivante n'est demandée que si collector en veut encore : on ne
+            récupère jamais de page au-delà de max_items.
+            """
+            task = asyncio.ensure_future(_fetch_page(path, params))
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/agents", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+                while task is not None:
+                    data = await task
+                    next_url = collector.add(data)
+                    task = asyncio.ensure_future(_fetch_page(next_url)) if next_url else None
+                    yield collector.page
+            finally:
+                if task is not None:
+                    task.cancel()
 
-        @mcp.tool()
-        def get_agent(agent_id: str) -> dict:
-            """Récupère les détails d'un agent"""
+        async def _collect_pages(path, params, values):
+            collector = PageCollector(values.get("max_items"))
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/agents/{agent_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
+                async for _ in _iter_pages(path, first_page_params(params, values), collector):
+                    pass
             except Exception as e:
-                return {"error": str(e)}
+                return collector.result(error=e)
+            return collector.result()
 
-        @mcp.tool()
-        def list_agent_calls(agent_id: str, limit: int = 20) -> dict:
-            """Liste les appels d'un agent"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/agents/{agent_id}/calls", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        async def _run(name, passthrough=False, **arguments):
+            """Exécute un tool déclaré dans TOOLS avec le client partagé
 
-        @mcp.tool()
-        def update_agent_prompt(agent_id: str, prompt: str) -> dict:
-            """Met à jour le prompt d'un agent"""
+            passthrough : une réponse non transformée peut revenir en RawJSON (cf. tool_result)
+            """
             try:
-                with httpx.Client() as client:
-                    response = client.patch(f"{API_BASE}/agents/{agent_id}", headers=HEADERS, json={"systemPrompt": prompt}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
+                spec, values, path, params, body = build_request(name, arguments)
+                if wants_all_pages(spec, values):
+                    return await _collect_pages(path, params, values)
+                fresh, stale = cache_lookup(spec, path, params)
+                if fresh is not None:
+                    return tool_result(spec, values, 200, fresh["raw"], fresh["data"], passthrough)
+                response = await _send(spec["method"], path, params=params or None, json=body,
+                                       headers=conditional_headers(stale))
+                if response.status_code == 304 and stale is not None:
+                    entry = cache_revalidated(spec, path, params, stale)
+                else:
+                    entry = cache_store(spec, values, path, params, response.status_code,
+                                        response.content, response.headers)
+                if entry is not None:
+                    return tool_result(spec, values, 200, entry["raw"], entry["data"], passthrough)
+                return tool_result(spec, values, response.status_code, response.content, passthrough=passthrough)
+            except CircuitOpenError as e:
+                return circuit_open_result(e, spec, values, path, params)
             except Exception as e:
                 return {"error": str(e)}
 
-        @mcp.tool()
-        def delete_agent(agent_id: str) -> dict:
-            """Supprime un agent (DESTRUCTIF)"""
-            try:
-                with httpx.Client() as client:
-                    response = client.delete(f"{API_BASE}/agents/{agent_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code in [200, 204]:
-                        return {"success": True, "message": "Agent supprimé"}
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        # ===== ENREGISTREMENTS =====
+        async def _resolve_recording(call_id):
+            """(status, URL de l'audio, en-têtes) sans suivre la redirection ni lire l'audio"""
+            _, _, path, _, _ = build_request("get_call_recording", {"call_id": call_id})
+            response = await _send("GET", path, stream=True)
+            await response.aclose()
+            if response.status_code in REDIRECT_STATUSES:
+                return response.status_code, str(response.url.join(response.headers.get("location"))), response.headers
+            return response.status_code, str(response.url), response.headers
 
-        # ===== VOICES (2) =====
-        @mcp.tool()
-        def list_voices(limit: int = 20) -> dict:
-            """Liste les voix disponibles"""
-            try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/voices", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+        async def _probe_recording(url):
+            """Taille et type de l'audio : HEAD, ou GET d'un seul octet si HEAD est refusé"""
+            response = await _send("HEAD", url)
+            if response.status_code in (403, 405):
+                response = await _send("GET", url, headers={"Range": "bytes=0-0"}, stream=True)
+                await response.aclose()
+            return recording_info(response.status_code, response.headers)
 
-        @mcp.tool()
-        def get_voice(voice_id: str) -> dict:
-            """Récupère les détails d'une voix"""
+        async def get_call_recording(arguments):
+            """Récupère l'URL signée de l'enregistrement d'un appel, sans télécharger l'audio"""
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/voices/{voice_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
+                values = tool_values("get_call_recording", arguments)
+                call_id = values["call_id"]
+                status, url, headers = await _resolve_recording(call_id)
+                if status in REDIRECT_STATUSES:
+                    result = {
+                        "success": True,
+                        "call_id": call_id,
+                        "recording_url": url,
+                        "message": "Enregistrement trouvé"
+                    }
+                    if values["probe"]:
+                        result.update(await _probe_recording(url))
+                    return result
+                elif status == 200:
+                    # L'API sert l'audio directement : seuls les en-têtes ont été lus
+                    return dict({"success": True, "call_id": call_id, "url": url}, **recording_info(status, headers))
+                return {"error": f"Erreur ({status})", "status_code": status}
             except Exception as e:
                 return {"error": str(e)}
 
-        # ===== MODELS (1) =====
-        @mcp.tool()
-        def list_models() -> dict:
-            """Liste les modèles disponibles"""
+        async def download_call_recording(arguments):
+            """Télécharge l'enregistrement d'un appel sur disque, par blocs (mémoire bornée)"""
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/models", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
+                values = tool_values("download_call_recording", arguments)
+                call_id = values["call_id"]
+                status, url, _ = await _resolve_recording(call_id)
+                if status not in REDIRECT_STATUSES and status != 200:
+                    return {"error": f"Erreur ({status})", "status_code": status}
+                started = time.monotonic()
+                response = await _send("GET", url, stream=True)
+                try:
+                    if response.status_code != 200:
+                        return {"error": f"Erreur ({response.status_code})", "status_code": response.status_code}
+                    path = recording_path(call_id, values["filename"], response.headers.get("content-type"))
+                    written = 0
+                    try:
+                        with open(path + ".part", "wb") as f:
+                            async for chunk in response.aiter_bytes(download_chunk_size(values["chunk_size"])):
+                                f.write(chunk)
+                                written += len(chunk)
+                        os.replace(path + ".part", path)
+                    except BaseException:
+                        remove_partial(path + ".part")
+                        raise
+                finally:
+                    await response.aclose()
+                return download_report(call_id, path, written, time.monotonic() - started)
             except Exception as e:
                 return {"error": str(e)}
 
-        # ===== WEBHOOKS (4) =====
-        @mcp.tool()
-        def list_webhooks() -> dict:
-            """Liste les webhooks"""
+        # ===== DOSSIERS D'APPEL =====
+        async def _call_bundle(call_id):
+            tasks = {key: asyncio.ensure_future(_run(tool, call_id=call_id, **extra))
+                     for key, (tool, extra) in BUNDLE_PARTS.items()}
+            stage_ids = bundle_stage_ids(await tasks["stages"])
+            stage_messages = await asyncio.gather(*(
+                _run("get_stage_messages", call_id=call_id, stage_id=stage_id, all_pages=True)
+                for stage_id in stage_ids))
+            parts = {key: await task for key, task in tasks.items()}
+            return merge_bundle(call_id, parts, dict(zip(stage_ids, stage_messages)))
+
+        async def get_call_bundle(arguments):
+            """Récupère appel, messages, étapes (avec leurs messages) et outils de plusieurs appels
+
+            Toutes les requêtes partent en parallèle ; le sémaphore par hôte de _send
+            borne le nombre de requêtes en vol (ULTRAVOX_MAX_CONCURRENCY).
+            """
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/webhooks", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
+                call_ids = id_list(arguments.get("call_ids"), "call_ids")
+            except ValueError as e:
                 return {"error": str(e)}
+            return bundle_result(await asyncio.gather(*(_call_bundle(call_id) for call_id in call_ids)))
 
-        @mcp.tool()
-        def get_webhook(webhook_id: str) -> dict:
-            """Récupère les détails d'un webhook"""
+        # ===== SUPPRESSIONS EN MASSE =====
+        async def _matching_calls(criteria, max_items):
+            """Parcourt list_calls page par page et garde les ids qui passent le filtre"""
+            ids = []
+            pages = _iter_pages("/calls", {"limit": BULK_SCAN_PAGE_SIZE}, PageCollector(keep=False))
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/webhooks/{webhook_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+                async for items in pages:
+                    ids.extend(call["callId"] for call in items if call_matches(call, criteria))
+                    if max_items and len(ids) >= max_items:
+                        break
+            finally:
+                await pages.aclose()
+            return ids[:max_items] if max_items else ids
 
-        @mcp.tool()
-        def create_webhook(agent_id: str, url: str, events: list) -> dict:
-            """Crée un webhook"""
+        async def bulk_delete(name, arguments):
+            """Suppressions concurrentes au rythme de bulk_delete_bucket, résultat par id"""
             try:
-                with httpx.Client() as client:
-                    response = client.post(f"{API_BASE}/webhooks", headers=HEADERS, json={"agentId": agent_id, "url": url, "events": events}, timeout=10.0)
-                    if response.status_code in [200, 201]:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
+                tool, id_arg, ids, criteria, values = bulk_request(name, arguments)
+                if ids is None:
+                    ids = await _matching_calls(criteria, values.get("max_items"))
+                if values["dry_run"]:
+                    return bulk_report(ids, None, True)
+
+                async def delete(item_id):
+                    await asyncio.sleep(bulk_delete_bucket.reserve())
+                    return await _run(tool, **{id_arg: item_id})
+
+                started = time.monotonic()
+                results = await asyncio.gather(*(delete(item_id) for item_id in ids))
+                return bulk_report(ids, dict(zip(ids, results)), False, time.monotonic() - started)
             except Exception as e:
                 return {"error": str(e)}
 
-        @mcp.tool()
-        def delete_webhook(webhook_id: str) -> dict:
-            """Supprime un webhook (DESTRUCTIF)"""
+        # ===== APPELS SUPPRIMÉS EN FLUX =====
+        async def stream_deleted_calls(arguments, ctx):
+            """Parcourt les appels supprimés page par page et émet chaque page en notification
+
+            Notification de progression si le client a fourni un progressToken, sinon
+            notification de log. Rien n'est accumulé : le résultat ne contient que les compteurs.
+            """
+            collector = PageCollector(arguments.get("max_items"), keep=False)
             try:
-                with httpx.Client() as client:
-                    response = client.delete(f"{API_BASE}/webhooks/{webhook_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code in [200, 204]:
-                        return {"success": True, "message": "Webhook supprimé"}
-                    return {"error": f"Erreur ({response.status_code})"}
+                _, values, path, params, _ = build_request("list_deleted_calls_stream", arguments)
+                # dict avec mcp 2.x, objet pydantic RequestParams.Meta avec mcp 1.x (fastmcp 3.x)
+                meta = ctx.request_context.meta if ctx.request_context else None
+                token = meta.get("progressToken") if isinstance(meta, dict) else getattr(meta, "progressToken", None)
+                async for items in _iter_pages(path, first_page_params(params, values), collector):
+                    if token is not None:
+                        await ctx.report_progress(collector.count, collector.total, json_dumps(items))
+                    else:
+                        await ctx.log(json_dumps(items), logger_name="list_deleted_calls_stream")
             except Exception as e:
-                return {"error": str(e)}
+                return collector.result(error=e)
+            return collector.result()
 
-        # ===== DELETED CALLS (3) =====
-        @mcp.tool()
-        def get_deleted_calls(limit: int = 20) -> dict:
-            """Récupère la liste des appels supprimés"""
+        # ===== ARCHIVE =====
+        async def _archive_pages(url, params, add_page, max_items=None):
+            """Suit les pages de /calls tant que add_page(items, curseur suivant) renvoie True"""
+            collector = PageCollector(max_items, keep=False, resize=True)
+            pages = _iter_pages(url, params, collector)
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/deleted_calls", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+                async for items in pages:
+                    if not add_page(items, collector.next):
+                        break
+            finally:
+                await pages.aclose()
 
-        @mcp.tool()
-        def get_deleted_call(call_id: str) -> dict:
-            """Récupère les détails d'un appel supprimé"""
+        async def sync_call_archive(arguments):
+            """Synchronise l'archive locale : nouveaux appels, historique (max_calls), messages et étapes"""
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/deleted_calls/{call_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
+                values = tool_values("sync_call_archive", arguments)
+            except ValueError as e:
                 return {"error": str(e)}
-
-        @mcp.tool()
-        def list_deleted_calls_stream(limit: int = 20) -> dict:
-            """Liste les appels supprimés avec streaming"""
+            sync = ArchiveSync(call_archive, values["max_calls"])
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/deleted_calls", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
+                params, max_items = sync.head_pages()
+                await _archive_pages("/calls", params, sync.head_page, max_items)
+                if sync.backfill_url():
+                    await _archive_pages(sync.backfill_url(), None, sync.backfill_page, sync.max_calls - sync.scanned)
+                refreshed = await asyncio.gather(*(_run("get_call", call_id=call_id)
+                                                   for call_id in call_archive.pending_ids()))
+                sync.refresh(refreshed)
+                if values["details"]:
+                    call_ids = call_archive.ids_needing_details(values["max_calls"])
+                    messages = asyncio.gather(*(_run("get_call_messages", call_id=call_id, all_pages=True)
+                                                for call_id in call_ids))
+                    stages = asyncio.gather(*(_run("get_call_stages", call_id=call_id) for call_id in call_ids))
+                    messages, stages = await messages, await stages
+                    stage_keys = [(call_id, stage_id) for call_id, call_stages in zip(call_ids, stages)
+                                  for stage_id in sync.stage_ids(call_stages)]
+                    stage_messages = {}
+                    for (call_id, stage_id), result in zip(stage_keys, await asyncio.gather(*(
+                            _run("get_stage_messages", call_id=call_id, stage_id=stage_id, all_pages=True)
+                            for call_id, stage_id in stage_keys))):
+                        stage_messages.setdefault(call_id, {})[stage_id] = result
+                    for call_id, call_messages, call_stages in zip(call_ids, messages, stages):
+                        sync.add_details(call_id, call_messages, call_stages, stage_messages.get(call_id))
             except Exception as e:
-                return {"error": str(e)}
+                return sync.result(error=e)
+            return sync.result()
 
-        # ===== RESOURCES (2) =====
-        @mcp.tool()
-        def get_tools_list(limit: int = 20) -> dict:
-            """Récupère la liste des outils disponibles"""
+        async def call_stats(arguments):
+            """Statistiques agrégées (par agent, jour, raison de fin ; usage des tools), calculées côté serveur"""
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/tools", headers=HEADERS, params={"limit": limit}, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
+                stats = CallStats(arguments)
+                if stats.source == "archive":
+                    if not call_archive.exists():
+                        return archive_missing()
+                    stats.load_archive(call_archive)
+                else:
+                    params, max_items = stats.api_pages()
+                    await _archive_pages("/calls", params, stats.add_page, max_items)
+                if stats.with_tools:
+                    stats.add_tools(await asyncio.gather(*(_run("get_call_tools", call_id=call_id)
+                                                           for call_id in stats.call_ids)))
+                return stats.result()
             except Exception as e:
                 return {"error": str(e)}
 
-        @mcp.tool()
-        def get_tool(tool_id: str) -> dict:
-            """Récupère les détails d'un outil"""
+        # ===== TOOLS (déclarés par le registre TOOLS) =====
+        # Tools qui ne suivent pas le schéma requête -> JSON du registre
+        HANDLERS = {
+            "get_call_recording": get_call_recording,
+            "download_call_recording": download_call_recording,
+            "get_call_bundle": get_call_bundle,
+            "bulk_delete_calls": lambda arguments: bulk_delete("bulk_delete_calls", arguments),
+            "bulk_delete_agents": lambda arguments: bulk_delete("bulk_delete_agents", arguments),
+            "bulk_delete_webhooks": lambda arguments: bulk_delete("bulk_delete_webhooks", arguments),
+            "get_cache_stats": lambda arguments: response_cache.stats(),
+            "get_server_metrics": lambda arguments: server_metrics_report(),
+            "sync_call_archive": sync_call_archive,
+            "query_call_archive": archive_query_result,
+            "get_archived_call": archived_call_result,
+            "call_stats": call_stats,
+            "search_transcripts": transcript_search_result,
+        }
+
+        # Tools qui émettent des notifications pendant leur exécution (reçoivent le Context)
+        STREAM_HANDLERS = {
+            "list_deleted_calls_stream": stream_deleted_calls,
+        }
+
+        TOOLS_MANIFEST_BY_NAME = {tool["name"]: tool for tool in TOOLS_MANIFEST}
+
+        class _RegistryTool(Tool):
+            """Tool FastMCP décrit par son entrée de TOOLS (description, arguments et défauts)"""
+
+            async def run(self, arguments):
+                try:
+                    arguments = tool_values(self.name, arguments)
+                except InvalidArguments as e:
+                    return ToolResult(structured_content={"error": str(e), "status_code": e.status_code})
+                if self.name in STREAM_HANDLERS:
+                    result = await STREAM_HANDLERS[self.name](arguments, get_context())
+                elif self.name in HANDLERS:
+                    result = HANDLERS[self.name](arguments)
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                else:
+                    result = await _run(self.name, JSON_PASSTHROUGH, **arguments)
+                if isinstance(result, RawJSON):
+                    # Corps de l'API tel quel en contenu texte : ni json_loads ni ré-encodage pydantic
+                    return ToolResult(content=[TextContent(type="text", text=result.text())])
+                return ToolResult(structured_content=result)
+
+            def to_mcp_tool(self, **overrides):
+                """Entrée du manifeste du registre, identique au tools/list de la version fallback"""
+                return MCPTool.model_validate({**TOOLS_MANIFEST_BY_NAME[self.name], **overrides})
+
+        for name, spec in TOOLS.items():
+            mcp.add_tool(_RegistryTool(name=name, description=spec["description"], parameters=spec["input_schema"]))
+
+        class _ToolMetrics(Middleware):
+            """Mesure chaque tools/call (latence, statut des résultats en erreur)"""
+
+            async def on_call_tool(self, context, call_next):
+                started = time.perf_counter()
+                try:
+                    result = await call_next(context)
+                except Exception as e:
+                    record_tool(context.message.name, time.perf_counter() - started, {"error": str(e)})
+                    raise
+                record_tool(context.message.name, time.perf_counter() - started, result.structured_content or {})
+                return result
+
+        class _ResultShape(Middleware):
+            """Arguments fields / max_bytes de tous les tools (voir shape_result et SHAPE_PROPERTIES)"""
+
+            async def on_call_tool(self, context, call_next):
+                arguments = dict(context.message.arguments or {})
+                try:
+                    fields, max_bytes = shape_arguments(arguments)
+                except InvalidArguments as e:
+                    return ToolResult(structured_content={"error": str(e), "status_code": e.status_code})
+                if not fields and not max_bytes:
+                    return await call_next(context)
+                result = await call_next(context.copy(message=context.message.model_copy(
+                    update={"arguments": arguments})))
+                value = result.structured_content
+                if value is None:
+                    if not result.content or not isinstance(result.content[0], TextContent):
+                        return result
+                    value = RawJSON(result.content[0].text.encode("utf-8"))  # corps transmis tel quel
+                shaped = shape_result(value, fields, max_bytes)
+                if isinstance(shaped, RawJSON):
+                    return result
+                # Texte encodé par json_dumps, celui avec lequel _Fit a mesuré le budget
+                return ToolResult(content=[TextContent(type="text", text=json_dumps(shaped))],
+                                  structured_content=shaped)
+
+        mcp.add_middleware(_ToolMetrics())
+        mcp.add_middleware(_ResultShape())
+
+        class _OriginCheck:
+            """Middleware ASGI : même contrôle de l'en-tête Origin que la version stdlib (voir origin_allowed)"""
+
+            def __init__(self, app):
+                self.app = app
+
+            async def __call__(self, scope, receive, send):
+                if scope["type"] == "http" and scope["path"].rstrip("/") == MCP_PATH.rstrip("/"):
+                    origin = dict(scope["headers"]).get(b"origin")
+                    if not origin_allowed(origin.decode("latin-1") if origin else None):
+                        response = JSONResponse({"jsonrpc": "2.0", "id": None,
+                                                 "error": {"code": -32000, "message": "Origin non autorisée"}},
+                                                status_code=403)
+                        await response(scope, receive, send)
+                        return
+                await self.app(scope, receive, send)
+
+        @mcp.custom_route("/metrics", methods=["GET"])
+        async def _metrics_endpoint(request):
+            """Format texte Prometheus, servi en mode HTTP (streamable-http / sse)"""
+            return PlainTextResponse(prometheus_text(), media_type="text/plain; version=0.0.4")
+
+        @mcp.custom_route("/health", methods=["GET"])
+        async def _health_endpoint(request):
+            return JSONResponse(health_report())
+
+        @mcp.custom_route("/ready", methods=["GET"])
+        async def _ready_endpoint(request):
+            ready, body = readiness_report()
+            return JSONResponse(body, status_code=200 if ready else 503)
+
+        async def _serve(sock=None):
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/tools/{tool_id}", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+                if MCP_TRANSPORT == "stdio":
+                    await mcp.run_async()
+                elif MCP_TRANSPORT == "sse":
+                    await mcp.run_async(transport="sse", host=MCP_HOST, port=MCP_PORT)
+                else:
+                    # Plusieurs workers : sans état, une requête peut arriver sur n'importe lequel
+                    await mcp.run_async(transport=MCP_TRANSPORT, host=MCP_HOST, port=MCP_PORT, path=MCP_PATH,
+                                        sockets=[sock], stateless_http=MCP_WORKERS > 1,
+                                        middleware=[ASGIMiddleware(_OriginCheck)])
+            finally:
+                await http_client.aclose()
 
-        @mcp.tool()
-        def get_call_usage() -> dict:
-            """Récupère l'utilisation des appels"""
+        def _resume_stdio(initialize, replay):
+            """Confie la session stdio, déjà initialisée par stdio_handshake, à FastMCP
+
+            FastMCP lit un pipe alimenté par l'initialize d'origine (sous REPLAY_ID),
+            les lignes en attente puis la suite de stdin ; sa réponse à cet
+            initialize, déjà envoyée au client, est retirée de sa sortie.
+            """
+            source, sink = sys.stdin.buffer, sys.stdout.buffer
+            stdin_read, stdin_write = os.pipe()
+            stdout_read, stdout_write = os.pipe()
+            if initialize is not None:
+                request = json_loads(initialize)
+                request["id"] = REPLAY_ID
+                replay = [json_dumps(request).encode("utf-8") + b"\n"] + replay
+
+            def pump():
+                with open(stdin_write, "wb", buffering=0) as pipe:
+                    try:
+                        for line in replay:
+                            pipe.write(line)
+                        for chunk in iter(lambda: source.read1(65536), b""):
+                            pipe.write(chunk)
+                    except BrokenPipeError:
+                        pass
+
+            def forward():
+                with open(stdout_read, "rb") as pipe:
+                    for line in pipe:
+                        if REPLAY_ID.encode() in line and json_loads(line).get("id") == REPLAY_ID:
+                            continue
+                        sink.write(line)
+                        sink.flush()
+
+            threading.Thread(target=pump, daemon=True).start()
+            forwarder = threading.Thread(target=forward)
+            forwarder.start()
+            sys.stdin = open(stdin_read, "r", encoding="utf-8")
+            sys.stdout = open(stdout_write, "w", encoding="utf-8")
             try:
-                with httpx.Client() as client:
-                    response = client.get(f"{API_BASE}/accounts/me/call_usage", headers=HEADERS, timeout=10.0)
-                    if response.status_code == 200:
-                        return response.json()
-                    return {"error": f"Erreur ({response.status_code})"}
-            except Exception as e:
-                return {"error": str(e)}
+                asyncio.run(_serve())
+            finally:
+                sys.stdout.close()
+                forwarder.join()
 
         if __name__ == "__main__":
-            mcp.run()
-    
+            if MCP_TRANSPORT in ("http", "streamable-http"):
+                run_workers(lambda sock: asyncio.run(_serve(sock)))
+            elif STDIO_HANDSHAKE is not None:
+                _resume_stdio(*STDIO_HANDSHAKE)
+            else:
+                asyncio.run(_serve())
+
     except Exception as e:
         print(f"ERREUR FastMCP: {e}", file=sys.stderr)
         sys.exit(1)
 
 # ==== VERSION FALLBACK (SANS DÉPENDANCES) ====
 else:
-    def make_request(endpoint, method="GET", json_data=None):
-        """Fait une requête HTTP à l'API Ultravox"""
-        url = f"{API_BASE}{endpoint}"
-        
+    HEADERS = {
+        "X-API-Key": API_KEY,
+        "Content-Type": "application/json",
+    }
+
+    class ConnectionPool:
+        """Connexions http.client persistantes vers une origine (stdlib uniquement)"""
+
+        # Erreurs typiques d'un socket keep-alive fermé par le serveur pendant l'inactivité
+        STALE_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                        ConnectionResetError, BrokenPipeError)
+
+        def __init__(self, scheme, host, port, max_idle=HTTP_MAX_KEEPALIVE):
+            self.scheme = scheme
+            self.host = host
+            self.port = port
+            self.max_idle = max_idle
+            self._idle = []  # (connexion, dernière utilisation), la plus récente en dernier
+            self._lock = threading.Lock()
+            self._ssl_context = ssl.create_default_context() if scheme == "https" else None
+
+        def _connect(self):
+            if self.scheme == "https":
+                return http.client.HTTPSConnection(self.host, self.port, timeout=HTTP_TIMEOUT, context=self._ssl_context)
+            return http.client.HTTPConnection(self.host, self.port, timeout=HTTP_TIMEOUT)
+
+        def _acquire(self):
+            """Renvoie (connexion, réutilisée ?) en écartant les connexions expirées"""
+            now = time.monotonic()
+            with self._lock:
+                while self._idle:
+                    conn, last_used = self._idle.pop()
+                    if now - last_used < HTTP_KEEPALIVE_EXPIRY:
+                        return conn, True
+                    conn.close()
+            return self._connect(), False
+
+        def _release(self, conn):
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append((conn, time.monotonic()))
+                    return
+            conn.close()
+
+        def open(self, method, path, body=None, headers=None):
+            """Envoie une requête sans lire le corps : renvoie (connexion, réponse)
+
+            L'appelant lit la réponse à son rythme puis appelle finish().
+            """
+            conn, reused = self._acquire()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except self.STALE_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+            except Exception:
+                conn.close()
+                raise
+            # Socket périmé : on réessaie une seule fois sur une connexion neuve
+            conn = self._connect()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except Exception:
+                conn.close()
+                raise
+
+        def send(self, method, path, body=None, headers=None):
+            """open() au rythme de rate_limiter, avec reprise des 429 / 5xx et erreurs réseau
+
+            Lève CircuitOpenError sans appel réseau quand le disjoncteur de la famille est ouvert.
+            """
+            breaker = circuit_breakers.get(self.host, path)
+            if breaker is None:
+                return self._send_attempts(method, path, body, headers)
+            breaker.before()
+            ok = None
+            try:
+                conn, response = self._send_attempts(method, path, body, headers)
+                ok = response.status < 500
+                return conn, response
+            except Exception:
+                ok = False
+                raise
+            finally:
+                breaker.record(ok)
+
+        def _send_attempts(self, method, path, body, headers):
+            started = time.monotonic()
+            attempt = 0
+            while True:
+                delay = rate_limiter.reserve(self.host, path)
+                if delay:
+                    time.sleep(delay)
+                sent = time.perf_counter()
+                try:
+                    with server_metrics.track("upstream_in_flight", self.host):
+                        conn, response = self.open(method, path, body=body, headers=headers)
+                except (OSError, http.client.HTTPException) as e:
+                    record_upstream(method, self.host, path, sent, type(e).__name__)
+                    delay = retry_policy.next_delay(method, attempt, started, error=e)
+                    if delay is None:
+                        raise
+                else:
+                    record_upstream(method, self.host, path, sent, response.status)
+                    delay = retry_policy.next_delay(method, attempt, started, status=response.status,
+                                                    headers=response.headers)
+                    if delay is None:
+                        return conn, response
+                    try:
+                        response.read()  # corps d'erreur, quelques octets : la connexion reste réutilisable
+                        self.finish(conn, response)
+                    except Exception:
+                        conn.close()
+                attempt += 1
+                time.sleep(delay)
+
+        def finish(self, conn, response):
+            """Remet la connexion dans le pool si la réponse a été lue en entier"""
+            if response.isclosed() and not response.will_close:
+                self._release(conn)
+            else:
+                conn.close()
+
+        def request(self, method, path, body=None, headers=None):
+            """Envoie une requête et renvoie (status, headers, corps en bytes)"""
+            conn, response = self.send(method, path, body=body, headers=headers)
+            try:
+                data = response.read()
+            except Exception:
+                conn.close()
+                raise
+            self.finish(conn, response)
+            return response.status, response.headers, data
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def pool_for(url):
+        """(pool de l'origine de l'URL, chemin + query à envoyer)"""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(*key)
+        return pool, (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+    def pool_stats():
+        """Connexions keep-alive au repos et part des workers occupés, par hôte"""
+        with _pools_lock:
+            pools = list(_pools.values())
+        in_flight = {pool.host: server_metrics.gauge("upstream_in_flight", pool.host) for pool in pools}
+        return {
+            "idle_connections": {pool.host: len(pool._idle) for pool in pools},
+            "utilization": {host: round(count / HTTP_MAX_CONCURRENCY, 3) for host, count in in_flight.items()},
+        }
+
+    server_metrics.collectors["pool"] = pool_stats
+
+    _flights = SingleFlight()
+
+    def http_request(method, url, body=None, headers=None, follow_redirects=False):
+        """Requête HTTP via le pool de l'origine de l'URL (GET identiques simultanés partagés)"""
+        if method == "GET":
+            return _flights.do(flight_key(url, headers, follow_redirects),
+                               lambda: _http_request(method, url, body, headers, follow_redirects))
+        return _http_request(method, url, body, headers, follow_redirects)
+
+    def _http_request(method, url, body, headers, follow_redirects):
+        for _ in range(5):
+            pool, path = pool_for(url)
+            status, response_headers, data = pool.request(method, path, body=body, headers=headers)
+            if not (follow_redirects and status in REDIRECT_STATUSES):
+                break
+            url = urljoin(url, response_headers.get("Location"))
+            # Ne pas envoyer la clé API à un autre hôte
+            headers = api_headers_for(url, headers or {})
+        return status, response_headers, data
+
+    def _resolve_recording(arguments):
+        """(status, URL de l'audio, en-têtes) sans suivre la redirection ni lire l'audio"""
+        _, _, path, _, _ = build_request("get_call_recording", arguments)
+        url = f"{API_BASE}{path}"
+        pool, request_path = pool_for(url)
+        conn, response = pool.send("GET", request_path, headers=HEADERS)
+        try:
+            if response.status in REDIRECT_STATUSES:
+                response.read()  # corps de redirection, quelques octets
+                return response.status, urljoin(url, response.headers.get("Location")), response.headers
+            return response.status, url, response.headers
+        finally:
+            pool.finish(conn, response)
+
+    def _probe_recording(url):
+        """Taille et type de l'audio : HEAD, ou GET d'un seul octet si HEAD est refusé"""
+        status, headers, _ = http_request("HEAD", url, headers=api_headers_for(url, HEADERS))
+        if status in (403, 405):
+            status, headers, _ = http_request("GET", url, headers=dict(api_headers_for(url, HEADERS), Range="bytes=0-0"))
+        return recording_info(status, headers)
+
+    def get_call_recording(arguments):
+        """Récupère l'URL signée de l'enregistrement d'un appel, sans télécharger l'audio"""
+        call_id = arguments.get("call_id")
         try:
-            body = json.dumps(json_data).encode('utf-8') if json_data else None
-            req = urllib.request.Request(url, data=body, method=method, headers={"X-API-Key": API_KEY, "Content-Type": "application/json"})
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                data = response.read().decode('utf-8')
-                return json.loads(data)
-        except urllib.error.HTTPError as e:
-            return {"error": f"HTTP Error {e.code}", "status_code": e.code}
+            status, url, headers = _resolve_recording(arguments)
+            if status in REDIRECT_STATUSES:
+                result = {"success": True, "call_id": call_id, "recording_url": url, "message": "Enregistrement trouvé"}
+                if arguments.get("probe"):
+                    result.update(_probe_recording(url))
+                return result
+            elif status == 200:
+                # L'API sert l'audio directement : seuls les en-têtes ont été lus
+                return dict({"success": True, "call_id": call_id, "url": url}, **recording_info(status, headers))
+            return {"error": f"Erreur ({status})", "status_code": status}
         except Exception as e:
             return {"error": str(e)}
 
-    def handle_tool(name, arguments):
-        """Exécute un tool"""
-        
-        # ACCOUNT & SYSTEM
-        if name == "get_account_info":
-            return make_request("/accounts/me")
-        elif name == "get_open_api_schema":
-            return make_request("/openapi.json")
-        
-        # CALLS
-        elif name == "list_calls":
-            limit = arguments.get("limit", 20)
-            return make_request(f"/calls?limit={limit}")
-        elif name == "get_call":
-            call_id = arguments.get("call_id")
-            return make_request(f"/calls/{call_id}")
-        elif name == "get_call_messages":
-            call_id = arguments.get("call_id")
-            limit = arguments.get("limit", 20)
-            return make_request(f"/calls/{call_id}/messages?limit={limit}")
-        elif name == "get_call_recording":
-            call_id = arguments.get("call_id")
-            # Créer une requête avec suivi des redirects
-            url = f"{API_BASE}/calls/{call_id}/recording"
+    def download_call_recording(arguments):
+        """Télécharge l'enregistrement d'un appel sur disque, par blocs (mémoire bornée)"""
+        call_id = arguments.get("call_id")
+        chunk_size = download_chunk_size(arguments.get("chunk_size"))
+        try:
+            status, url, _ = _resolve_recording(arguments)
+            if status not in REDIRECT_STATUSES and status != 200:
+                return {"error": f"Erreur ({status})", "status_code": status}
+            started = time.monotonic()
+            pool, request_path = pool_for(url)
+            conn, response = pool.send("GET", request_path, headers=api_headers_for(url, HEADERS))
             try:
-                req = urllib.request.Request(url, method="GET", headers={"X-API-Key": API_KEY, "Content-Type": "application/json"})
-                # urllib suit les redirects par défaut, mais on capture l'URL finale
-                with urllib.request.urlopen(req, timeout=10) as response:
-                    data = response.read().decode('utf-8')
-                    return {
-                        "success": True,
-                        "call_id": call_id,
-                        "url": response.url,
-                        "content_type": response.headers.get("content-type"),
-                        "message": "Enregistrement récupéré"
-                    }
-            except urllib.error.HTTPError as e:
-                if e.code == 302:
-                    location = e.headers.get("Location")
-                    return {"success": True, "call_id": call_id, "recording_url": location, "message": "Redirect vers l'enregistrement"}
-                return {"error": f"HTTP Error {e.code}", "status_code": e.code}
-            except Exception as e:
-                return {"error": str(e)}
-        elif name == "get_call_tools":
-            call_id = arguments.get("call_id")
+                if response.status != 200:
+                    return {"error": f"Erreur ({response.status})", "status_code": response.status}
+                path = recording_path(call_id, arguments.get("filename"), response.headers.get("content-type"))
+                written = 0
+                try:
+                    with open(path + ".part", "wb") as f:
+                        while True:
+                            chunk = response.read(chunk_size)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                            written += len(chunk)
+                    os.replace(path + ".part", path)
+                except BaseException:
+                    remove_partial(path + ".part")
+                    raise
+            finally:
+                pool.finish(conn, response)
+            return download_report(call_id, path, written, time.monotonic() - started)
+        except Exception as e:
+            return {"error": str(e)}
+
+    # Pool dédié aux tools composites (get_call_bundle, suppressions en masse) :
+    # ses tâches n'attendent jamais d'autres tâches du même pool (pas d'interblocage)
+    _fanout_executor = ThreadPoolExecutor(max_workers=HTTP_MAX_CONCURRENCY)
+
+    def get_call_bundle(arguments):
+        """Récupère appel, messages, étapes (avec leurs messages) et outils de plusieurs appels"""
+        try:
+            call_ids = id_list(arguments.get("call_ids"), "call_ids")
+        except ValueError as e:
+            return {"error": str(e)}
+        parts = {
+            call_id: {key: _fanout_executor.submit(handle_tool, tool, dict(extra, call_id=call_id))
+                      for key, (tool, extra) in BUNDLE_PARTS.items()}
+            for call_id in call_ids
+        }
+        stage_messages = {}
+        for call_id in call_ids:
+            stage_messages[call_id] = {
+                stage_id: _fanout_executor.submit(handle_tool, "get_stage_messages",
+                                                  {"call_id": call_id, "stage_id": stage_id, "all_pages": True})
+                for stage_id in bundle_stage_ids(parts[call_id]["stages"].result())
+            }
+        return bundle_result([
+            merge_bundle(call_id,
+                         {key: future.result() for key, future in parts[call_id].items()},
+                         {stage_id: future.result() for stage_id, future in stage_messages[call_id].items()})
+            for call_id in call_ids
+        ])
+
+    def matching_calls(criteria, max_items):
+        """Parcourt list_calls page par page et garde les ids qui passent le filtre"""
+        ids = []
+        url = f"{API_BASE}/calls?" + urlencode({"limit": BULK_SCAN_PAGE_SIZE})
+        for items in iter_pages(url, PageCollector(keep=False)):
+            ids.extend(call["callId"] for call in items if call_matches(call, criteria))
+            if max_items and len(ids) >= max_items:
+                break
+        return ids[:max_items] if max_items else ids
+
+    def bulk_delete(name, arguments):
+        """Suppressions concurrentes au rythme de bulk_delete_bucket, résultat par id"""
+        try:
+            tool, id_arg, ids, criteria, values = bulk_request(name, arguments)
+            if ids is None:
+                ids = matching_calls(criteria, values.get("max_items"))
+            if values["dry_run"]:
+                return bulk_report(ids, None, True)
+            started = time.monotonic()
+            futures = {}
+            for item_id in ids:
+                time.sleep(bulk_delete_bucket.reserve())
+                futures[item_id] = _fanout_executor.submit(handle_tool, tool, {id_arg: item_id})
+            results = {item_id: future.result() for item_id, future in futures.items()}
+            return bulk_report(ids, results, False, time.monotonic() - started)
+        except Exception as e:
+            return {"error": str(e)}
+
+    def archive_pages(url, add_page, max_items=None):
+        """Suit les pages de /calls tant que add_page(items, curseur suivant) renvoie True"""
+        collector = PageCollector(max_items, keep=False, resize=True)
+        for items in iter_pages(url, collector):
+            if not add_page(items, collector.next):
+                break
+
+    def sync_call_archive(arguments):
+        """Synchronise l'archive locale : nouveaux appels, historique, messages et étapes"""
+        try:
+            values = tool_values("sync_call_archive", arguments)
+        except ValueError as e:
+            return {"error": str(e)}
+        sync = ArchiveSync(call_archive, values["max_calls"])
+        try:
+            params, max_items = sync.head_pages()
+            archive_pages(f"{API_BASE}/calls?" + urlencode(params), sync.head_page, max_items)
+            if sync.backfill_url():
+                archive_pages(sync.backfill_url(), sync.backfill_page, sync.max_calls - sync.scanned)
+            sync.refresh(list(_fanout_executor.map(lambda call_id: handle_tool("get_call", {"call_id": call_id}),
+                                                   call_archive.pending_ids())))
+            if values["details"]:
+                details = {
+                    call_id: (_fanout_executor.submit(handle_tool, "get_call_messages",
+                                                      {"call_id": call_id, "all_pages": True}),
+                              _fanout_executor.submit(handle_tool, "get_call_stages", {"call_id": call_id}))
+                    for call_id in call_archive.ids_needing_details(values["max_calls"])
+                }
+                stage_messages = {
+                    call_id: {stage_id: _fanout_executor.submit(handle_tool, "get_stage_messages",
+                                                                {"call_id": call_id, "stage_id": stage_id,
+                                                                 "all_pages": True})
+                              for stage_id in sync.stage_ids(stages.result())}
+                    for call_id, (messages, stages) in details.items()
+                }
+                for call_id, (messages, stages) in details.items():
+                    sync.add_details(call_id, messages.result(), stages.result(),
+                                     {stage_id: future.result()
+                                      for stage_id, future in stage_messages[call_id].items()})
+        except Exception as e:
+            return sync.result(error=e)
+        return sync.result()
+
+    def call_stats(arguments):
+        """Statistiques agrégées (par agent, jour, raison de fin ; usage des tools), calculées côté serveur"""
+        try:
+            stats = CallStats(arguments)
+            if stats.source == "archive":
+                if not call_archive.exists():
+                    return archive_missing()
+                stats.load_archive(call_archive)
+            else:
+                params, max_items = stats.api_pages()
+                archive_pages(f"{API_BASE}/calls?" + urlencode(params), stats.add_page, max_items)
+            if stats.with_tools:
+                stats.add_tools(list(_fanout_executor.map(
+                    lambda call_id: handle_tool("get_call_tools", {"call_id": call_id}), stats.call_ids)))
+            return stats.result()
+        except Exception as e:
+            return {"error": str(e)}
+
+    # Tools qui ne suivent pas le schéma requête -> JSON du registre
+    HANDLERS = {
+        "get_call_recording": get_call_recording,
+        "download_call_recording": download_call_recording,
+        "get_call_bundle": get_call_bundle,
+        "bulk_delete_calls": lambda arguments: bulk_delete("bulk_delete_calls", arguments),
+        "bulk_delete_agents": lambda arguments: bulk_delete("bulk_delete_agents", arguments),
+        "bulk_delete_webhooks": lambda arguments: bulk_delete("bulk_delete_webhooks", arguments),
+        "get_cache_stats": lambda arguments: response_cache.stats(),
+        "get_server_metrics": lambda arguments: server_metrics_report(),
+        "sync_call_archive": sync_call_archive,
+        "query_call_archive": archive_query_result,
+        "get_archived_call": archived_call_result,
+        "call_stats": call_stats,
+        "search_transcripts": transcript_search_result,
+    }
+
+    # Threads dédiés au préchargement des pages (jamais ceux qui exécutent les tools,
+    # pour qu'un tool qui attend sa page suivante ne puisse pas bloquer le pool)
+    _prefetch_executor = ThreadPoolExecutor(max_workers=HTTP_MAX_CONCURRENCY)
+
+    def fetch_page(url):
+        status, _, data = http_request("GET", url, headers=HEADERS, follow_redirects=True)
+        if status != 200:
+            raise UpstreamError(status)
+        return json_loads(data)
+
+    def iter_pages(url, collector):
+        """Suit les curseurs "next" paresseusement, en préchargeant la page suivante
+
+        La page suivante n'est demandée que si collector en veut encore : on ne
+        récupère jamais de page au-delà de max_items.
+        """
+        future = _prefetch_executor.submit(fetch_page, url)
+        try:
+            while future is not None:
+                data = future.result()
+                next_url = collector.add(data)
+                future = _prefetch_executor.submit(fetch_page, next_url) if next_url else None
+                yield collector.page
+        finally:
+            if future is not None:
+                future.cancel()
+
+    def collect_pages(path, params, values):
+        collector = PageCollector(values.get("max_items"))
+        params = first_page_params(params, values)
+        url = f"{API_BASE}{path}" + (f"?{urlencode(params)}" if params else "")
+        try:
+            for _ in iter_pages(url, collector):
+                pass
+        except Exception as e:
+            return collector.result(error=e)
+        return collector.result()
+
+    def stream_deleted_calls(arguments, notify):
+        """Parcourt /deleted_calls page par page ; chaque page part dans notify(items, collector)"""
+        collector = PageCollector(arguments.get("max_items"), keep=False)
+        try:
+            _, values, path, params, _ = build_request("list_deleted_calls_stream", arguments)
+            params = first_page_params(params, values)
+            url = f"{API_BASE}{path}" + (f"?{urlencode(params)}" if params else "")
+            for items in iter_pages(url, collector):
+                notify(items, collector)
+        except Exception as e:
+            return collector.result(error=e)
+        return collector.result()
+
+    # Tools qui émettent des notifications pendant leur exécution
+    STREAM_HANDLERS = {
+        "list_deleted_calls_stream": stream_deleted_calls,
+    }
+
+    def handle_tool(name, arguments, notify=lambda items, collector: None, passthrough=False):
+        """Exécute un tool (recherche directe dans le registre TOOLS)
+
+        passthrough : une réponse non transformée peut revenir en RawJSON (cf. tool_result)
+        """
+        if name not in TOOLS:
+            return {"error": f"Tool '{name}' not found"}
+        try:
+            arguments = tool_values(name, arguments)
+        except InvalidArguments as e:
+            return {"error": str(e), "status_code": e.status_code}
+        if name in HANDLERS:
+            return HANDLERS[name](arguments or {})
+        if name in STREAM_HANDLERS:
+            return STREAM_HANDLERS[name](arguments or {}, notify)
+        try:
+            spec, values, path, params, body = build_request(name, arguments)
+            if wants_all_pages(spec, values):
+                return collect_pages(path, params, values)
+            fresh, stale = cache_lookup(spec, path, params)
+            if fresh is not None:
+                return tool_result(spec, values, 200, fresh["raw"], fresh["data"], passthrough)
+            url = f"{API_BASE}{path}" + (f"?{urlencode(params)}" if params else "")
+            payload = json.dumps(body).encode('utf-8') if body is not None else None
+            status, response_headers, data = http_request(
+                spec["method"], url, body=payload, headers={**HEADERS, **conditional_headers(stale)},
+                follow_redirects=(spec["method"] == "GET"))
+            if status == 304 and stale is not None:
+                entry = cache_revalidated(spec, path, params, stale)
+            else:
+                entry = cache_store(spec, values, path, params, status, data, response_headers)
+            if entry is not None:
+                return tool_result(spec, values, 200, entry["raw"], entry["data"], passthrough)
+            return tool_result(spec, values, status, data, passthrough=passthrough)
+        except CircuitOpenError as e:
+            return circuit_open_result(e, spec, values, path, params)
+        except Exception as e:
+            return {"error": str(e)}
+
+    # Les tools/call sont exécutés dans un pool borné : un appel lent à
+    # l'API ne bloque plus la lecture des requêtes suivantes. Les réponses
+    # sont écrites dès qu'elles sont prêtes, corrélées par leur "id".
+    _stdout_lock = threading.Lock()
+
+    def write_line(line):
+        """Écrit une ligne JSON-RPC déjà sérialisée sur stdout, sans entrelacement"""
+        with _stdout_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def write_message(message):
+        """Écrit un message JSON-RPC sur stdout"""
+        write_line(json_dumps(message))
+
+    def page_notifier(request, write=write_line):
+        """notify(items, collector) : une page = une notification liée à la requête
+
+        notifications/progress si le client a fourni un progressToken, sinon
+        notifications/message (même forme que FastMCP).
+        """
+        token = (request.get("params", {}).get("_meta") or {}).get("progressToken")
+        name = request.get("params", {}).get("name")
+
+        def notify(items, collector):
+            if token is not None:
+                params = {"progressToken": token, "progress": collector.count, "message": json_dumps(items)}
+                if collector.total is not None:
+                    params["total"] = collector.total
+                write(json_dumps({"jsonrpc": "2.0", "method": "notifications/progress", "params": params}))
+            else:
+                write(json_dumps({"jsonrpc": "2.0", "method": "notifications/message", "params": {
+                    "level": "info", "logger": name, "data": {"msg": json_dumps(items), "extra": None}}}))
+        return notify
+
+    def call_tool(request, write=write_line, notify_write=None):
+        """Exécute un tools/call (dans un thread du pool) et écrit sa réponse
+
+        notify_write reçoit les notifications de pages (write par défaut).
+        """
+        params = request.get("params", {})
+        arguments = dict(params.get("arguments") or {})
+        started = time.perf_counter()
+        try:
             try:
-                req = urllib.request.Request(f"{API_BASE}/calls/{call_id}/tools", method="GET", headers={"X-API-Key": API_KEY, "Content-Type": "application/json"})
-                with urllib.request.urlopen(req, timeout=10) as response:
-                    data = response.read().decode('utf-8')
-                    tools_list = json.loads(data)
-                    return {
-                        "call_id": call_id,
-                        "tools": tools_list if isinstance(tools_list, list) else [tools_list],
-                        "count": len(tools_list) if isinstance(tools_list, list) else 1
-                    }
-            except urllib.error.HTTPError as e:
-                return {"error": f"HTTP Error {e.code}", "status_code": e.code}
-            except Exception as e:
-                return {"error": str(e)}
-        elif name == "get_call_stages":
-            call_id = arguments.get("call_id")
-            return make_request(f"/calls/{call_id}/stages")
-        elif name == "get_call_stage":
-            call_id = arguments.get("call_id")
-            stage_id = arguments.get("stage_id")
-            return make_request(f"/calls/{call_id}/stages/{stage_id}")
-        elif name == "get_stage_messages":
-            call_id = arguments.get("call_id")
-            stage_id = arguments.get("stage_id")
-            limit = arguments.get("limit", 20)
-            return make_request(f"/calls/{call_id}/stages/{stage_id}/messages?limit={limit}")
-        elif name == "delete_call":
-            call_id = arguments.get("call_id")
-            return make_request(f"/calls/{call_id}", method="DELETE")
-        
-        # AGENTS
-        elif name == "list_agents":
-            limit = arguments.get("limit", 20)
-            return make_request(f"/agents?limit={limit}")
-        elif name == "get_agent":
-            agent_id = arguments.get("agent_id")
-            return make_request(f"/agents/{agent_id}")
-        elif name == "list_agent_calls":
-            agent_id = arguments.get("agent_id")
-            limit = arguments.get("limit", 20)
-            return make_request(f"/agents/{agent_id}/calls?limit={limit}")
-        elif name == "update_agent_prompt":
-            agent_id = arguments.get("agent_id")
-            prompt = arguments.get("prompt")
-            return make_request(f"/agents/{agent_id}", method="PATCH", json_data={"systemPrompt": prompt})
-        elif name == "delete_agent":
-            agent_id = arguments.get("agent_id")
-            return make_request(f"/agents/{agent_id}", method="DELETE")
-        
-        # VOICES
-        elif name == "list_voices":
-            limit = arguments.get("limit", 20)
-            return make_request(f"/voices?limit={limit}")
-        elif name == "get_voice":
-            voice_id = arguments.get("voice_id")
-            return make_request(f"/voices/{voice_id}")
-        
-        # MODELS
-        elif name == "list_models":
-            return make_request("/models")
-        
-        # WEBHOOKS
-        elif name == "list_webhooks":
-            return make_request("/webhooks")
-        elif name == "get_webhook":
-            webhook_id = arguments.get("webhook_id")
-            return make_request(f"/webhooks/{webhook_id}")
-        elif name == "create_webhook":
-            agent_id = arguments.get("agent_id")
-            url = arguments.get("url")
-            events = arguments.get("events", [])
-            return make_request("/webhooks", method="POST", json_data={"agentId": agent_id, "url": url, "events": events})
-        elif name == "delete_webhook":
-            webhook_id = arguments.get("webhook_id")
-            return make_request(f"/webhooks/{webhook_id}", method="DELETE")
-        
-        # DELETED CALLS
-        elif name == "get_deleted_calls":
-            limit = arguments.get("limit", 20)
-            return make_request(f"/deleted_calls?limit={limit}")
-        elif name == "get_deleted_call":
-            call_id = arguments.get("call_id")
-            return make_request(f"/deleted_calls/{call_id}")
-        elif name == "list_deleted_calls_stream":
-            limit = arguments.get("limit", 20)
-            return make_request(f"/deleted_calls?limit={limit}")
-        
-        # RESOURCES
-        elif name == "get_tools_list":
-            limit = arguments.get("limit", 20)
-            return make_request(f"/tools?limit={limit}")
-        elif name == "get_tool":
-            tool_id = arguments.get("tool_id")
-            return make_request(f"/tools/{tool_id}")
-        elif name == "get_call_usage":
-            return make_request("/accounts/me/call_usage")
-        
+                fields, max_bytes = shape_arguments(arguments)
+                result = shape_result(handle_tool(params.get("name"), arguments,
+                                                  page_notifier(request, notify_write or write), JSON_PASSTHROUGH),
+                                      fields, max_bytes)
+            except InvalidArguments as e:
+                result = {"error": str(e), "status_code": e.status_code}
+            record_tool(params.get("name"), time.perf_counter() - started, result)
+            # Pas de second encodage du corps de l'API quand il arrive en RawJSON
+            text = result.text() if isinstance(result, RawJSON) else json_dumps(result)
+            response = {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "result": {"content": [{"type": "text", "text": text}]}
+            }
+        except Exception as e:
+            record_tool(params.get("name"), time.perf_counter() - started, {"error": str(e)})
+            response = {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "error": {"code": -32603, "message": str(e)}
+            }
+        write(json_dumps(response))
+
+    def dispatch(request, write, run_tool):
+        """Traite un message JSON-RPC ; write(ligne) reçoit chaque ligne à renvoyer
+
+        Les tools/call sont confiés à run_tool(request), qui écrit la réponse
+        quand l'appel se termine (stdio : pool de threads, HTTP : thread de la requête).
+        """
+        method = request.get("method")
+        handshake = handshake_response(request)
+
+        if handshake is not None:
+            write(handshake)
+            return
+
+        elif method == "tools/call":
+            run_tool(request)
+            return
+
+        elif "id" not in request:
+            # Notification (ex. notifications/initialized) : pas de réponse
+            return
+
         else:
-            return {"error": f"Tool '{name}' not found"}
+            response = {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "error": {"code": -32601, "message": "Method not found"}
+            }
+
+        write(json_dumps(response))
+
+    def main(replay=()):
+        """Main loop
+
+        replay : lignes déjà lues par stdio_handshake, traitées avant la suite de stdin
+        """
+        # JSON-RPC en UTF-8 quel que soit l'encodage de la console (json_dumps garde les non-ASCII)
+        sys.stdin.reconfigure(encoding="utf-8")
+        sys.stdout.reconfigure(encoding="utf-8")
+        executor = ThreadPoolExecutor(max_workers=HTTP_MAX_CONCURRENCY)
+        lines = itertools.chain(replay, iter(sys.stdin.readline, ""))
+        # Limite le nombre de requêtes en attente pour ne pas lire stdin sans fin
+        pending = threading.BoundedSemaphore(HTTP_MAX_CONCURRENCY * 4)
+
+        def run_tool(request):
+            pending.acquire()
+            future = executor.submit(call_tool, request)
+            future.add_done_callback(lambda _: pending.release())
 
-    def main():
-        """Main loop"""
-        while True:
+        try:
+            while True:
+                try:
+                    line = next(lines, "")
+                    if not line:
+                        break
+                    if not line.strip():
+                        continue
+
+                    dispatch(json_loads(line), write_line, run_tool)
+
+                except Exception as e:
+                    try:
+                        write_message({
+                            "jsonrpc": "2.0",
+                            "error": {"code": -32700, "message": str(e)}
+                        })
+                    except Exception:
+                        pass
+        finally:
+            # Stdin fermé : on termine les appels en cours avant de quitter
+            executor.shutdown(wait=True)
+
+    # Réponse à un message HTTP qui n'est pas un objet JSON-RPC (élément de lot, lot vide)
+    INVALID_REQUEST = {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}}
+
+    class MCPRequestHandler(BaseHTTPRequestHandler):
+        """Transport streamable HTTP (POST MCP_PATH) + /health, /ready et /metrics
+
+        Chaque requête HTTP est servie dans son propre thread ; les tools/call
+        attendent une place parmi HTTP_MAX_CONCURRENCY. La réponse est du JSON, ou
+        un flux SSE (notifications de pages puis réponse) si le client accepte
+        text/event-stream.
+        """
+
+        protocol_version = "HTTP/1.1"
+        tool_slots = threading.BoundedSemaphore(HTTP_MAX_CONCURRENCY)
+
+        def log_message(self, format, *args):
+            pass  # stdout/stderr restent silencieux, comme en stdio
+
+        def _reply(self, status, body=b"", content_type="application/json", headers=()):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _origin_refused(self):
+            """Répond 403 si l'Origin n'est pas admise (voir origin_allowed)"""
+            if origin_allowed(self.headers.get("Origin")):
+                return False
+            self._reply(403, json_dumps({"jsonrpc": "2.0", "id": None,
+                                         "error": {"code": -32000, "message": "Origin non autorisée"}}).encode())
+            return True
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == MCP_PATH and self._origin_refused():
+                return
+            if path == "/health":
+                self._reply(200, json.dumps(health_report()).encode())
+            elif path == "/ready":
+                ready, body = readiness_report()
+                self._reply(200 if ready else 503, json.dumps(body).encode())
+            elif path == "/metrics":
+                self._reply(200, prometheus_text().encode(), "text/plain; version=0.0.4; charset=utf-8")
+            elif path == MCP_PATH:
+                # Pas de flux serveur -> client hors d'une requête
+                self._reply(405, headers=[("Allow", "POST, DELETE")])
+            else:
+                self._reply(404)
+
+        def do_DELETE(self):
+            # Sessions sans état côté serveur : rien à libérer
+            if urlsplit(self.path).path != MCP_PATH:
+                self._reply(404)
+            elif not self._origin_refused():
+                self._reply(200)
+
+        def do_POST(self):
+            if urlsplit(self.path).path != MCP_PATH:
+                self._reply(404)
+                return
+            if self._origin_refused():
+                return
             try:
-                line = sys.stdin.readline()
-                if not line:
-                    break
-                
-                request = json.loads(line)
-                
-                if request.get("method") == "initialize":
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request.get("id"),
-                        "result": {
-                            "protocolVersion": "2024-11-05",
-                            "capabilities": {},
-                            "serverInfo": {
-                                "name": "ultravox-mcp",
-                                "version": "30.0.0"
-                            }
-                        }
-                    }
-                
-                elif request.get("method") == "tools/list":
-                    tools = [
-                        {"name": "get_account_info", "description": "Get account info"},
-                        {"name": "get_open_api_schema", "description": "Get OpenAPI schema"},
-                        {"name": "list_calls", "description": "List calls"},
-                        {"name": "get_call", "description": "Get call details"},
-                        {"name": "get_call_messages", "description": "Get call messages"},
-                        {"name": "get_call_recording", "description": "Get call recording"},
-                        {"name": "get_call_tools", "description": "Get call tools"},
-                        {"name": "get_call_stages", "description": "Get call stages"},
-                        {"name": "get_call_stage", "description": "Get call stage details"},
-                        {"name": "get_stage_messages", "description": "Get stage messages"},
-                        {"name": "delete_call", "description": "Delete a call"},
-                        {"name": "list_agents", "description": "List agents"},
-                        {"name": "get_agent", "description": "Get agent details"},
-                        {"name": "list_agent_calls", "description": "List agent calls"},
-                        {"name": "update_agent_prompt", "description": "Update agent prompt"},
-                        {"name": "delete_agent", "description": "Delete an agent"},
-                        {"name": "list_voices", "description": "List voices"},
-                        {"name": "get_voice", "description": "Get voice details"},
-                        {"name": "list_models", "description": "List models"},
-                        {"name": "list_webhooks", "description": "List webhooks"},
-                        {"name": "get_webhook", "description": "Get webhook details"},
-                        {"name": "create_webhook", "description": "Create a webhook"},
-                        {"name": "delete_webhook", "description": "Delete a webhook"},
-                        {"name": "get_deleted_calls", "description": "Get deleted calls"},
-                        {"name": "get_deleted_call", "description": "Get deleted call details"},
-                        {"name": "list_deleted_calls_stream", "description": "List deleted calls stream"},
-                        {"name": "get_tools_list", "description": "Get tools list"},
-                        {"name": "get_tool", "description": "Get tool details"},
-                        {"name": "get_call_usage", "description": "Get call usage"},
-                    ]
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request.get("id"),
-                        "result": {"tools": tools}
-                    }
-                
-                elif request.get("method") == "tools/call":
-                    tool_name = request.get("params", {}).get("name")
-                    arguments = request.get("params", {}).get("arguments", {})
-                    result = handle_tool(tool_name, arguments)
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request.get("id"),
-                        "result": {"content": [{"type": "text", "text": json.dumps(result)}]}
-                    }
-                
+                payload = json_loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            except ValueError as e:
+                self._reply(400, json.dumps({"jsonrpc": "2.0", "id": None,
+                                             "error": {"code": -32700, "message": str(e)}}).encode())
+                return
+            messages = payload if isinstance(payload, list) else [payload]
+            if not messages:
+                self._reply(400, json_dumps(INVALID_REQUEST).encode())
+                return
+            # Les éléments qui ne sont pas des objets reçoivent chacun une erreur -32600
+            requests = [message for message in messages if isinstance(message, dict)]
+            headers = []
+            if any(message.get("method") == "initialize" for message in requests):
+                headers.append(("Mcp-Session-Id", uuid.uuid4().hex))
+            if len(requests) == len(messages) and not any("id" in message and "method" in message
+                                                          for message in requests):
+                self._reply(202, headers=headers)  # notifications ou réponses du client
+                return
+
+            if "text/event-stream" in self.headers.get("Accept", ""):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.close_connection = True
+                write_lock = threading.Lock()
+
+                def write(line):
+                    with write_lock:
+                        self.wfile.write(b"event: message\ndata: " + line.encode() + b"\n\n")
+                        self.wfile.flush()
+
+                self._dispatch(messages, write, write)
+                return
+
+            # Réponse JSON : les notifications de pages n'ont pas de canal, on les ignore
+            lines = []
+            self._dispatch(messages, lines.append, lambda line: None)
+            body = "[" + ",".join(lines) + "]" if isinstance(payload, list) else lines[0]
+            self._reply(200, body.encode(), headers=headers)
+
+        def _dispatch(self, messages, write, notify_write):
+            def run_tool(request):
+                with self.tool_slots:
+                    call_tool(request, write, notify_write)
+
+            for message in messages:
+                if isinstance(message, dict):
+                    dispatch(message, write, run_tool)
                 else:
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request.get("id"),
-                        "error": {"code": -32601, "message": "Method not found"}
-                    }
-                
-                print(json.dumps(response))
-                sys.stdout.flush()
-            
-            except Exception as e:
-                try:
-                    print(json.dumps({
-                        "jsonrpc": "2.0",
-                        "error": {"code": -32700, "message": str(e)}
-                    }))
-                    sys.stdout.flush()
-                except:
-                    pass
+                    write(json_dumps(INVALID_REQUEST))
+
+    def serve_http(sock):
+        """Sert MCP_PATH, /health, /ready et /metrics sur sock (un thread par requête)"""
+        server = ThreadingHTTPServer(sock.getsockname()[:2], MCPRequestHandler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+        server.daemon_threads = True
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        # SIGTERM (docker stop, run_workers) arrête la boucle comme Ctrl+C : socket fermé, code de sortie 0
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, stop)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
 
     if __name__ == "__main__":
-        main()
+        if MCP_TRANSPORT == "stdio":
+            main(STDIO_HANDSHAKE[1] if STDIO_HANDSHAKE else ())
+        elif MCP_TRANSPORT in ("http", "streamable-http"):
+            run_workers(serve_http)
+        else:
+            sys.exit(f"MCP_TRANSPORT={MCP_TRANSPORT} nécessite fastmcp (la version stdlib sert stdio et http)")
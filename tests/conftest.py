@@ -0,0 +1,81 @@
+"""Fixtures communes : server.py est importé une fois, configuré contre la fausse API locale
+
+Les variables d'environnement sont lues à l'import de server.py : elles sont donc
+fixées ici, avant l'import. Les tests tournent sur la version installée (FastMCP
+si fastmcp et httpx sont présents, sinon fallback stdlib).
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_api import start_fake_api  # noqa: E402
+
+FAKE_API, API_BASE = start_fake_api(calls=30)
+DATA_DIR = tempfile.mkdtemp(prefix="ultravox-mcp-tests-")
+os.environ.update({
+    "ULTRAVOX_API_BASE": API_BASE,
+    "ULTRAVOX_RETRIES": "0",              # une erreur de la fausse API est renvoyée telle quelle
+    "ULTRAVOX_BREAKER_THRESHOLD": "3",
+    "ULTRAVOX_CACHE": "true",
+    "ULTRAVOX_CACHE_BACKEND": "memory",
+    "ULTRAVOX_CACHE_PATH": os.path.join(DATA_DIR, "cache.sqlite3"),
+    "ULTRAVOX_ARCHIVE_PATH": os.path.join(DATA_DIR, "archive.sqlite3"),
+    "ULTRAVOX_RECORDINGS_DIR": os.path.join(DATA_DIR, "recordings"),
+    "MCP_TRANSPORT": "stdio",
+})
+
+import server  # noqa: E402
+
+LOOP = asyncio.new_event_loop()  # le client httpx partagé reste sur une seule boucle
+
+
+@pytest.fixture
+def fake_api():
+    """Fausse API remise à zéro (compteurs, erreurs simulées) et cache de réponses vide"""
+    FAKE_API.error_rate = 0.0
+    FAKE_API.retry_after = None
+    FAKE_API.request_count = 0
+    FAKE_API.not_modified = 0
+    server.response_cache.clear()
+    yield FAKE_API
+    FAKE_API.error_rate = 0.0
+    server.response_cache.clear()
+    for breaker in server.circuit_breakers.breakers.values():
+        breaker.record(True)
+
+
+@pytest.fixture
+def tool_text():
+    """tool_text(name, **arguments) -> texte du contenu renvoyé par tools/call, quelle que soit la version"""
+    if server.USE_FASTMCP:
+        from fastmcp import Client
+
+        async def run(name, arguments):
+            async with Client(server.mcp) as client:
+                result = await client.call_tool(name, arguments, raise_on_error=False)
+            return result.content[0].text
+
+        return lambda name, **arguments: LOOP.run_until_complete(run(name, arguments))
+
+    def call(name, **arguments):
+        lines = []
+        server.call_tool({"jsonrpc": "2.0", "id": 1, "params": {"name": name, "arguments": arguments}},
+                         lines.append, lambda line: None)
+        return json.loads(lines[-1])["result"]["content"][0]["text"]
+
+    return call
+
+
+@pytest.fixture
+def call_tool(tool_text):
+    """call_tool(name, **arguments) -> résultat décodé du tools/call"""
+    return lambda name, **arguments: json.loads(tool_text(name, **arguments))
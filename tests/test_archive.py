@@ -0,0 +1,122 @@
+"""Archive des appels : étapes des messages, requêtes FTS5 et agrégats de call_stats"""
+
+import pytest
+
+from conftest import server
+
+
+# ===== _message_stages =====
+def test_single_stage_call_needs_no_stage_messages():
+    messages = [{"role": "USER", "text": "bonjour"}, {"role": "AGENT", "text": "bonjour"}]
+    assert server._message_stages(messages, [{"callStageId": "s1"}], {}) == ["s1", "s1"]
+
+
+def test_messages_are_matched_to_stages_in_order():
+    messages = [{"role": "USER", "text": "oui"}, {"role": "AGENT", "text": "suite"}, {"role": "USER", "text": "oui"}]
+    stage_messages = {
+        "s1": [{"role": "USER", "text": "oui"}],
+        "s2": [{"role": "AGENT", "text": "suite"}, {"role": "USER", "text": "oui"}],
+    }
+    stages = [{"callStageId": "s1"}, {"callStageId": "s2"}]
+    assert server._message_stages(messages, stages, stage_messages) == ["s1", "s2", "s2"]
+
+
+def test_unmatched_message_has_no_stage():
+    stages = [{"callStageId": "s1"}, {"callStageId": "s2"}]
+    assert server._message_stages([{"role": "USER", "text": "?"}], stages, {"s1": [], "s2": []}) == [None]
+
+
+# ===== transcript_query =====
+@pytest.mark.parametrize("text, query", [
+    ("remboursement commande", '"remboursement" "commande"'),
+    ('"délai de livraison" colis', '"délai de livraison" "colis"'),
+    ("rembours*", '"rembours"*'),
+    ("l'appel d'hier -- AND", '"l\'appel" "d\'hier" "--" "AND"'),
+    ('"" *', ""),
+])
+def test_transcript_query(text, query):
+    assert server.transcript_query(text) == query
+
+
+# ===== CallStats =====
+CALLS = [
+    {"callId": "c1", "agentId": "a1", "created": "2025-10-09T10:00:00Z", "joined": "2025-10-09T10:00:00Z",
+     "ended": "2025-10-09T10:01:00Z", "endReason": "hangup"},
+    {"callId": "c2", "agentId": "a1", "created": "2025-10-09T09:00:00Z", "joined": "2025-10-09T09:00:00Z",
+     "ended": "2025-10-09T09:03:00Z", "endReason": "timeout"},
+    {"callId": "c3", "agentId": "a2", "created": "2025-10-08T09:00:00Z", "ended": None, "endReason": "hangup"},
+]
+
+
+def stats(**arguments):
+    return server.CallStats(dict({"source": "api"}, **arguments))
+
+
+def test_groups_by_agent_with_durations():
+    call_stats = stats(group_by="agent")
+    assert call_stats.add_page(CALLS)
+    result = call_stats.result()
+    assert result["calls"] == 3
+    assert result["groups"]["columns"] == ["agent", "calls", "avg_duration_s", "total_duration_s"]
+    assert result["groups"]["rows"] == [["a1", 2, 120.0, 240.0], ["a2", 1, None, 0.0]]
+    assert result["end_reasons"]["rows"] == [["hangup", 2, 0.667], ["timeout", 1, 0.333]]
+
+
+def test_groups_by_several_keys():
+    call_stats = stats(group_by="day,end_reason")
+    call_stats.add_page(CALLS)
+    assert [row[:3] for row in call_stats.result()["groups"]["rows"]] == [
+        ["2025-10-08", "hangup", 1], ["2025-10-09", "hangup", 1], ["2025-10-09", "timeout", 1]]
+
+
+def test_pagination_stops_at_since():
+    call_stats = stats(group_by="agent", since="2025-10-09")
+    assert not call_stats.add_page(CALLS, next_url="http://api/calls?cursor=3")
+    assert call_stats.result()["calls"] == 2
+
+
+def test_max_calls_truncates():
+    call_stats = stats(group_by="agent", max_calls=2)
+    assert not call_stats.add_page(CALLS)
+    result = call_stats.result()
+    assert result["calls"] == 2
+    assert result["truncated"] is True
+
+
+def test_tool_usage_counts_calls_not_invocations():
+    call_stats = stats(group_by="agent", tools=True)
+    call_stats.add_page(CALLS)
+    call_stats.add_tools([{"tools": [{"name": "lookup"}, {"name": "lookup"}, {"name": "transfer"}]},
+                          {"tools": [{"name": "lookup"}]},
+                          {"error": "Erreur (404)", "status_code": 404}])
+    tools = call_stats.result()["tools"]
+    assert tools["rows"] == [["lookup", 2, 1.0], ["transfer", 1, 0.5]]
+    assert (tools["calls_checked"], tools["errors"]) == (2, 1)
+
+
+def test_unknown_group_is_rejected():
+    with pytest.raises(ValueError):
+        stats(group_by="agent,country")
+
+
+# ===== Contre la fausse API =====
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """Archive vide, propre au test"""
+    archive = server.CallArchive(str(tmp_path / "archive.sqlite3"))
+    monkeypatch.setattr(server, "call_archive", archive)
+    return archive
+
+
+def test_first_sync_archives_at_most_max_calls(fake_api, call_tool, archive):
+    result = call_tool("sync_call_archive", max_calls=7, details=False)
+    assert (result["new_calls"], result["history_pending"]) == (7, True)
+    assert fake_api.request_count == 1  # une page de 7, pas de page suivante préchargée
+    result = call_tool("sync_call_archive", max_calls=10, details=False)
+    assert result["archive"]["calls"] == 17
+
+
+def test_api_call_stats_reads_at_most_max_calls(fake_api, call_tool, archive):
+    result = call_tool("call_stats", source="api", max_calls=5)
+    assert (result["calls"], result["truncated"]) == (5, True)
+    assert fake_api.request_count == 1
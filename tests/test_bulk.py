@@ -0,0 +1,61 @@
+"""Suppressions en masse : bulk_request, call_matches et bulk_delete_* contre la fausse API"""
+
+import pytest
+
+from conftest import server
+
+CALL = {"callId": "c1", "agentId": "a1", "endReason": "hangup", "created": "2025-10-09T10:00:00Z"}
+
+
+@pytest.mark.parametrize("criteria, matches", [
+    ({}, True),
+    ({"agent_id": "a1", "end_reason": "hangup"}, True),
+    ({"agent_id": "a2"}, False),
+    ({"created_after": "2025-10-09T10:00:00Z"}, True),   # borne incluse
+    ({"created_before": "2025-10-09T10:00:00Z"}, False),  # borne exclue
+    ({"created_after": "2025-10-09", "created_before": "2025-10-10"}, True),
+])
+def test_call_filter(criteria, matches):
+    assert server.call_matches(CALL, criteria) is matches
+
+
+def test_ids_and_filter_are_exclusive():
+    with pytest.raises(ValueError):
+        server.bulk_request("bulk_delete_calls", {"call_ids": ["c1"], "agent_id": "a1"})
+
+
+# ===== Contre la fausse API =====
+@pytest.fixture
+def calls(fake_api, monkeypatch):
+    """Appels de la fausse API restaurés après le test (les suppressions les retirent)"""
+    monkeypatch.setitem(fake_api.data, "calls", list(fake_api.data["calls"]))
+    return fake_api.data["calls"]
+
+
+def test_dry_run_by_default_lists_the_matching_calls(calls, call_tool):
+    result = call_tool("bulk_delete_calls", agent_id="agent-001", max_items=3)
+    assert result["dry_run"] is True
+    assert result["ids"] == ["call-00001", "call-00006", "call-00011"]
+    assert len(calls) == 30
+
+
+def test_delete_by_ids_reports_each_id(calls, call_tool):
+    result = call_tool("bulk_delete_calls", call_ids=["call-00028", "call-00029", "nope"], dry_run=False)
+    assert (result["requested"], result["deleted"], result["failed"]) == (3, 2, 1)
+    assert result["results"]["call-00028"]["success"] is True
+    assert result["results"]["nope"]["status_code"] == 404
+    assert [call["callId"] for call in calls if call["callId"] in ("call-00028", "call-00029")] == []
+
+
+def test_delete_by_filter(calls, call_tool):
+    result = call_tool("bulk_delete_calls", agent_id="agent-004", end_reason="unjoined", dry_run=False)
+    assert result["deleted"] == result["requested"] > 0
+    assert not [call for call in calls if call["agentId"] == "agent-004" and call["endReason"] == "unjoined"]
+
+
+def test_deletes_are_paced_by_the_bulk_bucket(fake_api, call_tool, monkeypatch):
+    monkeypatch.setattr(server, "bulk_delete_bucket", server.TokenBucket(rate=20, burst=1))
+    result = call_tool("bulk_delete_webhooks", webhook_ids=[f"webhook-{i}" for i in range(5)], dry_run=False)
+    assert result["deleted"] == 5
+    assert result["elapsed_s"] >= 0.15  # 4 attentes de 50 ms après le premier jeton
+    assert fake_api.request_count == 5
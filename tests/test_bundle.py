@@ -0,0 +1,48 @@
+"""Dossier d'appel : get_call_bundle (merge_bundle, bundle_result) contre la fausse API"""
+
+from conftest import server
+
+NOT_FOUND = {"error": "Erreur (404)", "status_code": 404}
+
+
+def parts(**overrides):
+    base = {"call": {"callId": "c1"}, "messages": {"results": [{"text": "bonjour"}]},
+            "stages": {"results": [{"callStageId": "s1"}, {"callStageId": "s2"}]}, "tools": {"tools": []}}
+    return dict(base, **overrides)
+
+
+def test_bundle_nests_stage_messages():
+    bundle = server.merge_bundle("c1", parts(), {"s1": {"results": [{"text": "a"}]}, "s2": {"results": []}})
+    assert bundle["messages"] == [{"text": "bonjour"}]
+    assert bundle["stages"] == [{"callStageId": "s1", "messages": [{"text": "a"}]},
+                                {"callStageId": "s2", "messages": []}]
+    assert "errors" not in bundle
+
+
+def test_failed_parts_are_reported_under_errors():
+    bundle = server.merge_bundle("c1", parts(tools=NOT_FOUND), {"s1": NOT_FOUND, "s2": {"results": []}})
+    assert bundle["tools"] is None
+    assert bundle["stages"][0]["messages"] is None
+    assert bundle["errors"] == {"tools": NOT_FOUND, "stages.s1.messages": NOT_FOUND}
+    assert server.bundle_result([bundle])["failed"] == 1
+
+
+# ===== Contre la fausse API =====
+def test_bundle_of_several_calls(fake_api, call_tool):
+    result = call_tool("get_call_bundle", call_ids=["call-00001", "call-00002", "nope"])
+    assert (result["count"], result["failed"]) == (3, 1)
+    first, _, missing = result["results"]
+    assert first["call"]["callId"] == "call-00001"
+    assert len(first["messages"]) == sum(len(stage["messages"]) for stage in first["stages"])
+    assert first["tools"] == [{"name": "hangUp", "count": 1}]
+    assert missing["errors"]["call"]["status_code"] == 404
+
+
+def test_bundle_accepts_a_comma_separated_string(fake_api, call_tool):
+    result = call_tool("get_call_bundle", call_ids="call-00003,call-00004", fields="results[*].call_id")
+    assert result == {"results": [{"call_id": "call-00003"}, {"call_id": "call-00004"}]}
+
+
+def test_bundle_without_ids_is_an_error(fake_api, call_tool):
+    assert "call_ids" in call_tool("get_call_bundle", call_ids=[])["error"]
+    assert fake_api.request_count == 0
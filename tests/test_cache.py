@@ -0,0 +1,127 @@
+"""Cache de réponses (TTLCache, SQLiteCache) et chemins cache / 304 / disjoncteur contre la fausse API"""
+
+import pytest
+
+from conftest import server
+
+
+def entry(body=b'{"ok": true}', etag=None):
+    return {"raw": body, "data": server.json_loads(body), "etag": etag, "last_modified": None}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "sqlite":
+        return server.SQLiteCache(10, path=str(tmp_path / "cache.sqlite3"))
+    return server.TTLCache(10)
+
+
+# ===== TTLCache / SQLiteCache =====
+def test_fresh_entry_is_a_hit(cache):
+    cache.set("/voices", entry(), 60)
+    assert cache.get("/voices")["data"] == {"ok": True}
+    assert cache.get("/models") is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_expired_entry_is_a_miss_but_stays_available_as_stale(cache):
+    cache.set("/voices", entry(etag='"v1"'), 0)
+    assert cache.get("/voices") is None
+    assert cache.get_stale("/voices")["etag"] == '"v1"'
+    assert cache.get_stale("/models") is None
+
+
+def test_revalidate_restarts_the_ttl(cache):
+    cache.set("/agents/a1", entry(etag='"v1"'), 0)
+    cache.revalidate("/agents/a1", cache.get_stale("/agents/a1"), 60)
+    assert cache.get("/agents/a1") is not None
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_invalidate_removes_the_path_and_what_is_below(cache):
+    for key in ("/agents", "/agents?limit=5", "/agents/a1", "/agents-archive"):
+        cache.set(key, entry(), 60)
+    cache.invalidate("/agents")
+    assert [key for key in ("/agents", "/agents?limit=5", "/agents/a1", "/agents-archive")
+            if cache.get_stale(key) is not None] == ["/agents-archive"]
+    assert cache.stats()["invalidations"] == 3
+
+
+def test_oldest_entries_are_evicted(cache):
+    for i in range(12):
+        cache.set(f"/voices/{i}", entry(), 60)
+    assert cache.get_stale("/voices/1") is None
+    assert cache.get_stale("/voices/11") is not None
+    assert cache.stats()["entries"] == 10
+
+
+def test_sqlite_cache_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    server.SQLiteCache(10, path=path).set("/models", entry(b'{"models": []}'), 60)
+    assert server.SQLiteCache(10, path=path).get("/models")["data"] == {"models": []}
+
+
+# ===== Contre la fausse API =====
+def test_ttl_tool_is_served_from_cache(fake_api, call_tool):
+    first = call_tool("list_models")
+    assert call_tool("list_models") == first
+    assert fake_api.request_count == 1
+
+
+def test_expired_entry_is_revalidated_with_a_304(fake_api, call_tool):
+    agent = call_tool("get_agent", agent_id="agent-002")
+    _, _, path, params, _ = server.build_request("get_agent", {"agent_id": "agent-002"})
+    key = server.cache_key(path, params)
+    server.response_cache.set(key, server.response_cache.get_stale(key), 0)  # entrée expirée
+    assert call_tool("get_agent", agent_id="agent-002") == agent
+    assert fake_api.request_count == 2
+    assert fake_api.not_modified == 1
+    assert server.response_cache.get(key) is not None  # repartie pour un ttl complet
+
+
+def test_write_invalidates_the_cached_agent(fake_api, call_tool):
+    call_tool("get_agent", agent_id="agent-003")
+    call_tool("update_agent_prompt", agent_id="agent-003", prompt="Nouveau prompt")
+    call_tool("get_agent", agent_id="agent-003")
+    assert fake_api.request_count == 3
+
+
+def open_circuit(name, arguments):
+    _, _, path, _, _ = server.build_request(name, arguments)
+    breaker = server.circuit_breakers.get(server.API_HOST, server.API_PATH + path)
+    for _ in range(breaker.threshold):
+        breaker.record(False)
+    return breaker
+
+
+@pytest.mark.parametrize("name, arguments", [
+    ("get_agent", {"agent_id": "agent-001"}),  # ttl + revalidate
+    ("list_models", {}),                       # ttl seul
+])
+def test_open_circuit_serves_the_expired_entry(fake_api, call_tool, name, arguments):
+    fresh = call_tool(name, **arguments)
+    _, _, path, params, _ = server.build_request(name, arguments)
+    key = server.cache_key(path, params)
+    server.response_cache.set(key, server.response_cache.get_stale(key), 0)
+    open_circuit(name, arguments)
+    result = call_tool(name, **arguments)
+    assert result["status_code"] == 503
+    assert result["cached"] == fresh
+    assert fake_api.request_count == 1  # refusée sans appel réseau
+
+
+def test_open_circuit_without_cache_is_an_immediate_error(fake_api, call_tool):
+    open_circuit("get_call", {"call_id": "call-00001"})
+    result = call_tool("get_call", call_id="call-00001")
+    assert result["status_code"] == 503
+    assert "cached" not in result
+    assert fake_api.request_count == 0
+
+
+def test_failures_from_the_api_open_the_circuit(fake_api, call_tool):
+    fake_api.error_rate = 1.0
+    for _ in range(3):
+        assert call_tool("list_calls", limit=1)["status_code"] == 503
+    assert server.circuit_breakers.breakers["calls"].state() == "open"
+    call_tool("list_calls", limit=1)
+    assert fake_api.request_count == 3
@@ -0,0 +1,39 @@
+"""Démarrage rapide stdio : initialize et tools/list répondus sans charger la pile réseau"""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+HEAVY_MODULES = ("fastmcp", "mcp", "httpx", "asyncio", "concurrent")
+
+
+def test_handshake_is_answered_before_heavy_imports(tmp_path):
+    # stderr dans un fichier : la sortie de -X importtime remplirait un pipe non lu
+    stderr = open(tmp_path / "importtime.txt", "w+")
+    process = subprocess.Popen([sys.executable, "-X", "importtime", os.path.join(ROOT, "server.py")],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr, text=True,
+                               env=dict(os.environ, MCP_TRANSPORT="stdio", MCP_FAST_START="true"))
+    try:
+        for message in ({"jsonrpc": "2.0", "id": 1, "method": "initialize",
+                         "params": {"protocolVersion": "2025-06-18", "capabilities": {},
+                                    "clientInfo": {"name": "test", "version": "0"}}},
+                        {"jsonrpc": "2.0", "method": "notifications/initialized"},
+                        {"jsonrpc": "2.0", "id": 2, "method": "tools/list"}):
+            process.stdin.write(json.dumps(message) + "\n")
+        process.stdin.flush()
+        initialize, tools = json.loads(process.stdout.readline()), json.loads(process.stdout.readline())
+    finally:
+        process.kill()
+        process.wait()
+    with stderr:
+        stderr.seek(0)
+        imports = stderr.read()
+    assert initialize["result"]["protocolVersion"] == "2025-06-18"
+    assert len(tools["result"]["tools"]) > 30
+    # -X importtime écrit une ligne par module, au moment de son import : ici, avant les deux réponses
+    imported = {line.rsplit("|", 1)[-1].strip() for line in imports.splitlines() if line.startswith("import time:")}
+    assert imported, imports[-500:]
+    assert sorted(name for name in imported if name.split(".")[0] in HEAVY_MODULES) == []
@@ -0,0 +1,143 @@
+"""Transport HTTP de la version stdlib : /health, /ready, lots JSON-RPC, contrôle de l'Origin et arrêt par SIGTERM"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import ROOT, server
+
+pytestmark = pytest.mark.skipif(server.USE_FASTMCP, reason="serveur HTTP de la version stdlib (MCPRequestHandler)")
+
+
+@pytest.fixture
+def base_url():
+    http_server = server.ThreadingHTTPServer(("127.0.0.1", 0), server.MCPRequestHandler)
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{http_server.server_address[1]}"
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def request(url, body=None, headers=None):
+    """(statut, corps décodé) ; POST si body est fourni"""
+    headers = dict({"Content-Type": "application/json", "Accept": "application/json"}, **(headers or {}))
+    data = body.encode() if body is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers)) as response:
+            status, raw = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, raw = e.code, e.read()
+    return status, json.loads(raw) if raw else None
+
+
+PING = '{"jsonrpc": "2.0", "id": 1, "method": "ping"}'
+
+
+# ===== /health, /ready =====
+def test_health_answers_without_calling_the_api(fake_api, base_url):
+    status, body = request(base_url + "/health")
+    assert status == 200
+    assert (body["status"], body["pid"]) == ("ok", os.getpid())
+    assert fake_api.request_count == 0
+
+
+def test_ready_is_503_while_a_circuit_is_open(fake_api, base_url):
+    assert request(base_url + "/ready")[0] == 200
+    breaker = server.circuit_breakers.breakers["calls"]
+    for _ in range(breaker.threshold):
+        breaker.record(False)
+    status, body = request(base_url + "/ready")
+    assert status == 503
+    assert (body["status"], body["circuits"]["calls"]) == ("unavailable", "open")
+
+
+def test_unknown_paths_and_methods(base_url):
+    assert request(base_url + "/nope")[0] == 404
+    assert request(base_url + server.MCP_PATH)[0] == 405  # pas de flux GET
+
+
+# ===== Lots JSON-RPC =====
+def test_batch_answers_each_request(base_url):
+    status, body = request(base_url + server.MCP_PATH, "[" + PING + ', {"jsonrpc": "2.0", "id": 2, "method": "ping"}]')
+    assert status == 200
+    assert sorted(response["id"] for response in body) == [1, 2]
+
+
+@pytest.mark.parametrize("payload", ["[]", "7"])
+def test_empty_batch_or_non_object_is_an_invalid_request(base_url, payload):
+    status, body = request(base_url + server.MCP_PATH, payload)
+    assert status == 400 if payload == "[]" else 200
+    assert body == server.INVALID_REQUEST or body == [server.INVALID_REQUEST]
+
+
+def test_batch_elements_that_are_not_objects_get_their_own_error(base_url):
+    status, body = request(base_url + server.MCP_PATH, "[1, " + PING + ', "x"]')
+    assert status == 200
+    assert [response.get("id") for response in body].count(1) == 1
+    assert body.count(server.INVALID_REQUEST) == 2
+
+
+def test_unreadable_body_is_a_parse_error(base_url):
+    status, body = request(base_url + server.MCP_PATH, "{nope")
+    assert status == 400
+    assert body["error"]["code"] == -32700
+
+
+def test_notifications_only_get_202(base_url):
+    assert request(base_url + server.MCP_PATH, '{"jsonrpc": "2.0", "method": "notifications/initialized"}') == (
+        202, None)
+
+
+# ===== Origin =====
+@pytest.mark.parametrize("origin, allowed", [
+    (None, True), ("http://localhost:6274", True), ("http://127.0.0.1", True), ("http://[::1]:3000", True),
+    ("https://evil.example", False), ("null", False), ("http://localhost.evil.example", False),
+])
+def test_origin_allowed(origin, allowed):
+    assert server.origin_allowed(origin) is allowed
+
+
+def test_listed_origin_is_allowed(monkeypatch):
+    monkeypatch.setattr(server, "MCP_ALLOWED_ORIGINS", ["https://app.example"])
+    assert server.origin_allowed("https://app.example/")
+    assert not server.origin_allowed("https://other.example")
+
+
+def test_foreign_origin_is_refused_before_dispatch(base_url):
+    status, body = request(base_url + server.MCP_PATH, PING, {"Origin": "https://evil.example"})
+    assert status == 403
+    assert body["error"]["code"] == -32000
+    assert request(base_url + server.MCP_PATH, PING, {"Origin": "http://localhost:6274"}) == (
+        200, {"jsonrpc": "2.0", "id": 1, "result": {}})
+
+
+# ===== Arrêt =====
+def test_sigterm_stops_a_single_worker_cleanly():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    env = dict(os.environ, MCP_TRANSPORT="http", MCP_HOST="127.0.0.1", MCP_PORT=str(port), MCP_WORKERS="1")
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py")], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                request(f"http://127.0.0.1:{port}/health")
+                break
+            except OSError:
+                time.sleep(0.05)
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=10) == 0
+    finally:
+        process.kill()
@@ -0,0 +1,82 @@
+"""Métriques : Metrics, vue JSON de get_server_metrics et format Prometheus de /metrics"""
+
+import pytest
+
+from conftest import server
+
+
+@pytest.fixture
+def metrics():
+    metrics = server.Metrics()
+    metrics.incr("tool_errors", ("get_call", "404"))
+    metrics.gauge_add("upstream_in_flight", "api.ultravox.ai", 2)
+    metrics.observe("tool_duration_seconds", "get_call", 0.003)
+    metrics.observe("tool_duration_seconds", "get_call", 0.2)
+    return metrics
+
+
+# ===== Metrics =====
+def test_snapshot_nests_labels_and_summarizes_latencies(metrics):
+    snapshot = metrics.snapshot()
+    assert snapshot["tool_errors"] == {"get_call": {"404": 1}}
+    assert snapshot["in_flight"] == {"upstream_in_flight": {"api.ultravox.ai": 2}}
+    assert snapshot["latency"]["tool_duration_seconds"]["get_call"] == {
+        "count": 2, "avg_ms": 101.5, "p50_ms": 5.0, "p95_ms": 200.0, "p99_ms": 200.0, "max_ms": 200.0}
+
+
+def test_prometheus_histogram_is_cumulative(metrics):
+    lines = metrics.prometheus()
+    assert "# TYPE ultravox_mcp_tool_duration_seconds histogram" in lines
+    assert 'ultravox_mcp_tool_duration_seconds_bucket{tool="get_call",le="0.005"} 1' in lines
+    assert 'ultravox_mcp_tool_duration_seconds_bucket{tool="get_call",le="0.25"} 2' in lines
+    assert 'ultravox_mcp_tool_duration_seconds_bucket{tool="get_call",le="+Inf"} 2' in lines
+    assert 'ultravox_mcp_tool_duration_seconds_count{tool="get_call"} 2' in lines
+    assert 'ultravox_mcp_tool_errors_total{tool="get_call",status="404"} 1' in lines
+    assert 'ultravox_mcp_upstream_in_flight{host="api.ultravox.ai"} 2' in lines
+
+
+def test_label_values_are_escaped():
+    assert server._prometheus_labels("retries", 'a"b\\c\nd') == '{reason="a\\"b\\\\c\\nd"}'
+
+
+def test_endpoint_labels_are_path_templates():
+    assert server.endpoint_template(server.API_HOST, server.API_PATH + "/calls/call-1/messages?cursor=2") == \
+        "/calls/{call_id}/messages"
+    assert server.endpoint_template("storage.example", "/media/call-1.wav") == "storage"
+
+
+# ===== Contre la fausse API =====
+def test_tool_calls_and_upstream_responses_are_recorded(fake_api, call_tool):
+    before = server.server_metrics.snapshot()
+    call_tool("get_call", call_id="nope")
+    after = call_tool("get_server_metrics")
+    errors = before.get("tool_errors", {}).get("get_call", {}).get("404", 0)
+    assert after["tool_errors"]["get_call"]["404"] == errors + 1
+    assert after["upstream_responses"]["/calls/{call_id}"]["404"] >= 1
+    assert after["latency"]["tool_duration_seconds"]["get_call"]["count"] >= 1
+    assert "# TYPE ultravox_mcp_tool_errors_total counter" in server.prometheus_text()
+
+
+# ===== Plusieurs workers =====
+def test_single_process_series_have_no_worker_labels():
+    assert server.worker_labels() == []
+    assert "ultravox_mcp_cache_entries " in server.prometheus_text()
+
+
+def test_each_worker_labels_its_series(monkeypatch):
+    monkeypatch.setattr(server, "WORKER_PROCESSES", 2)
+    monkeypatch.setattr(server, "WORKER_INDEX", 1)
+    metrics = server.Metrics()
+    metrics.incr("retries", "503")
+    metrics.observe("tool_duration_seconds", "get_call", 0.02)
+    lines = metrics.prometheus(labels=server.worker_labels())
+    pid = server.os.getpid()
+    assert f'ultravox_mcp_retries_total{{reason="503",worker="1",pid="{pid}"}} 1' in lines
+    assert f'ultravox_mcp_tool_duration_seconds_bucket{{tool="get_call",worker="1",pid="{pid}",le="0.025"}} 1' in lines
+    text = server.prometheus_text()
+    assert f'ultravox_mcp_uptime_seconds{{worker="1",pid="{pid}"}}' in text
+    assert f'ultravox_mcp_circuit_state{{family="calls",worker="1",pid="{pid}"}}' in text
+
+
+def test_metrics_report_says_which_worker_answered():
+    assert server.server_metrics_report()["worker"] == {"index": 0, "pid": server.os.getpid(), "workers": 1}
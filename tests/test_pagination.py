@@ -0,0 +1,145 @@
+"""Pagination : first_page_params, with_page_limit, PageCollector et flux de pages en notifications"""
+
+import json
+
+import pytest
+
+from conftest import LOOP, server
+
+
+def page(start, count, next_url=None, total=None):
+    return {"results": [{"callId": f"call-{i}"} for i in range(start, start + count)],
+            "next": next_url, "total": total}
+
+
+def test_first_page_never_larger_than_max_items():
+    assert server.first_page_params({"limit": 100}, {"max_items": 7}) == {"limit": 7}
+    assert server.first_page_params({"limit": 5}, {"max_items": 7}) == {"limit": 5}
+    assert server.first_page_params({"limit": 100}, {}) == {"limit": 100}
+
+
+def test_first_page_params_does_not_modify_params():
+    params = {"limit": 100}
+    server.first_page_params(params, {"max_items": 3})
+    assert params == {"limit": 100}
+
+
+def test_collector_follows_next_until_last_page():
+    collector = server.PageCollector()
+    assert collector.add(page(0, 3, "http://api/calls?cursor=3", total=5)) == "http://api/calls?cursor=3"
+    assert collector.add(page(3, 2)) is None
+    result = collector.result()
+    assert [call["callId"] for call in result["results"]] == [f"call-{i}" for i in range(5)]
+    assert (result["count"], result["pages"], result["total"], result["next"]) == (5, 2, 5, None)
+
+
+def test_collector_stops_at_max_items():
+    collector = server.PageCollector(max_items=4)
+    assert collector.add(page(0, 3, "http://api/calls?cursor=3")) == "http://api/calls?cursor=3"
+    # Page tronquée : son curseur sauterait les éléments écartés, il n'est pas renvoyé
+    assert collector.add(page(3, 3, "http://api/calls?cursor=6")) is None
+    assert collector.count == 4
+    assert collector.result()["next"] is None
+    assert not collector.wants_more()
+
+
+def test_collector_keeps_next_when_max_items_ends_on_a_page_boundary():
+    collector = server.PageCollector(max_items=3)
+    assert collector.add(page(0, 3, "http://api/calls?cursor=3")) is None
+    assert collector.result()["next"] == "http://api/calls?cursor=3"
+
+
+def test_resized_collector_asks_for_the_remaining_items_only():
+    collector = server.PageCollector(max_items=5, resize=True)
+    assert collector.add(page(0, 3, "http://api/calls?cursor=3&limit=3")) == "http://api/calls?cursor=3&limit=2"
+    assert collector.add(page(3, 2, "http://api/calls?cursor=5&limit=2")) is None
+    assert collector.result()["next"] == "http://api/calls?cursor=5&limit=2"  # curseur toujours valable
+
+
+def test_with_page_limit_never_enlarges_a_page():
+    assert server.with_page_limit("http://api/calls?cursor=3&limit=100", 7) == "http://api/calls?cursor=3&limit=7"
+    assert server.with_page_limit("http://api/calls?limit=5&cursor=3", 7) == "http://api/calls?limit=5&cursor=3"
+    assert server.with_page_limit("http://api/calls?cursor=3", 7) == "http://api/calls?cursor=3&limit=7"
+
+
+def test_collector_without_keep_only_counts():
+    collector = server.PageCollector(keep=False)
+    collector.add(page(0, 2, "http://api/calls?cursor=2"))
+    assert [call["callId"] for call in collector.page] == ["call-0", "call-1"]
+    collector.add(page(2, 1))
+    assert collector.result() == {"count": 3, "pages": 2, "total": None, "next": None}
+
+
+def test_collector_result_keeps_pages_read_before_an_error():
+    collector = server.PageCollector()
+    collector.add(page(0, 2, "http://api/calls?cursor=2"))
+    result = collector.result(error=server.UpstreamError(503))
+    assert result["count"] == 2
+    assert result["error"] == "Erreur (503)"
+    assert result["status_code"] == 503
+
+
+def test_page_helpers_accept_lists_and_objects():
+    assert server.page_items([{"a": 1}]) == [{"a": 1}]
+    assert server.page_items({"results": None}) == []
+    assert server.page_items("nope") == []
+    assert server.page_next([]) is None
+
+
+# ===== Flux de pages (list_deleted_calls_stream) =====
+@pytest.fixture
+def stream_tool():
+    """stream_tool(name, progress, **arguments) -> (résultat, pages reçues en notifications)"""
+    if server.USE_FASTMCP:
+        from fastmcp import Client
+
+        async def run(name, progress, arguments):
+            pages = []
+
+            async def on_progress(progress, total, message):
+                pages.append(json.loads(message))
+
+            async def on_log(message):
+                pages.append(json.loads(message.data["msg"]))
+
+            async with Client(server.mcp, log_handler=on_log) as client:
+                if progress:
+                    result = await client.call_tool(name, arguments, progress_handler=on_progress)
+                else:
+                    # Client.call_tool fournit toujours un progressToken : session MCP brute
+                    result = await client.session.call_tool(name, arguments)
+            return json.loads(result.content[0].text), pages
+
+        return lambda name, progress, **arguments: LOOP.run_until_complete(run(name, progress, arguments))
+
+    def call(name, progress, **arguments):
+        params = {"name": name, "arguments": arguments}
+        if progress:
+            params["_meta"] = {"progressToken": "pages"}
+        lines, notifications = [], []
+        server.call_tool({"jsonrpc": "2.0", "id": 1, "params": params}, lines.append, notifications.append)
+        pages = []
+        for notification in map(json.loads, notifications):
+            if notification["method"] == "notifications/progress":
+                assert notification["params"]["progressToken"] == "pages"
+                pages.append(json.loads(notification["params"]["message"]))
+            else:
+                pages.append(json.loads(notification["params"]["data"]["msg"]))
+        return json.loads(json.loads(lines[-1])["result"]["content"][0]["text"]), pages
+
+    return call
+
+
+@pytest.mark.parametrize("progress", [True, False], ids=["progress", "log"])
+def test_each_page_is_sent_as_a_notification(fake_api, stream_tool, progress):
+    result, pages = stream_tool("list_deleted_calls_stream", progress, limit=10)
+    assert [len(page) for page in pages] == [10, 10, 10]
+    assert [call["callId"] for page in pages for call in page] == [f"deleted-{i:05d}" for i in range(30)]
+    assert result == {"count": 30, "pages": 3, "total": 30, "next": None}  # rien n'est accumulé
+
+
+def test_stream_stops_at_max_items(fake_api, stream_tool):
+    result, pages = stream_tool("list_deleted_calls_stream", True, limit=10, max_items=15)
+    assert [len(page) for page in pages] == [10, 5]
+    assert result["count"] == 15
+    assert fake_api.request_count == 2
@@ -0,0 +1,33 @@
+"""Enregistrements : download_call_recording (taille de bloc, fichier .part)"""
+
+import os
+
+import pytest
+
+from conftest import server
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, 65536), (0, 65536), (-1, 65536), (1, 4096), (65536, 65536), (1 << 30, 4 * 1024 * 1024),
+])
+def test_chunk_size_is_clamped(value, expected):
+    assert server.download_chunk_size(value) == expected
+
+
+# ===== Contre la fausse API =====
+@pytest.mark.parametrize("chunk_size", [0, -5, 1, 1 << 30])
+def test_download_with_any_chunk_size(fake_api, call_tool, chunk_size):
+    result = call_tool("download_call_recording", call_id="call-00003", filename="chunks.wav", chunk_size=chunk_size)
+    assert result["success"] is True
+    assert result["bytes"] == fake_api.recording_bytes == os.path.getsize(result["path"])
+
+
+def test_failed_download_leaves_no_part_file(fake_api, call_tool, monkeypatch):
+    def disk_full(source, target):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(server.os, "replace", disk_full)
+    result = call_tool("download_call_recording", call_id="call-00004", filename="failed.wav")
+    assert "No space left" in result["error"]
+    path = os.path.join(server.RECORDINGS_DIR, "failed.wav")
+    assert not os.path.exists(path + ".part") and not os.path.exists(path)
@@ -0,0 +1,93 @@
+"""Registre des tools : arguments validés et convertis selon l'input_schema, dans les deux versions"""
+
+import os
+import re
+
+import pytest
+
+from conftest import ROOT, server
+
+
+@pytest.mark.parametrize("schema, value, expected", [
+    ({"type": "integer"}, "3", 3),
+    ({"type": "integer"}, 3.0, 3),
+    ({"type": "boolean"}, "false", False),
+    ({"type": "boolean"}, "Yes", True),
+    ({"type": "boolean"}, 0, False),
+    ({"type": "array"}, "call-1, call-2", ["call-1", "call-2"]),
+    ({"type": "array"}, ("a",), ["a"]),
+    ({"type": "string"}, "abc", "abc"),
+    ({}, {"any": "thing"}, {"any": "thing"}),
+    ({"type": "integer"}, None, None),
+])
+def test_arguments_are_coerced_to_their_declared_type(schema, value, expected):
+    assert server.coerce_argument("x", schema, value) == expected
+
+
+@pytest.mark.parametrize("schema, value", [
+    ({"type": "integer"}, "abc"),
+    ({"type": "integer"}, True),
+    ({"type": "integer"}, 2.5),
+    ({"type": "boolean"}, "maybe"),
+    ({"type": "boolean"}, 2),
+    ({"type": "string"}, 42),
+    ({"type": "array"}, [1, 2]),
+    ({"type": "array"}, {"id": "a"}),
+])
+def test_incompatible_arguments_are_rejected(schema, value):
+    with pytest.raises(server.InvalidArguments):
+        server.coerce_argument("x", schema, value)
+
+
+def test_tool_values_fills_defaults_and_coerces():
+    values = server.tool_values("list_calls", {"limit": "5", "all_pages": "false"})
+    assert (values["limit"], values["all_pages"], values["max_items"]) == (5, False, None)
+
+
+def test_missing_required_argument():
+    with pytest.raises(server.InvalidArguments, match="call_id"):
+        server.tool_values("get_call", {"call_id": ""})
+
+
+def test_optional_arguments_do_not_declare_a_null_default():
+    for spec in server.TOOLS.values():
+        for arg_name, schema in spec["input_schema"]["properties"].items():
+            assert schema.get("default", "") is not None, arg_name
+
+
+def test_readme_lists_every_tool_and_their_number():
+    with open(os.path.join(ROOT, "README.md"), encoding="utf-8") as f:
+        readme = f.read()
+    assert set(re.findall(r"^- `(\w+)` - ", readme, re.M)) == set(server.TOOLS)
+    assert set(re.findall(r"(\d+) (?:outils|Outils)", readme)) == {str(len(server.TOOLS))}
+
+
+# ===== Contre la fausse API =====
+def test_invalid_argument_is_answered_before_any_request(fake_api, call_tool):
+    result = call_tool("list_calls", limit="abc")
+    assert result["status_code"] == 400
+    assert "limit" in result["error"]
+    assert fake_api.request_count == 0
+
+
+def test_invalid_shape_argument_is_answered_before_any_request(fake_api, call_tool):
+    assert call_tool("list_calls", max_bytes="beaucoup")["status_code"] == 400
+    assert fake_api.request_count == 0
+
+
+def test_string_false_does_not_walk_every_page(fake_api, call_tool):
+    result = call_tool("list_calls", limit=5, all_pages="false")
+    assert len(result["results"]) == 5
+    assert fake_api.request_count == 1
+
+
+def test_string_max_items_is_an_integer(fake_api, call_tool):
+    result = call_tool("list_calls", limit=2, max_items="3")
+    assert result["count"] == 3
+    assert [call["callId"] for call in result["results"]] == ["call-00000", "call-00001", "call-00002"]
+
+
+def test_string_no_does_not_probe(fake_api, call_tool):
+    result = call_tool("get_call_recording", call_id="call-00001", probe="no")
+    assert "size" not in result
+    assert call_tool("get_call_recording", call_id="call-00001", probe="yes")["size"] > 0
@@ -0,0 +1,195 @@
+"""Reprises (RetryPolicy, Retry-After), limite de débit (TokenBucket), disjoncteur (CircuitBreaker)
+et regroupement des requêtes identiques (SingleFlight)"""
+
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+from conftest import LOOP, server
+
+
+# ===== Retry-After =====
+def test_retry_after_in_seconds():
+    assert server.retry_after_seconds({"Retry-After": "2.5"}) == 2.5
+    assert server.retry_after_seconds({"Retry-After": "-3"}) == 0.0
+
+
+def test_retry_after_as_http_date():
+    delay = server.retry_after_seconds({"Retry-After": formatdate(time.time() + 30, usegmt=True)})
+    assert 25 <= delay <= 30
+    assert server.retry_after_seconds({"Retry-After": formatdate(time.time() - 30, usegmt=True)}) == 0.0
+
+
+@pytest.mark.parametrize("headers", [None, {}, {"Retry-After": ""}, {"Retry-After": "bientôt"}])
+def test_retry_after_missing_or_unreadable(headers):
+    assert server.retry_after_seconds(headers) is None
+
+
+# ===== RetryPolicy =====
+def policy(**kwargs):
+    options = dict(retries=3, backoff=0.5, max_delay=8.0, max_time=30.0, methods="GET,DELETE")
+    options.update(kwargs)
+    return server.RetryPolicy(**options)
+
+
+def test_no_retry_for_success_or_client_errors():
+    started = time.monotonic()
+    assert policy().next_delay("GET", 0, started, status=200) is None
+    assert policy().next_delay("GET", 0, started, status=404) is None
+
+
+def test_no_retry_for_non_idempotent_methods():
+    assert policy().next_delay("POST", 0, time.monotonic(), status=503) is None
+
+
+def test_retry_after_header_wins_over_backoff():
+    assert policy().next_delay("GET", 0, time.monotonic(), status=429, headers={"Retry-After": "2"}) == 2.0
+
+
+def test_backoff_is_bounded_by_exponential_and_max_delay():
+    started = time.monotonic()
+    for attempt in range(3):
+        delay = policy().next_delay("get", attempt, started, status=503)
+        assert 0 <= delay <= min(8.0, 0.5 * 2 ** attempt)
+    assert policy(retries=10, max_delay=1.0).next_delay("GET", 9, started, status=503) <= 1.0
+
+
+def test_transport_errors_are_retried():
+    assert policy().next_delay("DELETE", 0, time.monotonic(), error=ConnectionResetError()) is not None
+
+
+def test_gives_up_after_retries_or_time_budget():
+    started = time.monotonic()
+    assert policy().next_delay("GET", 3, started, status=503) is None
+    assert policy(max_time=1.0).next_delay("GET", 0, started, status=503, headers={"Retry-After": "5"}) is None
+
+
+# ===== TokenBucket =====
+def test_bucket_serves_burst_then_queues():
+    bucket = server.TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.02)
+
+
+def test_bucket_refills_over_time():
+    bucket = server.TokenBucket(rate=10, burst=1)
+    bucket.reserve()
+    bucket.updated -= 1.0  # une seconde plus tard
+    assert bucket.reserve() == 0.0
+
+
+def test_bucket_disabled_when_rate_is_zero():
+    bucket = server.TokenBucket(rate=0)
+    assert [bucket.reserve() for _ in range(100)] == [0.0] * 100
+
+
+def test_rate_limits_are_split_between_workers():
+    limiter = server.RateLimiter(rate=20, families={"calls": 10}, burst=4, workers=4)
+    assert limiter.describe() == {"global": 5.0, "calls": 2.5}
+    assert limiter.bucket.capacity == 1.0
+
+
+def test_single_worker_keeps_the_configured_rate():
+    assert server.RateLimiter(rate=20, families={}, workers=1).bucket.capacity == 20
+
+
+# ===== CircuitBreaker =====
+def test_breaker_opens_after_threshold_consecutive_failures():
+    breaker = server.CircuitBreaker("calls", threshold=3, cooldown=30)
+    for _ in range(2):
+        breaker.before()
+        breaker.record(False)
+    assert breaker.state() == "closed"
+    breaker.record(True)  # un succès remet le compte à zéro
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state() == "open"
+    with pytest.raises(server.CircuitOpenError) as raised:
+        breaker.before()
+    assert raised.value.family == "calls"
+    assert raised.value.status_code == 503
+
+
+def test_breaker_lets_one_probe_through_after_cooldown():
+    breaker = server.CircuitBreaker("agents", threshold=1, cooldown=30)
+    breaker.record(False)
+    breaker.opened_at -= 31
+    assert breaker.state() == "half_open"
+    breaker.before()  # requête d'essai
+    with pytest.raises(server.CircuitOpenError):
+        breaker.before()  # une seule à la fois
+    breaker.record(True)
+    assert breaker.state() == "closed"
+    breaker.before()
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = server.CircuitBreaker("webhooks", threshold=1, cooldown=30)
+    breaker.record(False)
+    breaker.opened_at -= 31
+    breaker.before()
+    breaker.record(False)
+    assert breaker.state() == "open"
+
+
+def test_abandoned_probe_releases_the_slot():
+    breaker = server.CircuitBreaker("calls", threshold=1, cooldown=30)
+    breaker.record(False)
+    breaker.opened_at -= 31
+    breaker.before()
+    breaker.record(None)  # annulation : ni succès ni échec
+    assert breaker.state() == "half_open"
+    breaker.before()
+
+
+# ===== SingleFlight =====
+def test_concurrent_identical_calls_share_one_execution():
+    flight, started, release = server.SingleFlight(), threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"ok": True}
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", fetch)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", fetch))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)  # les suivants attendent le résultat du premier
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert len(calls) == 1
+    assert results == [{"ok": True}] * 5
+
+
+def test_leader_error_reaches_every_caller_and_the_key_is_released():
+    flight = server.SingleFlight()
+    with pytest.raises(ConnectionResetError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ConnectionResetError()))
+    assert flight.do("k", lambda: "again") == "again"
+
+
+@pytest.mark.skipif(not server.USE_FASTMCP, reason="AsyncSingleFlight : version FastMCP")
+def test_async_identical_calls_share_one_task():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await server.asyncio.sleep(0.01)
+        return "page"
+
+    async def run():
+        flight = server.AsyncSingleFlight()
+        return await server.asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+
+    assert LOOP.run_until_complete(run()) == ["page"] * 5
+    assert len(calls) == 1
@@ -0,0 +1,144 @@
+"""Arguments fields / max_bytes : parse_fields, project, _Fit et shape_result ; corps de l'API transmis tel quel"""
+
+import json
+from urllib.request import urlopen
+
+import pytest
+
+from conftest import API_BASE, server
+
+CALLS = {
+    "next": "https://api.ultravox.ai/api/calls?cursor=abc",
+    "total": 100,
+    "results": [{"callId": f"call-{i:05d}", "agentId": "agent-001", "endReason": "hangup",
+                 "shortSummary": "Appel de test"} for i in range(100)],
+}
+
+
+def size(value):
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def test_fields_keep_only_the_listed_paths():
+    shaped = server.shape_result(CALLS, fields="results.callId, next")
+    assert set(shaped) == {"results", "next"}
+    assert shaped["results"][0] == {"callId": "call-00000"}
+
+
+def test_fields_with_indexes():
+    shaped = server.shape_result(CALLS, fields="results[1].agentId,results[0],missing")
+    assert shaped == {"results": [CALLS["results"][0], {"agentId": "agent-001"}]}
+
+
+def test_max_bytes_keeps_whole_leading_items():
+    shaped = server.shape_result(CALLS, max_bytes=600)
+    kept = [item for item in shaped["results"] if isinstance(item, dict)]
+    assert kept == CALLS["results"][:len(kept)]
+    assert shaped["results"][-1] == f"… {100 - len(kept)} more items"
+    assert shaped["next"] == CALLS["next"] and shaped["total"] == 100
+    assert shaped["_truncated"] == {"max_bytes": 600, "omitted_items": 100 - len(kept), "cut_strings": 0}
+    assert size(shaped) <= 600
+
+
+def test_small_budget_drops_items_instead_of_emptying_strings():
+    timestamps = {key: "2025-10-09T08:53:20Z" for key in ("created", "joined", "ended")}
+    calls = dict(CALLS, results=[dict(call, **timestamps) for call in CALLS["results"]])
+    shaped = server.shape_result(calls, max_bytes=300)
+    assert shaped["results"] == ["… 100 more items"]
+    assert shaped["_truncated"]["omitted_items"] == 100
+    assert shaped["_truncated"]["cut_strings"] == 0
+    assert size(shaped) <= 300
+
+
+def test_kept_items_are_whole_at_any_budget():
+    for max_bytes in range(256, 1200, 37):
+        shaped = server.shape_result(CALLS, max_bytes=max_bytes)
+        assert [item for item in shaped["results"] if isinstance(item, dict)] == \
+            CALLS["results"][:len(shaped["results"]) - 1]
+        assert size(shaped) <= max_bytes
+
+
+def test_single_oversized_item_has_its_long_string_cut():
+    transcript = {"results": [{"role": "AGENT", "text": "x" * 5000}, {"role": "USER", "text": "ok"}]}
+    shaped = server.shape_result(transcript, max_bytes=500)
+    text = shaped["results"][0]["text"]
+    assert text.startswith("xxx") and text.endswith("more chars]")
+    assert shaped["_truncated"]["cut_strings"] == 1
+    assert size(shaped) <= 500
+
+
+def test_nested_lists_are_omitted_when_scalars_use_the_budget():
+    value = {"summary": "y" * 150, "messages": [{"text": "z" * 50}] * 10}
+    shaped = server.shape_result(value, max_bytes=256)
+    assert shaped["messages"] == "… omitted" or shaped["messages"][-1].endswith("more items")
+
+
+def test_raw_body_that_fits_is_passed_through():
+    raw = server.RawJSON(b'{"callId": "call-00001"}')
+    assert server.shape_result(raw, max_bytes=1000) is raw
+    assert server.shape_result(raw, fields="callId") == {"callId": "call-00001"}
+
+
+def test_errors_are_never_shaped():
+    error = {"error": "Erreur (404)", "status_code": 404}
+    assert server.shape_result(error, fields="callId", max_bytes=256) == error
+
+
+def test_max_bytes_has_a_minimum():
+    assert server.shape_result(CALLS, max_bytes=10)["_truncated"]["max_bytes"] == server.SHAPE_MIN_BYTES
+
+
+def test_shaping_through_a_tool_call(fake_api, call_tool):
+    result = call_tool("list_calls", limit=20, fields="results.callId,next")
+    assert set(result) == {"results", "next"}
+    assert len(result["results"]) == 20 and set(result["results"][0]) == {"callId"}
+    result = call_tool("list_calls", limit=20, max_bytes=300)
+    assert result["_truncated"]["omitted_items"] == 20
+
+
+@pytest.fixture(params=["default", "stdlib"])
+def json_backend(request, monkeypatch):
+    """Encodeur choisi à l'import (orjson s'il est installé), puis celui de ULTRAVOX_JSON=stdlib"""
+    if request.param == "stdlib":
+        monkeypatch.setattr(server, "json_dumps", server._stdlib_dumps)
+        monkeypatch.setattr(server, "json_loads", json.loads)
+    return request.param
+
+
+@pytest.mark.parametrize("name, arguments", [
+    ("list_calls", {"limit": 20}),
+    ("get_call_messages", {"call_id": "call-00001"}),
+    ("get_call_bundle", {"call_ids": ["call-00001", "call-00002"]}),
+])
+@pytest.mark.parametrize("max_bytes", [300, 600, 1000, 2000])
+def test_returned_text_stays_under_max_bytes(fake_api, tool_text, json_backend, name, arguments, max_bytes):
+    text = tool_text(name, max_bytes=max_bytes, **arguments)
+    assert len(text.encode("utf-8")) <= max_bytes
+
+
+# ===== Corps de l'API transmis tel quel (JSON_PASSTHROUGH) =====
+def api_body(path):
+    with urlopen(API_BASE + path) as response:
+        return response.read().decode("utf-8")
+
+
+@pytest.mark.parametrize("arguments", [{}, {"max_bytes": 100000}])
+def test_untransformed_body_is_returned_byte_for_byte(fake_api, tool_text, arguments):
+    assert tool_text("get_call", call_id="call-00001", **arguments) == api_body("/calls/call-00001")
+
+
+def test_cached_body_is_returned_byte_for_byte(fake_api, tool_text):
+    first = tool_text("list_models")
+    assert tool_text("list_models") == first == api_body("/models")
+    assert fake_api.request_count == 2  # le second tools/call est servi par le cache
+
+
+def test_transformed_or_projected_results_are_reencoded(fake_api, call_tool):
+    assert call_tool("get_call", call_id="call-00001", fields="callId") == {"callId": "call-00001"}
+
+
+def test_without_passthrough_the_result_is_the_same_json(fake_api, tool_text, monkeypatch):
+    raw = tool_text("get_call", call_id="call-00002")
+    monkeypatch.setattr(server, "JSON_PASSTHROUGH", False)
+    text = tool_text("get_call", call_id="call-00002")
+    assert json.loads(text) == json.loads(raw)
@@ -0,0 +1,62 @@
+"""Transport stdio de la version stdlib : tools/call concurrents, réponses corrélées par id"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import ROOT, server
+
+pytestmark = pytest.mark.skipif(server.USE_FASTMCP, reason="boucle stdio de la version stdlib (dispatch, call_tool)")
+
+
+def tool_call(request_id, name, **arguments):
+    return {"jsonrpc": "2.0", "id": request_id, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+
+
+def test_fast_call_is_answered_while_a_slow_one_runs(fake_api, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setitem(server.HANDLERS, "get_call_bundle", lambda arguments: {"slow": release.wait(5)})
+    lines, executor = [], ThreadPoolExecutor(max_workers=4)
+
+    def run_tool(request):
+        executor.submit(server.call_tool, request, lines.append, lambda line: None)
+
+    server.dispatch(tool_call("slow", "get_call_bundle", call_ids=["call-00001"]), lines.append, run_tool)
+    server.dispatch(tool_call(7, "get_call", call_id="call-00007", fields="callId"), lines.append, run_tool)
+    for _ in range(500):
+        if lines:
+            break
+        time.sleep(0.01)
+    release.set()
+    executor.shutdown(wait=True)
+    responses = [json.loads(line) for line in lines]
+    assert [response["id"] for response in responses] == [7, "slow"]
+    assert json.loads(responses[0]["result"]["content"][0]["text"]) == {"callId": "call-00007"}
+
+
+def test_notifications_get_no_response_and_unknown_methods_an_error():
+    lines = []
+    server.dispatch({"jsonrpc": "2.0", "method": "notifications/initialized"}, lines.append, None)
+    server.dispatch({"jsonrpc": "2.0", "id": 3, "method": "resources/unknown"}, lines.append, None)
+    server.dispatch({"jsonrpc": "2.0", "id": 4, "method": "ping"}, lines.append, None)
+    assert [json.loads(line) for line in lines] == [
+        {"jsonrpc": "2.0", "id": 3, "error": {"code": -32601, "message": "Method not found"}},
+        {"jsonrpc": "2.0", "id": 4, "result": {}},
+    ]
+
+
+def test_pipelined_calls_each_get_their_own_response(fake_api):
+    requests = [tool_call(i, "get_call", call_id=f"call-{i:05d}", fields="callId") for i in range(12)]
+    stdin = "".join(json.dumps(request) + "\n" for request in requests)
+    output = subprocess.run([sys.executable, os.path.join(ROOT, "server.py")], input=stdin,
+                            capture_output=True, text=True, timeout=30).stdout
+    responses = {response["id"]: response for response in map(json.loads, output.splitlines())}
+    assert sorted(responses) == list(range(12))
+    for request_id, response in responses.items():
+        assert json.loads(response["result"]["content"][0]["text"]) == {"callId": f"call-{request_id:05d}"}